@@ -1,7 +1,9 @@
 # Render deployment entry point
-# This file imports the Flask app from source.py for Render compatibility
+# This file builds the Flask app from source.py for Render compatibility
 
-from source import app
+from source import create_app
+
+app = create_app()
 
 if __name__ == "__main__":
     app.run()
@@ -0,0 +1,283 @@
+"""
+ASGI entry point for serving Vozila from an asyncio event loop
+
+The I/O-bound endpoints (progress polling and streaming, file serving and
+info lookups) are handled natively here, so idle or slow clients only cost a
+coroutine instead of a server thread. Blocking work (yt-dlp extraction, disk
+reads, zipping playlists) is awaited on a thread pool off the event loop.
+Every other route falls through to the regular Flask app.
+
+Run with:
+    uvicorn asgi:application --host 0.0.0.0 --port $PORT
+"""
+
+import asyncio
+import json
+import mimetypes
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+from a2wsgi import WSGIMiddleware
+
+import source
+import tracing
+
+# Threads for blocking work awaited by the async handlers
+ASGI_EXECUTOR_WORKERS = int(os.getenv('ASGI_EXECUTOR_WORKERS', 8))
+# Threads for requests that fall through to Flask
+ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 10))
+# How often the progress stream checks for changes (seconds)
+PROGRESS_STREAM_INTERVAL = float(os.getenv('PROGRESS_STREAM_INTERVAL', 0.5))
+# Comment line sent on idle progress streams so proxies keep them open
+PROGRESS_STREAM_KEEPALIVE = 15
+FILE_CHUNK_SIZE = 256 * 1024
+
+app = source.create_app()
+executor = ThreadPoolExecutor(max_workers=ASGI_EXECUTOR_WORKERS, thread_name_prefix='asgi-io')
+wsgi_app = WSGIMiddleware(app, workers=ASGI_WSGI_WORKERS)
+
+PROGRESS_RE = re.compile(r'^/api/progress/([^/]+)$')
+PROGRESS_STREAM_RE = re.compile(r'^/api/progress/([^/]+)/stream$')
+DOWNLOAD_FILE_RE = re.compile(r'^/api/download/([^/]+)$')
+
+
+async def run_blocking(func, *args):
+    """Await a blocking call on the I/O thread pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(executor, func, *args)
+
+
+async def read_body(receive):
+    """Read the full request body"""
+    body = b''
+    more_body = True
+    while more_body:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        body += message.get('body', b'')
+        more_body = message.get('more_body', False)
+    return body
+
+
+async def send_json(send, payload, status=200):
+    """Send a complete JSON response"""
+    body = json.dumps(payload).encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+        ],
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def _info_sync(url):
+    """Cached info lookup; runs on the executor inside an app context"""
+    with app.app_context():
+        return source.lookup_info(url)
+
+
+async def handle_info(scope, receive, send):
+    """POST /api/info without tying up a server thread during extraction"""
+    body = await read_body(receive)
+    if body is None:
+        return
+    try:
+        data = json.loads(body or b'{}')
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        await send_json(send, {'error': 'Invalid JSON body'}, 400)
+        return
+    url = (data.get('url') or '').strip()
+
+    if not url:
+        await send_json(send, {'error': 'URL is required'}, 400)
+        return
+
+    error = source.url_error(url)
+    if error:
+        await send_json(send, {'error': error}, 400)
+        return
+
+    failure = source.negative_cache.lookup(source.cache, url)
+    if failure:
+        await send_json(send, failure, 400)
+        return
+
+    try:
+        result = await run_blocking(_info_sync, url)
+    except Exception as e:
+        await send_json(send, {'error': str(e)}, 500)
+        return
+
+    if not result:
+        await send_json(send, {'error': 'Failed to get video information'}, 400)
+        return
+    await send_json(send, result)
+
+
+async def handle_progress(download_id, send):
+    """GET /api/progress/<id>: a plain in-memory read, no thread needed"""
+    progress = source.download_progress.get(download_id)
+    if progress is None:
+        await send_json(send, {'error': 'Download not found'}, 404)
+        return
+    await send_json(send, source.progress_payload(progress))
+
+
+async def handle_progress_stream(download_id, receive, send):
+    """GET /api/progress/<id>/stream: push progress as server-sent events"""
+    if download_id not in source.download_progress:
+        await send_json(send, {'error': 'Download not found'}, 404)
+        return
+
+    await send({
+        'type': 'http.response.start',
+        'status': 200,
+        'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            (b'x-accel-buffering', b'no'),
+        ],
+    })
+
+    disconnected = asyncio.ensure_future(_wait_for_disconnect(receive))
+    last_payload = None
+    idle = 0.0
+    try:
+        while not disconnected.done():
+            progress = source.download_progress.get(download_id)
+            if progress is None:
+                break
+            payload = source.progress_payload(progress)
+            if payload != last_payload:
+                data = f"data: {json.dumps(payload)}\n\n".encode('utf-8')
+                await send({'type': 'http.response.body', 'body': data, 'more_body': True})
+                last_payload = payload
+                idle = 0.0
+                if payload['status'] in ('completed', 'error'):
+                    break
+            elif idle >= PROGRESS_STREAM_KEEPALIVE:
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+                idle = 0.0
+            await asyncio.wait({disconnected}, timeout=PROGRESS_STREAM_INTERVAL)
+            idle += PROGRESS_STREAM_INTERVAL
+        if not disconnected.done():
+            await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+
+
+async def _wait_for_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+async def handle_download_file(download_id, send):
+    """GET /api/download/<id>: stream the file in chunks read off-loop"""
+    if download_id not in source.download_files:
+        await send_json(send, {'error': 'Download not found or not completed'}, 404)
+        return
+
+    trace = tracing.get(download_id)
+    serve_span = trace.start_span('serve') if trace else None
+
+    # Zipping a playlist can take a while, keep it off the loop too
+    prepared = await run_blocking(source.prepare_download_file, download_id)
+    if not prepared:
+        if serve_span:
+            serve_span.finish(error='Files not found')
+        await send_json(send, {'error': 'Files not found'}, 404)
+        return
+    file_path, download_name = prepared
+
+    try:
+        handle = await run_blocking(open, file_path, 'rb')
+    except OSError:
+        if serve_span:
+            serve_span.finish(error='Files not found')
+        await send_json(send, {'error': 'Files not found'}, 404)
+        return
+
+    size = 0
+    try:
+        size = os.fstat(handle.fileno()).st_size
+        content_type = mimetypes.guess_type(download_name)[0] or 'application/octet-stream'
+        disposition = f"attachment; filename*=UTF-8''{quote(download_name)}"
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', content_type.encode()),
+                (b'content-length', str(size).encode()),
+                (b'content-disposition', disposition.encode('latin-1')),
+            ],
+        })
+        while True:
+            chunk = await run_blocking(handle.read, FILE_CHUNK_SIZE)
+            more_body = len(chunk) == FILE_CHUNK_SIZE
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': more_body})
+            if not more_body:
+                break
+    except BaseException as e:
+        # Client went away mid-transfer
+        if serve_span:
+            serve_span.finish(error=f'Transfer aborted: {type(e).__name__}')
+        raise
+    finally:
+        await run_blocking(handle.close)
+        if serve_span:
+            serve_span.set(file=download_name, bytes=size)
+            serve_span.finish()
+            tracing.export(trace)
+
+
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            executor.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    """ASGI application: async fast paths, everything else goes to Flask"""
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+        return
+
+    if scope['type'] == 'http':
+        method = scope['method']
+        path = scope['path']
+
+        # Profiled info requests (?profile=...) are handled by Flask
+        if method == 'POST' and path == '/api/info' and b'profile=' not in scope.get('query_string', b''):
+            await handle_info(scope, receive, send)
+            return
+
+        if method == 'GET':
+            match = PROGRESS_STREAM_RE.match(path)
+            if match:
+                await handle_progress_stream(match.group(1), receive, send)
+                return
+            match = PROGRESS_RE.match(path)
+            if match:
+                await handle_progress(match.group(1), send)
+                return
+            match = DOWNLOAD_FILE_RE.match(path)
+            if match:
+                await handle_download_file(match.group(1), send)
+                return
+
+    await wsgi_app(scope, receive, send)
@@ -0,0 +1,217 @@
+"""
+Bandwidth shaping and fair sharing across concurrent download jobs
+
+yt-dlp's ``ratelimit`` is fixed per YoutubeDL instance (and pooled instances
+are shared), so rates are enforced here instead: every active job has a token
+bucket refilled at its current allocation, and the job's progress hook sleeps
+whenever the job gets ahead of it. While the hook sleeps the download loop
+stops reading the socket, so TCP flow control slows the sender down.
+
+BANDWIDTH_TOTAL_LIMIT is split across active jobs by weight (max-min fair
+share): a job is never given more than BANDWIDTH_JOB_LIMIT or much more than
+it has recently managed to use, and what it leaves over goes to the others.
+Audio jobs and small jobs (first stream under BANDWIDTH_SMALL_JOB_BYTES) get
+BANDWIDTH_PRIORITY_WEIGHT times the share of a normal job, so a 360p clip
+doesn't crawl while a 4K download is running. Allocations are recomputed when
+jobs start, finish or change priority, and about once a second while they run.
+
+With both limits at 0 (the default) nothing is shaped.
+"""
+
+import os
+import threading
+import time
+
+import metrics
+
+BANDWIDTH_TOTAL_LIMIT = float(os.getenv('BANDWIDTH_TOTAL_LIMIT', 0))      # bytes/sec for all jobs, 0 = unlimited
+BANDWIDTH_JOB_LIMIT = float(os.getenv('BANDWIDTH_JOB_LIMIT', 0))          # bytes/sec per job, 0 = unlimited
+BANDWIDTH_PRIORITY_WEIGHT = float(os.getenv('BANDWIDTH_PRIORITY_WEIGHT', 4))
+BANDWIDTH_SMALL_JOB_BYTES = int(os.getenv('BANDWIDTH_SMALL_JOB_BYTES', 50 * 1024 * 1024))
+BANDWIDTH_BURST_SECONDS = float(os.getenv('BANDWIDTH_BURST_SECONDS', 1.0))  # bucket size, in seconds of allocation
+
+# How often a job's measured rate is refreshed (and shares rebalanced)
+DEMAND_WINDOW = 1.0
+# Headroom over its measured rate a job may be allocated, so it can ramp up
+DEMAND_HEADROOM = 1.25
+
+BANDWIDTH_WAIT_SECONDS = metrics.counter(
+    'vozila_bandwidth_wait_seconds_total',
+    'Time download jobs were paused to stay within their bandwidth allocation')
+
+
+class JobShare:
+    """Token bucket and allocation for one download job"""
+
+    def __init__(self, job_id, priority=False, weight=None):
+        self.job_id = job_id
+        self.priority = priority
+        self.fixed_weight = weight  # overrides the priority weights (speculative prefetch)
+        self.size_checked = priority or weight is not None
+        self.rate = None            # bytes/sec allocated, None = unlimited
+        self.demand = None          # measured bytes/sec over the last window
+        self.tokens = 0.0
+        self.last = time.monotonic()
+        self.seen = {}              # filename -> downloaded_bytes at the previous hook call
+        self.bytes = 0
+        self.waited = 0.0
+        self.window_start = self.last
+        self.window_bytes = 0
+        self.lock = threading.Lock()
+
+    @property
+    def weight(self):
+        if self.fixed_weight is not None:
+            return self.fixed_weight
+        return BANDWIDTH_PRIORITY_WEIGHT if self.priority else 1.0
+
+    def status(self, active_jobs, total_limit):
+        return {
+            'rate': round(self.rate) if self.rate else None,
+            'priority': self.priority,
+            'measured_rate': round(self.demand) if self.demand is not None else None,
+            'waited_seconds': round(self.waited, 2),
+            'active_jobs': active_jobs,
+            'total_limit': total_limit or None,
+        }
+
+
+class BandwidthManager:
+    """Splits the total bandwidth budget across active jobs"""
+
+    def __init__(self, total_limit=BANDWIDTH_TOTAL_LIMIT, job_limit=BANDWIDTH_JOB_LIMIT):
+        self.total_limit = total_limit
+        self.job_limit = job_limit
+        self.jobs = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.total_limit or self.job_limit)
+
+    def register(self, job_id, priority=False, weight=None):
+        share = JobShare(job_id, priority, weight)
+        with self._lock:
+            self.jobs[job_id] = share
+            self._rebalance()
+        return share
+
+    def unregister(self, job_id):
+        with self._lock:
+            if self.jobs.pop(job_id, None) is not None:
+                self._rebalance()
+
+    def set_priority(self, job_id, priority=True):
+        with self._lock:
+            share = self.jobs.get(job_id)
+            if share is not None and share.priority != priority:
+                share.priority = priority
+                self._rebalance()
+
+    def _rebalance(self):
+        """Max-min fair share of total_limit by weight; call with the lock held"""
+        shares = list(self.jobs.values())
+        if not self.total_limit:
+            for share in shares:
+                share.rate = self.job_limit or None
+            return
+
+        def cap(share):
+            limit = self.job_limit or self.total_limit
+            if share.demand is not None:
+                # Don't reserve bandwidth a job can't use (slow upstream, merging, ...)
+                limit = min(limit, max(share.demand * DEMAND_HEADROOM, 64 * 1024))
+            return limit
+
+        remaining = self.total_limit
+        pending = shares
+        while pending:
+            total_weight = sum(share.weight for share in pending)
+            capped = [share for share in pending if cap(share) <= remaining * share.weight / total_weight]
+            if not capped:
+                for share in pending:
+                    share.rate = remaining * share.weight / total_weight
+                break
+            for share in capped:
+                share.rate = cap(share)
+                remaining -= share.rate
+            pending = [share for share in pending if share not in capped]
+
+    def hook(self, job_id):
+        """yt-dlp progress hook that enforces the job's allocation"""
+        def bandwidth_hook(d):
+            self.consume(job_id, d)
+        return bandwidth_hook
+
+    def consume(self, job_id, d):
+        share = self.jobs.get(job_id)
+        if share is None:
+            return
+        filename = d.get('filename')
+        if d['status'] != 'downloading':
+            if d['status'] == 'finished':
+                share.seen.pop(filename, None)
+            return
+
+        delay = 0.0
+        promote = rebalance = False
+        with share.lock:
+            downloaded = d.get('downloaded_bytes') or 0
+            delta = downloaded - share.seen.get(filename, 0)
+            share.seen[filename] = downloaded
+            if delta <= 0:
+                return
+            share.bytes += delta
+            share.window_bytes += delta
+
+            if not share.size_checked:
+                # The first stream (the video stream for merged formats) sizes the job
+                total = d.get('total_bytes') or d.get('total_bytes_estimate')
+                if total:
+                    share.size_checked = True
+                    promote = total <= BANDWIDTH_SMALL_JOB_BYTES
+
+            now = time.monotonic()
+            if now - share.window_start >= DEMAND_WINDOW:
+                share.demand = share.window_bytes / (now - share.window_start)
+                share.window_start = now
+                share.window_bytes = 0
+                rebalance = bool(self.total_limit)
+
+            rate = share.rate
+            if rate:
+                share.tokens = min(share.tokens + (now - share.last) * rate, rate * BANDWIDTH_BURST_SECONDS)
+                share.tokens -= delta
+                if share.tokens < 0:
+                    delay = -share.tokens / rate
+            share.last = now
+
+        if promote:
+            self.set_priority(job_id)
+        elif rebalance:
+            with self._lock:
+                self._rebalance()
+        if delay:
+            time.sleep(delay)
+            share.waited += delay
+            BANDWIDTH_WAIT_SECONDS.inc(delay)
+
+    def allocation(self, job_id):
+        """Current allocation of a job for the progress endpoints, or None"""
+        share = self.jobs.get(job_id)
+        if share is None or not self.enabled:
+            return None
+        return share.status(len(self.jobs), self.total_limit)
+
+    def _allocated(self):
+        with self._lock:
+            return sum(share.rate or 0 for share in self.jobs.values())
+
+
+# Shared manager for the process
+manager = BandwidthManager()
+
+metrics.callback('vozila_bandwidth_shaped_jobs', 'Download jobs with a bandwidth allocation',
+                 lambda: [({}, len(manager.jobs))])
+metrics.callback('vozila_bandwidth_allocated_bytes_per_second', 'Sum of the current per-job allocations',
+                 lambda: [({}, manager._allocated())])
@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark for the Vozila download pipeline
+
+Runs the app in-process against a local stand-in for YouTube (see
+fake_youtube.py) and measures:
+  * /api/info latency under concurrency
+  * download throughput for single-stream (audio) jobs
+  * FFmpeg merge time for a DASH video+audio pair
+  * end-to-end time-to-file for merged 'best' quality jobs
+  * memory and (de)serialization time per cached info dict, full vs compact
+
+Results are written as a JSON report with a fixed schema so runs can be
+compared:
+    python benchmark.py --concurrency 4 --jobs 8 --output before.json
+    python benchmark.py --concurrency 4 --jobs 8 --output after.json --compare before.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import pickle
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# The fake extractor is registered in this process only
+os.environ.setdefault('EXTRACTION_BACKEND', 'thread')
+
+import requests
+from werkzeug.serving import make_server
+
+import compact_info
+import fake_youtube
+import source
+
+REPORT_VERSION = 1
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(int(round(pct / 100.0 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def summarize(samples):
+    """Latency-style summary of a list of seconds"""
+    if not samples:
+        return {'count': 0}
+    return {
+        'count': len(samples),
+        'mean': round(statistics.mean(samples), 4),
+        'min': round(min(samples), 4),
+        'p50': round(percentile(samples, 50), 4),
+        'p95': round(percentile(samples, 95), 4),
+        'p99': round(percentile(samples, 99), 4),
+        'max': round(max(samples), 4),
+    }
+
+
+class AppServer:
+    """The Flask app on a threaded werkzeug server in this process"""
+
+    def __init__(self, host='127.0.0.1', port=0):
+        logging.getLogger('werkzeug').setLevel(logging.ERROR)
+        self.app = source.create_app()
+        self.server = make_server(host, port, self.app, threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, name='bench-app', daemon=True)
+
+    @property
+    def base_url(self):
+        return f'http://127.0.0.1:{self.server.server_port}'
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+def run_concurrently(func, count, concurrency):
+    """Call func(i) count times on `concurrency` threads; returns (results, wall seconds)"""
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(func, range(count)))
+    return results, time.perf_counter() - started
+
+
+def bench_info(base_url, requests_count, concurrency):
+    """POST /api/info for unique videos (so the info cache never answers)"""
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, 'session', None) or requests.Session()
+        local.session = session
+        started = time.perf_counter()
+        response = session.post(f'{base_url}/api/info', json={'url': fake_youtube.video_url()}, timeout=300)
+        return time.perf_counter() - started, response.status_code == 200
+
+    results, wall = run_concurrently(one, requests_count, concurrency)
+    latencies = [latency for latency, ok in results if ok]
+    return {
+        'requests': requests_count,
+        'errors': sum(1 for _, ok in results if not ok),
+        'throughput_rps': round(len(latencies) / wall, 3) if wall else None,
+        'latency': summarize(latencies),
+    }
+
+
+def run_download_job(session, base_url, quality, poll_interval=0.05, timeout=600):
+    """Start a download and follow it until the file is served
+
+    Returns a dict with timings (seconds from the POST) and bytes received.
+    """
+    started = time.perf_counter()
+    response = session.post(f'{base_url}/api/download', json={'url': fake_youtube.video_url(), 'quality': quality}, timeout=60)
+    response.raise_for_status()
+    download_id = response.json()['download_id']
+
+    first_byte_at = None
+    status = None
+    while time.perf_counter() - started < timeout:
+        progress = session.get(f'{base_url}/api/progress/{download_id}', timeout=60)
+        if progress.status_code == 200:
+            data = progress.json()
+            status = data['status']
+            if first_byte_at is None and (status == 'downloading' or data['progress'] > 0):
+                first_byte_at = time.perf_counter() - started
+            if status == 'error':
+                return {'ok': False, 'error': data.get('error')}
+            if status == 'completed':
+                break
+        time.sleep(poll_interval)
+
+    # 'completed' can be reported before the merged file is registered
+    while time.perf_counter() - started < timeout:
+        file_response = session.get(f'{base_url}/api/download/{download_id}', stream=True, timeout=60)
+        if file_response.status_code == 200:
+            size = 0
+            for chunk in file_response.iter_content(256 * 1024):
+                size += len(chunk)
+            return {
+                'ok': True,
+                'bytes': size,
+                'first_byte': first_byte_at,
+                'time_to_file': time.perf_counter() - started,
+            }
+        if status == 'error':
+            break
+        time.sleep(poll_interval)
+    return {'ok': False, 'error': 'timed out'}
+
+
+def bench_downloads(base_url, quality, jobs, concurrency):
+    local = threading.local()
+
+    def one(_):
+        session = getattr(local, 'session', None) or requests.Session()
+        local.session = session
+        return run_download_job(session, base_url, quality)
+
+    results, wall = run_concurrently(one, jobs, concurrency)
+    ok = [r for r in results if r['ok']]
+    transfer_rates = [
+        r['bytes'] / (r['time_to_file'] - r['first_byte'])
+        for r in ok if r.get('first_byte') is not None and r['time_to_file'] > r['first_byte']
+    ]
+    total_bytes = sum(r['bytes'] for r in ok)
+    return {
+        'quality': quality,
+        'jobs': jobs,
+        'errors': len(results) - len(ok),
+        'error_samples': [r.get('error') for r in results if not r['ok']][:3],
+        'total_bytes': total_bytes,
+        'aggregate_bytes_per_sec': round(total_bytes / wall) if wall else None,
+        'per_job_bytes_per_sec': summarize(transfer_rates),
+        'time_to_first_byte': summarize([r['first_byte'] for r in ok if r.get('first_byte') is not None]),
+        'time_to_file': summarize([r['time_to_file'] for r in ok]),
+    }
+
+
+def bench_merge(library, ffmpeg_path, runs):
+    """Merge the 1080p video-only and audio-only streams the way the app does"""
+    if not ffmpeg_path:
+        return {'skipped': 'FFmpeg not available'}
+
+    from yt_dlp import YoutubeDL
+    from yt_dlp.postprocessor import FFmpegMergerPP
+
+    ydl = YoutubeDL({
+        'quiet': True,
+        'no_warnings': True,
+        'ffmpeg_location': ffmpeg_path,
+        'postprocessor_args': {'ffmpeg': source.MERGE_POSTPROCESSOR_ARGS},
+    })
+    merger = FFmpegMergerPP(ydl)
+    video, audio = library.files['137'], library.files['140']
+    timings = []
+    with tempfile.TemporaryDirectory(prefix='vozila_merge_bench_') as workdir:
+        for i in range(runs):
+            output = os.path.join(workdir, f'merged_{i}.mp4')
+            info = {
+                'filepath': output,
+                'ext': 'mp4',
+                '__files_to_merge': [video, audio],
+                'requested_formats': [
+                    {'vcodec': 'avc1', 'acodec': 'none', 'protocol': 'http', 'filepath': video},
+                    {'vcodec': 'none', 'acodec': 'mp4a', 'protocol': 'http', 'filepath': audio},
+                ],
+            }
+            started = time.perf_counter()
+            merger.run(info)
+            timings.append(time.perf_counter() - started)
+    return {
+        'runs': runs,
+        'input_bytes': os.path.getsize(video) + os.path.getsize(audio),
+        'duration': summarize(timings),
+    }
+
+
+def retained_bytes(make):
+    """Bytes still allocated by the object make() returns"""
+    tracemalloc.start()
+    try:
+        obj = make()
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del obj
+    return size
+
+
+def bench_info_memory(videos):
+    """What one cached video costs as a pickled full info dict vs compact_info"""
+    from yt_dlp import YoutubeDL
+
+    ydl = YoutubeDL({'quiet': True, 'no_warnings': True})
+    full_sizes, compact_sizes, full_live, compact_live = [], [], [], []
+    timings = {'pickle_dumps': [], 'pickle_loads': [], 'compact_pack': [], 'compact_unpack': []}
+    for _ in range(videos):
+        info = YoutubeDL.sanitize_info(ydl.extract_info(fake_youtube.video_url(), download=False))
+
+        started = time.perf_counter()
+        full = pickle.dumps(info, protocol=pickle.HIGHEST_PROTOCOL)
+        timings['pickle_dumps'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        pickle.loads(full)
+        timings['pickle_loads'].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        packed = compact_info.pack(info)
+        timings['compact_pack'].append(time.perf_counter() - started)
+        started = time.perf_counter()
+        compact_info.unpack(packed)
+        timings['compact_unpack'].append(time.perf_counter() - started)
+
+        full_sizes.append(len(full))
+        compact_sizes.append(len(packed))
+        # Held as live objects rather than bytes (e.g. an in-process dict cache)
+        full_live.append(retained_bytes(lambda: pickle.loads(full)))
+        compact_live.append(retained_bytes(lambda: compact_info.CompactInfo.loads(packed)))
+
+    full_bytes, compact_bytes = statistics.mean(full_sizes), statistics.mean(compact_sizes)
+    return {
+        'videos': videos,
+        'full_bytes': round(full_bytes),
+        'compact_bytes': round(compact_bytes),
+        'reduction': round(1 - compact_bytes / full_bytes, 4),
+        'full_live_bytes': round(statistics.mean(full_live)),
+        'compact_live_bytes': round(statistics.mean(compact_live)),
+        'seconds': {name: summarize(samples) for name, samples in timings.items()},
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def environment(ffmpeg_path):
+    import yt_dlp
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'yt_dlp': yt_dlp.version.__version__,
+        'ffmpeg': bool(ffmpeg_path),
+        'extraction_backend': source.EXTRACTION_BACKEND,
+        'git_commit': git_commit(),
+    }
+
+
+def compare(report, baseline):
+    """Print the change in headline numbers against a previous report"""
+    headline = [
+        ('info p50 latency', ('info', 'latency', 'p50'), False),
+        ('info p99 latency', ('info', 'latency', 'p99'), False),
+        ('info throughput', ('info', 'throughput_rps'), True),
+        ('download aggregate B/s', ('download', 'aggregate_bytes_per_sec'), True),
+        ('download p50 time-to-file', ('download', 'time_to_file', 'p50'), False),
+        ('merge p50', ('merge', 'duration', 'p50'), False),
+        ('end-to-end p50 time-to-file', ('end_to_end', 'time_to_file', 'p50'), False),
+        ('cached info bytes per video', ('info_memory', 'compact_bytes'), False),
+    ]
+
+    def lookup(data, path):
+        for key in path:
+            if not isinstance(data, dict) or key not in data:
+                return None
+            data = data[key]
+        return data
+
+    print("\nComparison against baseline:")
+    for label, path, higher_is_better in headline:
+        new, old = lookup(report['results'], path), lookup(baseline['results'], path)
+        if new is None or old is None or not old:
+            continue
+        change = (new - old) / old * 100
+        better = change > 0 if higher_is_better else change < 0
+        print(f"  {label:32s} {old:>12.4f} -> {new:>12.4f}  ({change:+.1f}%{' better' if better else ''})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=4, help='parallel clients')
+    parser.add_argument('--info-requests', type=int, default=20, help='/api/info calls to make')
+    parser.add_argument('--jobs', type=int, default=8, help='download jobs per download scenario')
+    parser.add_argument('--size-mb', type=float, default=20, help='size budget of the synthetic video')
+    parser.add_argument('--duration', type=int, default=30, help='duration of the synthetic video (seconds)')
+    parser.add_argument('--bandwidth', type=float, default=0, help='per-connection cap of the media server (MB/s, 0 = unlimited)')
+    parser.add_argument('--extract-delay', type=float, default=0.0, help='simulated network wait per extraction (seconds)')
+    parser.add_argument('--extract-cpu', type=float, default=0.0, help='simulated CPU work per extraction (seconds)')
+    parser.add_argument('--merge-runs', type=int, default=3)
+    parser.add_argument('--memory-videos', type=int, default=20, help='info dicts to measure for info_memory')
+    parser.add_argument('--scenarios', default='info,download,merge,end_to_end,info_memory')
+    parser.add_argument('--output', default='benchmark_report.json')
+    parser.add_argument('--compare', help='previous report to compare against')
+    args = parser.parse_args()
+
+    scenarios = set(args.scenarios.split(','))
+    ffmpeg_path = source.get_ffmpeg_path()
+
+    print("Building synthetic media...", file=sys.stderr)
+    library = fake_youtube.MediaLibrary(args.size_mb, args.duration, ffmpeg_path).build()
+    media_server = fake_youtube.MediaServer(library, bandwidth=int(args.bandwidth * 1024 * 1024)).start()
+    fake_youtube.install(media_server, extract_delay=args.extract_delay, extract_cpu=args.extract_cpu)
+    app_server = AppServer().start()
+
+    results = {}
+    try:
+        if 'info' in scenarios:
+            print("Benchmarking /api/info...", file=sys.stderr)
+            results['info'] = bench_info(app_server.base_url, args.info_requests, args.concurrency)
+        if 'download' in scenarios:
+            print("Benchmarking single-stream downloads...", file=sys.stderr)
+            results['download'] = bench_downloads(app_server.base_url, 'audio', args.jobs, args.concurrency)
+        if 'merge' in scenarios:
+            print("Benchmarking FFmpeg merge...", file=sys.stderr)
+            results['merge'] = bench_merge(library, ffmpeg_path, args.merge_runs)
+        if 'end_to_end' in scenarios:
+            print("Benchmarking end-to-end 'best' downloads...", file=sys.stderr)
+            results['end_to_end'] = bench_downloads(app_server.base_url, 'best', args.jobs, args.concurrency)
+        if 'info_memory' in scenarios:
+            print("Measuring cached info size...", file=sys.stderr)
+            results['info_memory'] = bench_info_memory(args.memory_videos)
+    finally:
+        app_server.stop()
+        media_server.stop()
+        fake_youtube.uninstall()
+        library.cleanup()
+
+    report = {
+        'report_version': REPORT_VERSION,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'environment': environment(ffmpeg_path),
+        'config': vars(args),
+        'media_server': {'requests': media_server.requests, 'bytes_sent': media_server.bytes_sent},
+        'results': results,
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(results, indent=2))
+    print(f"\nReport written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Time-range clip downloads
+
+/api/download takes optional ``start`` / ``end`` times (seconds, or
+[HH:]MM:SS[.ms] strings). The job then passes yt-dlp a ``download_ranges``
+callback, so the streams are read through FFmpeg seeking into the remote
+file with range requests instead of being downloaded whole. Bandwidth, disk
+use and merge time follow the clip length, not the video length.
+
+With CLIP_FORCE_KEYFRAMES (the default) the clip is re-encoded around the
+cut points so it starts exactly at ``start``; without it streams are copied
+and the cut snaps to the nearest keyframe, which is faster but less precise.
+Clip files are named after their range, and every key that identifies a
+job's output (batch dedupe, prefetch, journal) includes it.
+"""
+
+import math
+import os
+
+CLIP_FORCE_KEYFRAMES = os.getenv('CLIP_FORCE_KEYFRAMES', 'true').lower() == 'true'
+
+
+def parse_time(value):
+    """Seconds from a number or a [HH:]MM:SS[.ms] string; ValueError if it's neither"""
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if isinstance(value, (int, float)):
+        seconds = float(value)
+    else:
+        parts = str(value).strip().split(':')
+        if not 1 <= len(parts) <= 3:
+            raise ValueError(value)
+        seconds = 0.0
+        for part in parts:
+            seconds = seconds * 60 + float(part)
+    if not math.isfinite(seconds) or seconds < 0:
+        raise ValueError(value)
+    return seconds
+
+
+def parse_clip(start, end, duration=None):
+    """(start, end) in seconds from request values, or None for a full download
+
+    Raises ValueError with a user-facing message. A missing start means the
+    beginning; a missing end (or one past ``duration``) means the end.
+    """
+    if start in (None, '') and end in (None, ''):
+        return None
+    try:
+        start = parse_time(start) if start not in (None, '') else 0.0
+        end = parse_time(end) if end not in (None, '') else None
+    except ValueError:
+        raise ValueError("start and end must be seconds or [HH:]MM:SS times")
+    if duration:
+        if start >= duration:
+            raise ValueError("start is past the end of the video")
+        end = min(end, duration) if end is not None else duration
+    if end is None:
+        raise ValueError("end is required when the video's duration isn't known yet")
+    if end <= start:
+        raise ValueError("end must be after start")
+    return (start, end)
+
+
+def format_time(seconds):
+    """Compact H:MM:SS / M:SS label with fractional seconds only when needed"""
+    whole = int(seconds)
+    fraction = f'{seconds - whole:.3f}'[1:].rstrip('0').rstrip('.')
+    hours, rest = divmod(whole, 3600)
+    minutes, secs = divmod(rest, 60)
+    label = f'{hours}:{minutes:02d}:{secs:02d}' if hours else f'{minutes}:{secs:02d}'
+    return label + fraction
+
+
+def label(clip):
+    """Range label for keys and file names, e.g. '1:30-2:00'; '' for full downloads"""
+    return f'{format_time(clip[0])}-{format_time(clip[1])}' if clip else ''
+
+
+def output_template(clip):
+    """yt-dlp output template (relative to the job directory)"""
+    if not clip:
+        return '%(title)s.%(ext)s'
+    # ':' isn't allowed in Windows file names
+    return f"%(title)s [{label(clip).replace(':', '.')}].%(ext)s"
+
+
+def download_options(clip):
+    """Per-job yt-dlp settings that limit the download to the clip"""
+    if not clip:
+        return {}
+    start, end = clip
+
+    def download_ranges(info_dict, ydl):
+        return [{'start_time': start, 'end_time': end}]
+
+    return {'download_ranges': download_ranges, 'force_keyframes_at_cuts': CLIP_FORCE_KEYFRAMES}
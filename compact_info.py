@@ -0,0 +1,228 @@
+"""
+Compact info dicts for the info cache and the extraction pool
+
+A processed yt-dlp info dict for a YouTube video is mostly things the app
+never reads: automatic caption tables for every language, dozens of
+thumbnails, per-format copies of the same HTTP headers, DASH fragment lists.
+CompactInfo keeps only the fields that /api/info and a download need:
+
+  * whitelisted top-level fields (INFO_FIELDS); captions, thumbnails,
+    chapters, descriptions and selection results are dropped
+  * formats as columns instead of a list of dicts: numeric fields packed
+    into float64 arrays (NaN for missing), low-cardinality fields (ext,
+    codecs, protocol, ...) as indices into a per-video value table, URLs as
+    plain lists, and each distinct header/downloader-options dict stored once
+  * playlist entries compacted the same way, recursively
+
+and serializes with marshal (builtin types only, no pickle class lookups).
+Formats that needed dropped fields (DASH fragments) mark the result as
+incomplete, so downloads don't try to reuse it.
+
+marshal data is only ever produced by this process or its own extraction
+workers; never call unpack() on bytes from outside.
+"""
+
+import marshal
+import math
+from array import array
+
+COMPACT_VERSION = 1
+
+# Top-level fields kept for /api/info, scheduling, output templates and re-processing
+INFO_FIELDS = (
+    '_type', 'id', 'title', 'fulltitle', 'duration', 'view_count', 'like_count', 'uploader', 'uploader_id',
+    'uploader_url', 'channel', 'channel_id', 'thumbnail', 'upload_date', 'timestamp', 'age_limit',
+    'availability', 'live_status', 'is_live', 'was_live', 'webpage_url', 'original_url',
+    'webpage_url_basename', 'webpage_url_domain', 'extractor', 'extractor_key', 'playlist_id',
+    'playlist_title', 'playlist_count', '_format_sort_fields',
+)
+# Only meaningful on unresolved (url / url_transparent) playlist entries
+REFERENCE_FIELDS = ('url', 'ie_key')
+
+# Format fields with few distinct values: stored as indices into the value table
+TABLE_FIELDS = ('format_id', 'ext', 'protocol', 'vcodec', 'acodec', 'container', 'format_note',
+                'dynamic_range', 'language', 'has_drm')
+# Unique per format
+URL_FIELDS = ('url', 'manifest_url')
+NUMBER_FIELDS = ('width', 'height', 'fps', 'tbr', 'abr', 'vbr', 'asr', 'filesize', 'filesize_approx',
+                 'audio_channels', 'quality', 'preference', 'source_preference', 'language_preference',
+                 'available_at')
+# Usually identical across formats: each distinct dict is stored once
+DICT_FIELDS = ('http_headers', 'downloader_options')
+# Needed to download the format, but too big to keep
+DROPPED_FORMAT_FIELDS = ('fragments',)
+
+_SCALARS = (str, int, float, bool, type(None))
+
+
+def _marshalable(value):
+    if isinstance(value, _SCALARS):
+        return True
+    if isinstance(value, (list, tuple)):
+        return all(isinstance(item, _SCALARS) for item in value)
+    return False
+
+
+class FormatTable:
+    """A video's formats as columns, in yt-dlp's (worst to best) order"""
+
+    __slots__ = ('count', 'values', 'dicts', 'indexed', 'urls', 'numbers')
+
+    def __init__(self, count, values, dicts, indexed, urls, numbers):
+        self.count = count
+        self.values = values      # distinct TABLE_FIELDS values
+        self.dicts = dicts        # distinct DICT_FIELDS dicts
+        self.indexed = indexed    # field -> array('H') of 1-based indices, 0 = missing
+        self.urls = urls          # field -> list
+        self.numbers = numbers    # field -> array('d'), NaN = missing
+
+    @classmethod
+    def from_formats(cls, formats):
+        """(FormatTable, complete) for a list of format dicts"""
+        count = len(formats)
+        values, value_index = [], {}
+        dicts, dict_index = [], {}
+        indexed, urls, numbers = {}, {}, {}
+        complete = True
+
+        def intern(value):
+            # type in the key so True and 1 don't share a slot
+            key = (type(value), value)
+            if key not in value_index:
+                value_index[key] = len(values) + 1
+                values.append(value)
+            return value_index[key]
+
+        def intern_dict(value):
+            key = tuple(sorted((k, tuple(v) if isinstance(v, list) else v) for k, v in value.items()))
+            if key not in dict_index:
+                dict_index[key] = len(dicts) + 1
+                dicts.append(dict(value))
+            return dict_index[key]
+
+        for i, fmt in enumerate(formats):
+            if any(fmt.get(key) for key in DROPPED_FORMAT_FIELDS):
+                complete = False
+            for field in TABLE_FIELDS:
+                value = fmt.get(field)
+                if value is not None and isinstance(value, _SCALARS):
+                    indexed.setdefault(field, array('H', bytes(2 * count)))[i] = intern(value)
+            for field in DICT_FIELDS:
+                value = fmt.get(field)
+                if value and isinstance(value, dict) and all(map(_marshalable, value.values())):
+                    indexed.setdefault(field, array('H', bytes(2 * count)))[i] = intern_dict(value)
+            for field in URL_FIELDS:
+                value = fmt.get(field)
+                if value is not None:
+                    urls.setdefault(field, [None] * count)[i] = value
+            for field in NUMBER_FIELDS:
+                value = fmt.get(field)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    numbers.setdefault(field, array('d', [math.nan]) * count)[i] = value
+        return cls(count, values, dicts, indexed, urls, numbers), complete
+
+    def rows(self):
+        """Format dicts again, with only the fields that were set"""
+        rows = [{} for _ in range(self.count)]
+        for field, column in self.indexed.items():
+            table = self.dicts if field in DICT_FIELDS else self.values
+            for row, index in zip(rows, column):
+                if index:
+                    value = table[index - 1]
+                    # Each format gets its own dict; yt-dlp updates headers in place
+                    row[field] = dict(value) if field in DICT_FIELDS else value
+        for field, column in self.urls.items():
+            for row, value in zip(rows, column):
+                if value is not None:
+                    row[field] = value
+        for field, column in self.numbers.items():
+            for row, value in zip(rows, column):
+                if not math.isnan(value):
+                    row[field] = int(value) if value.is_integer() else value
+        return rows
+
+    def to_tuple(self):
+        return (self.count, self.values, self.dicts,
+                {field: column.tobytes() for field, column in self.indexed.items()},
+                self.urls,
+                {field: column.tobytes() for field, column in self.numbers.items()})
+
+    @classmethod
+    def from_tuple(cls, data):
+        count, values, dicts, indexed, urls, numbers = data
+        return cls(count, values, dicts,
+                   {field: array('H', raw) for field, raw in indexed.items()},
+                   urls,
+                   {field: array('d', raw) for field, raw in numbers.items()})
+
+
+class CompactInfo:
+    """Whitelisted fields, a FormatTable and compacted entries of one info dict"""
+
+    __slots__ = ('fields', 'formats', 'entries', 'complete')
+
+    def __init__(self, fields, formats=None, entries=None, complete=True):
+        self.fields = fields
+        self.formats = formats
+        self.entries = entries
+        self.complete = complete
+
+    @classmethod
+    def from_info(cls, info):
+        fields = {key: info[key] for key in INFO_FIELDS if info.get(key) is not None and _marshalable(info[key])}
+        if info.get('_type') in ('url', 'url_transparent'):
+            fields.update((key, info[key]) for key in REFERENCE_FIELDS if info.get(key) is not None)
+        complete = True
+        formats = entries = None
+        if info.get('formats') is not None:
+            formats, complete = FormatTable.from_formats(info['formats'])
+        if info.get('entries') is not None:
+            entries = [cls.from_info(entry) for entry in info['entries'] if entry]
+            complete = complete and all(entry.complete for entry in entries)
+        return cls(fields, formats, entries, complete)
+
+    @property
+    def is_playlist(self):
+        return self.entries is not None
+
+    def to_info(self):
+        """A plain info dict that yt-dlp can process (select formats, download) again"""
+        info = dict(self.fields)
+        if self.formats is not None:
+            info['formats'] = self.formats.rows()
+        if self.entries is not None:
+            info['entries'] = [entry.to_info() for entry in self.entries]
+        return info
+
+    def to_tuple(self):
+        return (self.fields, self.formats.to_tuple() if self.formats is not None else None,
+                [entry.to_tuple() for entry in self.entries] if self.entries is not None else None,
+                self.complete)
+
+    @classmethod
+    def from_tuple(cls, data):
+        fields, formats, entries, complete = data
+        return cls(fields,
+                   FormatTable.from_tuple(formats) if formats is not None else None,
+                   [cls.from_tuple(entry) for entry in entries] if entries is not None else None,
+                   complete)
+
+    def dumps(self):
+        return marshal.dumps((COMPACT_VERSION, self.to_tuple()))
+
+    @classmethod
+    def loads(cls, data):
+        version, payload = marshal.loads(data)
+        if version != COMPACT_VERSION:
+            raise ValueError(f"Unsupported compact info version {version}")
+        return cls.from_tuple(payload)
+
+
+def pack(info):
+    """Serialize an info dict to compact bytes"""
+    return CompactInfo.from_info(info).dumps()
+
+
+def unpack(data):
+    """Info dict from pack() output"""
+    return CompactInfo.loads(data).to_info()
@@ -0,0 +1,176 @@
+"""
+In-memory cookie jars for uploaded cookies
+
+Cookies sent with /api/download (or /api/upload-cookies) used to be written
+to a per-job cookies.txt under the temp dir. yt-dlp then re-read and
+re-parsed that file, and it was left behind whenever a job didn't reach its
+cleanup. Now each upload is parsed once into a yt-dlp cookie jar (a
+MozillaCookieJar), kept in memory under the SHA-256 of its content and handed
+to yt-dlp directly. Nothing touches the disk: the jar is set on the job's
+YoutubeDL without a ``cookiefile``, so yt-dlp never saves it.
+
+Jobs that upload the same cookies (a batch, or one user's downloads) share a
+jar. Each job holds a reference until it finishes. A jar nobody references
+is dropped COOKIE_JAR_TTL seconds after its last use, or sooner when more
+than COOKIE_JAR_MAX jars are unreferenced. Dropping a jar clears its
+cookies, so later code holding the jar object can't read them either.
+"""
+
+import hashlib
+import http.cookiejar
+import io
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import metrics
+
+COOKIE_JAR_TTL = float(os.getenv('COOKIE_JAR_TTL', 3600))  # seconds an unreferenced jar is kept
+COOKIE_JAR_MAX = int(os.getenv('COOKIE_JAR_MAX', 256))     # unreferenced jars kept at most
+
+NETSCAPE_HEADER = '# Netscape HTTP Cookie File\n'
+
+COOKIE_JAR_REQUESTS = metrics.counter(
+    'vozila_cookie_jar_requests_total',
+    'Uploaded cookies by whether an identical upload was already parsed (hit, miss, invalid)',
+    ['result'])
+
+
+def _json_cookie(cookie):
+    """http.cookiejar.Cookie from a browser-extension JSON export entry"""
+    domain = cookie.get('domain') or '.youtube.com'
+    expires = cookie.get('expirationDate')
+    expires = int(expires) if expires and not cookie.get('session') else None
+    return http.cookiejar.Cookie(
+        version=0, name=str(cookie.get('name', '')), value=str(cookie.get('value', '')),
+        port=None, port_specified=False,
+        domain=domain, domain_specified=True, domain_initial_dot=domain.startswith('.'),
+        path=cookie.get('path') or '/', path_specified=True,
+        secure=bool(cookie.get('secure')), expires=expires, discard=expires is None,
+        comment=None, comment_url=None, rest={})
+
+
+def parse(content):
+    """yt-dlp cookie jar from Netscape cookies.txt or JSON export text; ValueError if it's neither"""
+    from yt_dlp.cookies import YoutubeDLCookieJar
+
+    jar = YoutubeDLCookieJar()
+    content = content.strip()
+    try:
+        if content[:1] in '[{':
+            data = json.loads(content)
+            if isinstance(data, dict):
+                data = data.get('cookies')
+            if not isinstance(data, list) or not all(isinstance(cookie, dict) for cookie in data):
+                raise ValueError(content[:20])
+            for cookie in data:
+                jar.set_cookie(_json_cookie(cookie))
+        else:
+            # MozillaCookieJar insists on the header line; plenty of exports leave it out
+            if not content.startswith('#'):
+                content = NETSCAPE_HEADER + content
+            jar.load(io.StringIO(content + '\n'))
+    except (ValueError, http.cookiejar.LoadError):
+        raise ValueError("Cookies must be a Netscape cookies.txt file or a JSON cookie export")
+    if not len(jar):
+        raise ValueError("No cookies found in the uploaded cookies")
+    return jar
+
+
+class CookieJarEntry:
+    __slots__ = ('jar', 'refs', 'expires')
+
+    def __init__(self, jar):
+        self.jar = jar
+        self.refs = 0
+        self.expires = None
+
+
+class CookieJarCache:
+    """Parsed cookie jars by content hash, shared by the jobs that uploaded them"""
+
+    def __init__(self, ttl=COOKIE_JAR_TTL, max_jars=COOKIE_JAR_MAX):
+        self.ttl = ttl
+        self.max_jars = max_jars
+        self._entries = OrderedDict()  # key -> CookieJarEntry, least recently used first
+        self._lock = threading.Lock()
+
+    def add(self, content):
+        """Key of the jar for uploaded cookie text, parsing it if needed; holds a reference until release()"""
+        key = hashlib.sha256(content.strip().encode()).hexdigest()
+        with self._lock:
+            cached = key in self._entries
+        jar = None if cached else self._parse(content)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                # Expired between the two lookups: parse again rather than fail
+                entry = self._entries[key] = CookieJarEntry(jar or self._parse(content))
+            COOKIE_JAR_REQUESTS.inc(result='miss' if jar else 'hit')
+            self._entries.move_to_end(key)
+            entry.refs += 1
+            entry.expires = None
+        return key
+
+    def _parse(self, content):
+        try:
+            return parse(content)
+        except ValueError:
+            COOKIE_JAR_REQUESTS.inc(result='invalid')
+            raise
+
+    def get(self, key):
+        """The jar for a key from add(), or None once it has expired"""
+        if not key:
+            return None
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            if entry.refs == 0:
+                entry.expires = time.monotonic() + self.ttl
+            return entry.jar
+
+    def release(self, key):
+        """Drop a reference taken by add(); the jar expires COOKIE_JAR_TTL after the last one"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry.refs = max(entry.refs - 1, 0)
+                if entry.refs == 0:
+                    entry.expires = time.monotonic() + self.ttl
+            self._expire()
+
+    def _expire(self):
+        """Drop unreferenced jars past their TTL or over max_jars; call with the lock held"""
+        now = time.monotonic()
+        idle = [key for key, entry in self._entries.items() if entry.refs == 0]
+        over = len(idle) - self.max_jars
+        for key in idle:
+            entry = self._entries[key]
+            if over > 0 or entry.expires <= now:
+                over -= 1
+                del self._entries[key]
+                entry.jar.clear()
+
+    def clear(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for entry in entries:
+            entry.jar.clear()
+
+    def count(self):
+        with self._lock:
+            return len(self._entries)
+
+
+# Shared jars for the process
+jars = CookieJarCache()
+
+metrics.callback('vozila_cookie_jars', 'Parsed cookie jars held in memory', lambda: [({}, jars.count())])
@@ -0,0 +1,144 @@
+"""
+Managed yt-dlp cache directory (player JS / signature functions)
+
+yt-dlp caches deciphered signature and n-parameter functions per player
+version under its ``cachedir``. Left at the default (~/.cache/yt-dlp) that
+cache is lost with every ephemeral container, so the first extraction per
+player version re-downloads and re-parses base.js. This module points every
+YoutubeDL at one shared directory, seeds it from a bundled snapshot, and
+counts cache hits and misses.
+
+yt-dlp writes cache entries to a temp file and renames it into place, so
+gunicorn workers and extraction processes can share the directory safely.
+
+Usage:
+    python extraction_cache.py snapshot <dir>   # export the cache as a snapshot
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from collections import defaultdict
+
+YTDLP_CACHE_DIR = os.getenv('YTDLP_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'vozila_ytdlp_cache')
+# Directory with a previous cache export to seed cold containers from
+YTDLP_CACHE_SNAPSHOT = os.getenv('YTDLP_CACHE_SNAPSHOT') or os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cache_snapshot')
+# Optional video to extract at startup so the current player is cached before real traffic
+YTDLP_CACHE_WARM_URL = os.getenv('YTDLP_CACHE_WARM_URL', '')
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0, 'stores': 0})
+_stats_lock = threading.Lock()
+
+
+def _count(section, field):
+    with _stats_lock:
+        _stats[section][field] += 1
+
+
+_cache_class = None
+
+
+def _instrumented_cache_class():
+    """Build the Cache subclass on first use so importing this module doesn't import yt-dlp"""
+    global _cache_class
+    if _cache_class is None:
+        from yt_dlp.cache import Cache
+
+        class InstrumentedCache(Cache):
+            """yt-dlp Cache that records hits, misses and stores per section"""
+
+            def load(self, section, key, dtype='json', default=None, *, min_ver=None):
+                result = super().load(section, key, dtype=dtype, default=default, min_ver=min_ver)
+                if self.enabled:
+                    _count(section, 'misses' if result is default else 'hits')
+                return result
+
+            def store(self, section, key, data, dtype='json'):
+                super().store(section, key, data, dtype=dtype)
+                if self.enabled:
+                    _count(section, 'stores')
+
+        _cache_class = InstrumentedCache
+    return _cache_class
+
+
+def configure(params):
+    """Point a YoutubeDL params dict at the shared cache directory"""
+    params.setdefault('cachedir', YTDLP_CACHE_DIR)
+    return params
+
+
+def instrument(ydl):
+    """Swap a YoutubeDL's cache for the instrumented one"""
+    ydl.cache = _instrumented_cache_class()(ydl)
+    return ydl
+
+
+def _copy_tree_missing(src, dest):
+    """Copy files from src that don't exist in dest; returns the number copied"""
+    copied = 0
+    for root, _dirs, files in os.walk(src):
+        target_dir = os.path.join(dest, os.path.relpath(root, src))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            if name.endswith('.tmp'):
+                continue
+            target = os.path.join(target_dir, name)
+            if os.path.exists(target):
+                continue
+            # Copy to a temp name and rename so concurrent readers never see a partial file
+            fd, tmp_path = tempfile.mkstemp(prefix=f'{name}.', suffix='.tmp', dir=target_dir)
+            os.close(fd)
+            try:
+                shutil.copyfile(os.path.join(root, name), tmp_path)
+                os.replace(tmp_path, target)
+                copied += 1
+            except OSError:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+    return copied
+
+
+def prepare():
+    """Create the cache directory and seed it from the bundled snapshot"""
+    os.makedirs(YTDLP_CACHE_DIR, exist_ok=True)
+    if os.path.isdir(YTDLP_CACHE_SNAPSHOT):
+        try:
+            copied = _copy_tree_missing(YTDLP_CACHE_SNAPSHOT, YTDLP_CACHE_DIR)
+            if copied:
+                print(f"Seeded yt-dlp cache with {copied} entries from {YTDLP_CACHE_SNAPSHOT}")
+        except Exception as e:
+            print(f"Failed to seed yt-dlp cache from snapshot: {e}")
+    return YTDLP_CACHE_DIR
+
+
+def warm_up():
+    """Extract YTDLP_CACHE_WARM_URL once so the current player is in the cache"""
+    if not YTDLP_CACHE_WARM_URL:
+        return
+    from info_extraction import extract_video_info
+    try:
+        extract_video_info(YTDLP_CACHE_WARM_URL)
+        print("yt-dlp cache warm-up completed")
+    except Exception as e:
+        print(f"yt-dlp cache warm-up failed: {e}")
+
+
+def export_snapshot(dest):
+    """Copy the current cache into a snapshot directory"""
+    return _copy_tree_missing(YTDLP_CACHE_DIR, dest)
+
+
+def stats():
+    """Hit/miss/store counters per cache section for this process"""
+    with _stats_lock:
+        return {section: dict(counts) for section, counts in _stats.items()}
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 3 and sys.argv[1] == 'snapshot':
+        print(f"Exported {export_snapshot(sys.argv[2])} cache entries to {sys.argv[2]}")
+    else:
+        print(__doc__)
@@ -0,0 +1,184 @@
+"""
+Process-pool backend for yt-dlp info extraction
+
+yt-dlp extraction is CPU-heavy Python (JS player parsing, JSON walking) and
+holds the GIL, so with a couple of gunicorn threads two slow /api/info calls
+block the whole site. This module runs extraction in a pool of warm worker
+processes instead. Enable it with EXTRACTION_BACKEND=process.
+"""
+
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+import compact_info
+import egress
+import metrics
+import throttle
+
+# Pool configuration
+EXTRACTION_WORKERS = int(os.getenv('EXTRACTION_WORKERS', os.cpu_count() or 2))
+EXTRACTION_TIMEOUT = float(os.getenv('EXTRACTION_TIMEOUT', 90))  # seconds per call
+EXTRACTION_MAX_RESULT_BYTES = int(os.getenv('EXTRACTION_MAX_RESULT_BYTES', 8 * 1024 * 1024))
+
+# Parent waits a little longer than the worker's own alarm so the worker
+# gets a chance to report the timeout before we give up on it
+TIMEOUT_GRACE = 5
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class ExtractionTimeout(BaseException):
+    """Raised inside a worker when an extraction exceeds its time budget
+
+    Derives from BaseException so the per-strategy ``except Exception`` in
+    info_extraction (and yt-dlp's own handlers) can't swallow it.
+    """
+
+
+def _init_worker():
+    """Pre-import yt-dlp and load extractor classes so the first job starts warm"""
+    # Ctrl+C / gunicorn shutdown is handled by the parent
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    import yt_dlp  # noqa: F401
+    from yt_dlp.extractor import gen_extractor_classes
+    from yt_dlp.extractor.youtube import YoutubeIE  # noqa: F401
+    import info_extraction  # noqa: F401
+
+    gen_extractor_classes()
+
+
+def _raise_timeout(signum, frame):
+    raise ExtractionTimeout("Video information request timed out. Please try again.")
+
+
+def _extract_in_worker(url, timeout, max_result_bytes, throttle_state=None, egress_name=None):
+    """Worker entry point: extract, compact and size-check the info dict
+
+    Returns (payload, error, attempts, started) rather than raising, so the
+    parent gets the strategy attempt records and start time either way.
+    """
+    from info_extraction import extract_video_info
+
+    started = time.time()
+    # Back off exactly as much as the parent currently would
+    throttle.restore(throttle_state or {})
+    attempts = []
+    # Interrupt the extraction (sleeps and socket reads included) when the budget
+    # runs out, instead of leaving a wedged worker behind. POSIX only.
+    use_alarm = hasattr(signal, 'setitimer')
+    if use_alarm:
+        signal.signal(signal.SIGALRM, _raise_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        info = extract_video_info(url, attempts, egress_name)
+    except (ExtractionTimeout, Exception) as e:
+        return None, str(e), attempts, started
+    finally:
+        if use_alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    # Only the fields the app reads, with formats packed into columns (see compact_info)
+    payload = compact_info.pack(info)
+    if len(payload) > max_result_bytes:
+        return None, f"Video information is too large to process ({len(payload) // 1024} KB).", attempts, started
+    return payload, None, attempts, started
+
+
+def _ping():
+    return os.getpid()
+
+
+def get_pool():
+    """Get the shared process pool, creating it on first use"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn, not fork: the parent is a threaded web server
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(
+                max_workers=EXTRACTION_WORKERS,
+                mp_context=context,
+                initializer=_init_worker
+            )
+            print(f"Started extraction pool with {EXTRACTION_WORKERS} workers")
+        return _pool
+
+
+def warm_up():
+    """Start every worker process now rather than on the first /api/info call"""
+    pool = get_pool()
+    futures = [pool.submit(_ping) for _ in range(EXTRACTION_WORKERS)]
+    for future in futures:
+        try:
+            future.result(timeout=60)
+        except Exception as e:
+            print(f"Extraction worker warm-up failed: {e}")
+
+
+def _recycle_pool(pool):
+    """Replace a pool whose workers are stuck or dead"""
+    global _pool
+    with _pool_lock:
+        if _pool is not pool:
+            return  # Another thread already replaced it
+        _pool = None
+    # A worker that ignored its alarm (e.g. Windows) has to be killed outright
+    for process in list((getattr(pool, '_processes', None) or {}).values()):
+        try:
+            process.terminate()
+        except Exception:
+            pass
+    pool.shutdown(wait=False, cancel_futures=True)
+    print("Extraction pool recycled")
+
+
+def extract(url, attempts=None):
+    """Extract video information in a worker process
+
+    Strategy attempt records from the worker are appended to ``attempts``.
+    """
+    pool = get_pool()
+    future = None
+    submitted = time.time()
+    try:
+        future = pool.submit(_extract_in_worker, url, EXTRACTION_TIMEOUT, EXTRACTION_MAX_RESULT_BYTES,
+                             throttle.snapshot(), egress.pool.choose().name)
+        payload, error, worker_attempts, started = future.result(timeout=EXTRACTION_TIMEOUT + TIMEOUT_GRACE)
+    except FutureTimeoutError:
+        future.cancel()
+        _recycle_pool(pool)
+        raise Exception("Video information request timed out. Please try again.")
+    except BrokenProcessPool:
+        _recycle_pool(pool)
+        raise Exception("Video information worker crashed. Please try again.")
+    
+    metrics.QUEUE_WAIT_SECONDS.observe(max(started - submitted, 0), queue='extraction_pool')
+    # Throttling and egress health seen by the worker update the shared state here too
+    for attempt in worker_attempts:
+        if attempt['signal']:
+            throttle.get(attempt['client']).record_signal(attempt['signal'])
+        elif attempt['outcome'] == 'success':
+            throttle.record_success(attempt['client'])
+        if attempt['egress_result']:
+            egress.pool.record(attempt['egress'], attempt['egress_result'])
+    if attempts is not None:
+        attempts.extend(worker_attempts)
+    if error:
+        raise Exception(error)
+    return compact_info.unpack(payload)
+
+
+def shutdown():
+    """Stop the worker processes"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
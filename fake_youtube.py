@@ -0,0 +1,485 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for YouTube used by the benchmark and load-test tools
+
+Provides:
+  * MediaServer - a threaded HTTP server serving synthetic progressive and
+    DASH-style (video-only / audio-only) formats, with Range support and an
+    optional per-connection bandwidth cap
+  * FakeYouTubeIE - a yt-dlp extractor that answers for
+    https://www.youtube.com/watch?v=bench<6 chars> URLs and points every
+    format at the MediaServer
+  * install() - registers FakeYouTubeIE ahead of yt-dlp's own extractors
+  * ForwardProxy - a plain HTTP forward proxy for exercising EGRESS_PROXIES,
+    optionally answering every request with an error status (e.g. 429)
+  * WebhookReceiver - records webhook callbacks and checks their signatures,
+    optionally failing the first few deliveries to exercise retries
+
+Nothing here touches the network; real YouTube URLs keep using yt-dlp's
+YoutubeIE.
+"""
+
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import shutil
+import string
+import subprocess
+import tempfile
+import threading
+import time
+from http.client import HTTPConnection
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from yt_dlp import YoutubeDL
+from yt_dlp.extractor.common import InfoExtractor
+
+# Synthetic formats: (format_id, ext, height, vcodec, acodec, share of the size budget)
+FORMATS = [
+    ('18', 'mp4', 360, 'avc1.42001E', 'mp4a.40.2', 0.25),
+    ('134', 'mp4', 360, 'avc1.4d401e', 'none', 0.15),
+    ('136', 'mp4', 720, 'avc1.4d401f', 'none', 0.35),
+    ('137', 'mp4', 1080, 'avc1.640028', 'none', 0.6),
+    ('140', 'm4a', None, 'none', 'mp4a.40.2', 0.05),
+]
+CHUNK_SIZE = 64 * 1024
+# Like YouTube's automatic captions: every translation language in every subtitle format
+CAPTION_LANGUAGES = 150
+CAPTION_EXTS = ('json3', 'srv1', 'srv2', 'srv3', 'ttml', 'vtt')
+THUMBNAILS = 40
+
+
+def random_video_id():
+    """An 11-character id the fake extractor (and is_valid_youtube_url) accepts"""
+    return 'bench' + ''.join(random.choices(string.ascii_letters + string.digits, k=6))
+
+
+def video_url(video_id=None):
+    return f'https://www.youtube.com/watch?v={video_id or random_video_id()}'
+
+
+class MediaLibrary:
+    """Synthetic media files for every fake format
+
+    With FFmpeg the files are real, mergeable H.264/AAC streams; without it
+    they are random bytes of the right size (fine for download benchmarks,
+    but they can't be merged).
+    """
+
+    def __init__(self, size_mb=20, duration=30, ffmpeg_path=None, directory=None):
+        self.size_bytes = int(size_mb * 1024 * 1024)
+        self.duration = duration
+        self.ffmpeg_path = ffmpeg_path
+        self.directory = directory or tempfile.mkdtemp(prefix='vozila_fake_media_')
+        self.files = {}
+
+    def build(self):
+        for format_id, ext, height, vcodec, acodec, share in FORMATS:
+            path = os.path.join(self.directory, f'{format_id}.{ext}')
+            target = max(int(self.size_bytes * share), 16 * 1024)
+            if self.ffmpeg_path:
+                self._encode(path, height, vcodec != 'none', acodec != 'none', target)
+            else:
+                self._random_file(path, target)
+            self.files[format_id] = path
+        return self
+
+    def _random_file(self, path, size):
+        block = os.urandom(1024 * 1024)
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                f.write(block[:min(remaining, len(block))])
+                remaining -= len(block)
+
+    def _encode(self, path, height, has_video, has_audio, target_size):
+        # Pick bitrates so the encoded file lands near its share of the size budget
+        total_kbps = max(int(target_size * 8 / self.duration / 1000), 64)
+        audio_kbps = 128 if has_audio else 0
+        video_kbps = max(total_kbps - audio_kbps, 50)
+        cmd = [self.ffmpeg_path, '-y', '-loglevel', 'error']
+        if has_video:
+            width = int((height or 360) * 16 / 9) // 2 * 2
+            cmd += ['-f', 'lavfi', '-i', f'testsrc2=size={width}x{height or 360}:rate=30']
+        if has_audio:
+            cmd += ['-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=44100']
+        cmd += ['-t', str(self.duration)]
+        if has_video:
+            cmd += ['-c:v', 'libx264', '-preset', 'ultrafast', '-pix_fmt', 'yuv420p',
+                    '-b:v', f'{video_kbps}k', '-maxrate', f'{video_kbps}k', '-bufsize', f'{video_kbps * 2}k']
+        else:
+            cmd += ['-vn']
+        if has_audio:
+            cmd += ['-c:a', 'aac', '-b:a', f'{audio_kbps}k']
+        else:
+            cmd += ['-an']
+        cmd.append(path)
+        subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+
+    def size(self, format_id):
+        return os.path.getsize(self.files[format_id])
+
+    def cleanup(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class _MediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeYouTube/1.0'
+
+    PATH_RE = re.compile(r'^/media/(?P<video_id>[\w-]+)/(?P<format_id>\w+)\.\w+$')
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def _serve(self, send_body):
+        match = self.PATH_RE.match(self.path.split('?')[0])
+        library = self.server.library
+        if not match or match.group('format_id') not in library.files:
+            self.send_error(404)
+            return
+
+        self.server.count_request()
+        path = library.files[match.group('format_id')]
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        status = 200
+
+        range_header = self.headers.get('Range')
+        if range_header:
+            range_match = re.match(r'bytes=(\d*)-(\d*)', range_header)
+            if range_match and (range_match.group(1) or range_match.group(2)):
+                if range_match.group(1):
+                    start = int(range_match.group(1))
+                    if range_match.group(2):
+                        end = min(int(range_match.group(2)), size - 1)
+                else:  # suffix range: last N bytes
+                    start = max(size - int(range_match.group(2)), 0)
+                if start >= size:
+                    self.send_response(416)
+                    self.send_header('Content-Range', f'bytes */{size}')
+                    self.send_header('Content-Length', '0')
+                    self.end_headers()
+                    return
+                status = 206
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'video/mp4' if path.endswith('.mp4') else 'audio/mp4')
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Content-Length', str(end - start + 1))
+        if status == 206:
+            self.send_header('Content-Range', f'bytes {start}-{end}/{size}')
+        self.end_headers()
+        if not send_body:
+            return
+
+        bandwidth = self.server.bandwidth
+        sent = 0
+        started = time.perf_counter()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                try:
+                    self.wfile.write(chunk)
+                except (BrokenPipeError, ConnectionResetError):
+                    return
+                remaining -= len(chunk)
+                sent += len(chunk)
+                self.server.count_bytes(len(chunk))
+                if bandwidth:
+                    # Sleep off whatever we're ahead of the configured rate
+                    ahead = sent / bandwidth - (time.perf_counter() - started)
+                    if ahead > 0:
+                        time.sleep(ahead)
+
+
+class MediaServer(ThreadingHTTPServer):
+    """Threaded HTTP server for a MediaLibrary"""
+
+    daemon_threads = True
+
+    def __init__(self, library, host='127.0.0.1', port=0, bandwidth=0):
+        super().__init__((host, port), _MediaHandler)
+        self.library = library
+        self.bandwidth = bandwidth  # bytes/sec per connection, 0 = unlimited
+        self.requests = 0
+        self.bytes_sent = 0
+        self._stats_lock = threading.Lock()
+
+    @property
+    def base_url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def count_request(self):
+        with self._stats_lock:
+            self.requests += 1
+
+    def count_bytes(self, n):
+        with self._stats_lock:
+            self.bytes_sent += n
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-media-server', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _ProxyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'FakeProxy/1.0'
+
+    # Hop-by-hop headers aren't forwarded
+    HOP_HEADERS = {'connection', 'keep-alive', 'proxy-connection', 'proxy-authorization',
+                   'te', 'trailer', 'transfer-encoding', 'upgrade'}
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self._forward()
+
+    def do_GET(self):
+        self._forward()
+
+    def _forward(self):
+        self.server.count_request()
+        if self.server.fail_with:
+            body = f'{self.server.fail_with} from proxy'.encode()
+            self.send_response(self.server.fail_with)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+            return
+
+        # Forward proxies receive absolute URIs
+        target = urlsplit(self.path)
+        if target.scheme != 'http' or not target.hostname:
+            self.send_error(400, 'Only absolute http:// URIs are supported')
+            return
+        path = target.path or '/'
+        if target.query:
+            path += '?' + target.query
+        headers = {k: v for k, v in self.headers.items() if k.lower() not in self.HOP_HEADERS}
+        upstream = HTTPConnection(target.hostname, target.port or 80, timeout=30)
+        try:
+            upstream.request(self.command, path, headers=headers)
+            response = upstream.getresponse()
+            self.send_response(response.status)
+            for key, value in response.getheaders():
+                if key.lower() not in self.HOP_HEADERS:
+                    self.send_header(key, value)
+            self.end_headers()
+            while self.command != 'HEAD':
+                chunk = response.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            return
+        finally:
+            upstream.close()
+
+
+class ForwardProxy(ThreadingHTTPServer):
+    """HTTP forward proxy that counts requests and can simulate a throttled IP"""
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, fail_with=None):
+        super().__init__((host, port), _ProxyHandler)
+        self.fail_with = fail_with  # status to answer every request with, None = forward
+        self.requests = 0
+        self._stats_lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}'
+
+    def count_request(self):
+        with self._stats_lock:
+            self.requests += 1
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-forward-proxy', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class _WebhookHandler(BaseHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        status = self.server.receive(body, self.headers)
+        self.send_response(status)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+
+class WebhookReceiver(ThreadingHTTPServer):
+    """Webhook endpoint that keeps every event it accepts
+
+    ``fail_first`` deliveries are answered with 503 before any is accepted.
+    With a ``secret``, requests whose signature doesn't match get a 401.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, secret=None, fail_first=0):
+        super().__init__((host, port), _WebhookHandler)
+        self.secret = secret
+        self.fail_first = fail_first
+        self.events = []        # accepted JSON bodies, in arrival order
+        self.attempts = 0       # every POST, including rejected ones
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f'http://{self.server_address[0]}:{self.server_address[1]}/hook'
+
+    def receive(self, body, headers):
+        with self._lock:
+            self.attempts += 1
+            if self.attempts <= self.fail_first:
+                return 503
+        if self.secret is not None:
+            expected = 'sha256=' + hmac.new(self.secret.encode(), f"{headers.get('X-Vozila-Timestamp')}.".encode() + body,
+                                            hashlib.sha256).hexdigest()
+            if not hmac.compare_digest(expected, headers.get('X-Vozila-Signature') or ''):
+                return 401
+        with self._lock:
+            self.events.append(dict(json.loads(body), delivery_id=headers.get('X-Vozila-Delivery')))
+        return 204
+
+    def wait_for(self, event, download_id, timeout=30):
+        """The accepted event for a job, waiting for it to arrive; None on timeout"""
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._lock:
+                for received in self.events:
+                    if received['event'] == event and received['download_id'] == download_id:
+                        return received
+            time.sleep(0.05)
+        return None
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, name='fake-webhook-receiver', daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeYouTubeIE(InfoExtractor):
+    """Answers for benchmark video ids and serves formats from the MediaServer"""
+
+    IE_NAME = 'fakeyoutube'
+    IE_DESC = False
+    _VALID_URL = r'https?://(?:www\.|m\.)?youtube\.com/watch\?v=(?P<id>bench[0-9A-Za-z_-]{6})'
+
+    # Set by install()
+    media_server = None
+    extract_delay = 0.0  # seconds of simulated network wait per extraction
+    extract_cpu = 0.0    # seconds of simulated CPU-bound work per extraction
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        cls = type(self)
+        if cls.extract_delay:
+            time.sleep(cls.extract_delay)
+        if cls.extract_cpu:
+            # Busy loop holding the GIL, like yt-dlp's JSON walking and JS parsing
+            deadline = time.perf_counter() + cls.extract_cpu
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+
+        library = cls.media_server.library
+        base_url = cls.media_server.base_url
+        duration = library.duration
+        formats = []
+        for format_id, ext, height, vcodec, acodec, _share in FORMATS:
+            size = library.size(format_id)
+            fmt = {
+                'format_id': format_id,
+                'url': f'{base_url}/media/{video_id}/{format_id}.{ext}',
+                'ext': ext,
+                'vcodec': vcodec,
+                'acodec': acodec,
+                'filesize': size,
+                'tbr': round(size * 8 / duration / 1000, 1),
+                'http_headers': {'User-Agent': 'FakeYouTube benchmark'},
+            }
+            if height:
+                fmt.update({'height': height, 'width': int(height * 16 / 9), 'fps': 30})
+            if vcodec == 'none':
+                fmt['abr'] = 128
+            formats.append(fmt)
+
+        # Never downloaded, but they make the info dict as heavy as a real one
+        captions = {
+            f'l{i:03d}': [{'ext': ext, 'name': f'Language {i}',
+                           'url': f'{base_url}/captions/{video_id}?lang=l{i:03d}&fmt={ext}&tlang=l{i:03d}'}
+                          for ext in CAPTION_EXTS]
+            for i in range(CAPTION_LANGUAGES)
+        }
+        thumbnails = [{'id': str(i), 'url': f'{base_url}/thumbnail/{video_id}/{i}.jpg', 'preference': i - THUMBNAILS}
+                      for i in range(THUMBNAILS)]
+        return {
+            'id': video_id,
+            'title': f'Benchmark video {video_id}',
+            'description': 'Synthetic video served by the Vozila benchmark. ' * 40,
+            'duration': duration,
+            'view_count': 0,
+            'uploader': 'Vozila benchmark',
+            'thumbnail': f'{base_url}/thumbnail/{video_id}.jpg',
+            'thumbnails': thumbnails,
+            'automatic_captions': captions,
+            'formats': formats,
+        }
+
+
+_original_add_default_info_extractors = YoutubeDL.add_default_info_extractors
+
+
+def _add_default_info_extractors(self):
+    # Fake extractor first so it wins over YoutubeIE for bench ids
+    self.add_info_extractor(FakeYouTubeIE())
+    _original_add_default_info_extractors(self)
+
+
+def install(media_server, extract_delay=0.0, extract_cpu=0.0):
+    """Register FakeYouTubeIE with every YoutubeDL created from now on"""
+    FakeYouTubeIE.media_server = media_server
+    FakeYouTubeIE.extract_delay = extract_delay
+    FakeYouTubeIE.extract_cpu = extract_cpu
+    YoutubeDL.add_default_info_extractors = _add_default_info_extractors
+
+
+def uninstall():
+    YoutubeDL.add_default_info_extractors = _original_add_default_info_extractors
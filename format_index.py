@@ -0,0 +1,136 @@
+"""
+Resolve quality tiers to concrete format IDs from an info dict
+
+get_format_selector() builds selector strings like
+'bestvideo[height<=720]+bestaudio/best[height<=720][ext=mp4]/best[height<=720]'
+that yt-dlp parses and evaluates against the whole format list for every
+download. FormatIndex walks an info dict's ``formats`` once and resolves every
+tier at the same time, following the same rules as those selectors: with
+FFmpeg, best video-only stream under the height cap plus best audio-only
+stream, else the best muxed MP4, else any muxed format; without FFmpeg, muxed
+formats only.
+
+yt-dlp sorts ``formats`` worst to best, so the best format matching a filter
+is the last one, which is also how yt-dlp's ``best*`` selectors pick.
+/api/info uses the result to report the qualities a video really has (with
+sizes), and downloads ask for the exact IDs first with the generic selector
+as fallback.
+"""
+
+from format_selector import get_format_selector
+
+# Height caps of the quality tiers offered in the UI; None = no cap
+TIER_HEIGHTS = {'144p': 144, '360p': 360, '480p': 480, '720p': 720, '1080p': 1080, 'best': None}
+QUALITIES = ('audio',) + tuple(TIER_HEIGHTS)
+
+
+def format_bytes(fmt, duration):
+    """filesize, filesize_approx or tbr * duration, or None"""
+    size = fmt.get('filesize') or fmt.get('filesize_approx')
+    if size:
+        return size
+    if fmt.get('tbr') and duration:
+        return int(fmt['tbr'] * 1000 / 8 * duration)
+    return None
+
+
+def _has_video(fmt):
+    return fmt.get('vcodec') not in (None, 'none') or (fmt.get('height') and fmt.get('vcodec') != 'none')
+
+
+def _has_audio(fmt):
+    return fmt.get('acodec') not in (None, 'none')
+
+
+class FormatIndex:
+    """Best format per tier and stream kind, built in one pass over the formats"""
+
+    def __init__(self, info):
+        self.duration = info.get('duration') or 0
+        self.video_only = {}   # tier -> format
+        self.muxed = {}
+        self.muxed_mp4 = {}
+        self.audio = {}        # 'any' / 'm4a' / 'mp3' -> format
+
+        for fmt in info.get('formats') or []:
+            if fmt.get('format_id') is None:
+                continue
+            video, audio = _has_video(fmt), _has_audio(fmt)
+            if audio and not video:
+                self.audio['any'] = fmt
+                if fmt.get('ext') in ('m4a', 'mp3'):
+                    self.audio[fmt['ext']] = fmt
+                continue
+            if not video:
+                continue
+            height = fmt.get('height')
+            for tier, cap in TIER_HEIGHTS.items():
+                # Like yt-dlp's [height<=N] filter, an unknown height doesn't match a cap
+                if cap is not None and (height is None or height > cap):
+                    continue
+                if audio:
+                    self.muxed[tier] = fmt
+                    if fmt.get('ext') == 'mp4':
+                        self.muxed_mp4[tier] = fmt
+                else:
+                    self.video_only[tier] = fmt
+
+    def resolve(self, quality, ffmpeg_available=True):
+        """Formats the quality's selector would pick, as a list (two when merging), or None"""
+        if quality == 'audio':
+            fmt = self.audio.get('m4a') or self.audio.get('mp3') or self.audio.get('any')
+            return [fmt] if fmt else None
+        tier = quality if quality in TIER_HEIGHTS else 'best'
+        if ffmpeg_available and tier in self.video_only and 'any' in self.audio:
+            return [self.video_only[tier], self.audio['any']]
+        fmt = self.muxed_mp4.get(tier) or self.muxed.get(tier)
+        return [fmt] if fmt else None
+
+    def size(self, quality, ffmpeg_available=True):
+        """Estimated bytes to download for a quality, or None if any stream's size is unknown"""
+        sizes = [format_bytes(fmt, self.duration) for fmt in self.resolve(quality, ffmpeg_available) or []]
+        return sum(sizes) if sizes and all(sizes) else None
+
+    def describe(self, quality, ffmpeg_available=True):
+        """Summary of the resolved formats for /api/info, or None if the tier isn't available"""
+        formats = self.resolve(quality, ffmpeg_available)
+        if not formats:
+            return None
+        video = next((fmt for fmt in formats if _has_video(fmt)), None)
+        return {
+            'quality': quality,
+            'format_id': '+'.join(fmt['format_id'] for fmt in formats),
+            'height': video.get('height') if video else None,
+            'ext': 'mp4' if len(formats) > 1 else formats[0].get('ext'),
+            'filesize': self.size(quality, ffmpeg_available),
+            'needs_merging': len(formats) > 1,
+        }
+
+    def available(self, ffmpeg_available=True):
+        """describe() for every tier the video has, dropping tiers that resolve to the same formats as a lower one"""
+        qualities = []
+        seen = set()
+        for quality in QUALITIES:
+            described = self.describe(quality, ffmpeg_available)
+            if not described:
+                continue
+            # 'best' is always listed; other capped tiers only when they add something
+            if described['format_id'] in seen and quality != 'best':
+                continue
+            seen.add(described['format_id'])
+            qualities.append(described)
+        return qualities
+
+
+def selector(quality, ffmpeg_available, format_id=None):
+    """Format selector for a download: the exact IDs first, the generic tier selector as fallback"""
+    generic = get_format_selector(quality, ffmpeg_available)
+    return f'{format_id}/{generic}' if format_id else generic
+
+
+def cached_quality(summary, quality):
+    """describe() output for a quality from a cached /api/info summary, or None"""
+    for described in (summary or {}).get('qualities') or []:
+        if described['quality'] == quality:
+            return described
+    return None
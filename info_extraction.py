@@ -0,0 +1,242 @@
+"""
+yt-dlp info extraction strategies used by /api/info
+
+Kept free of Flask imports so the same code can run inside the request thread
+or in a warm extraction worker process (see extraction_pool.py).
+"""
+
+import time
+
+import egress
+import throttle
+import ydl_pool
+
+# Most effective strategies based on latest yt-dlp research
+INFO_STRATEGIES = [
+    {
+        'name': 'tv_embedded_optimized',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'tv_embedded',
+                    'player_skip': 'webpage',
+                    'skip': ['dash', 'hls'],
+                    'comment_sort': ['top'],
+                    'max_comments': ['0']
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (SMART-TV; LINUX; Tizen 6.0) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/4.0 Chrome/76.0.3809.146 TV Safari/537.36',
+                'Accept': '*/*',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Connection': 'keep-alive',
+                'Cache-Control': 'no-cache'
+            },
+            'retries': 1,
+            'socket_timeout': 30
+        }
+    },
+    {
+        'name': 'android_testsuite',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'android_testsuite',
+                    'player_skip': 'webpage',
+                    'skip': ['dash', 'hls'],
+                    'include_live_dash': False
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'com.google.android.youtube/17.36.4 (Linux; U; Android 12; SM-G998B) gzip',
+                'Accept': '*/*',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'X-YouTube-Client-Name': '30',
+                'X-YouTube-Client-Version': '17.36.4'
+            },
+            'retries': 1
+        }
+    },
+    {
+        'name': 'web_embedded_fresh',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'web_embedded',
+                    'player_skip': 'webpage',
+                    'skip': ['dash', 'hls']
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Referer': 'https://www.youtube.com/embed/',
+                'Origin': 'https://www.youtube.com',
+                'Sec-Fetch-Dest': 'iframe',
+                'Sec-Fetch-Mode': 'navigate'
+            },
+            'retries': 1
+        }
+    },
+    {
+        'name': 'ios_music',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'ios_music',
+                    'player_skip': 'webpage'
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'com.google.ios.youtubemusic/4.57.1 (iPhone14,3; U; CPU iOS 15_6 like Mac OS X)',
+                'Accept': '*/*',
+                'Accept-Language': 'en-US,en;q=0.9'
+            },
+            'retries': 1
+        }
+    },
+    {
+        'name': 'mweb_tier1',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'mweb',
+                    'player_skip': 'webpage',
+                    'skip': ['dash', 'hls']
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Referer': 'https://m.youtube.com/'
+            },
+            'retries': 1
+        }
+    },
+    {
+        'name': 'web_safari_fallback',
+        'config': {
+            'quiet': True,
+            'no_warnings': True,
+            'extract_flat': False,
+            'force_json': True,
+            'extractor_args': {
+                'youtube': {
+                    'player_client': 'web_safari',
+                    'player_skip': 'configs',
+                    'skip': ['dash']
+                }
+            },
+            'http_headers': {
+                'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
+                'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
+                'Accept-Language': 'en-US,en;q=0.9',
+                'Referer': 'https://www.youtube.com/'
+            },
+            'retries': 1
+        }
+    }
+]
+
+
+def extract_video_info(url, attempts=None, egress_name=None):
+    """Get video information with advanced bot protection bypass
+
+    If ``attempts`` is a list, a record of every strategy attempt (name,
+    client, egress, outcome, throttling signal, start time, duration and the
+    backoff delay before it) is appended to it. ``egress_name`` pins the
+    first attempt to an egress; otherwise the healthiest one is used.
+    """
+    route = egress.pool.get(egress_name) if egress_name else None
+    route = route or egress.pool.choose()
+    age_restricted = False
+    
+    for strategy in INFO_STRATEGIES:
+        if not route.available():
+            # Ejected after throttling on an earlier strategy
+            route = egress.pool.choose()
+        client = egress.throttle_key(throttle.client_type(strategy['config']), route)
+        egress_result = None
+        delay = 0
+        signal = None
+        attempt_started = time.time()
+        outcome = 'failure'
+        try:
+            print(f"Trying strategy {strategy['name']}")
+            
+            # No delay unless this client type is currently being throttled
+            delay = throttle.wait(client)
+            
+            attempt_started = time.time()
+            # Reuse a warm instance so connections and player JS carry across requests
+            with ydl_pool.lease(strategy['name'], {**strategy['config'], **route.params}) as ydl:
+                info = ydl.extract_info(url, download=False)
+                outcome = 'empty'
+                if info and 'title' in info:
+                    print(f"Strategy {strategy['name']} succeeded!")
+                    outcome = 'success'
+                    throttle.record_success(client)
+                    egress_result = 'success'
+                    egress.pool.record(route, egress_result)
+                    return info
+                    
+        except Exception as e:
+            error_msg = str(e)
+            print(f"Strategy {strategy['name']} failed: {error_msg[:100]}...")
+            signal = throttle.record_error(client, error_msg)
+            egress_result = egress.pool.record_error(route, error_msg)
+            
+            # Check if we should continue or abort
+            if 'private' in error_msg.lower() and 'video' in error_msg.lower():
+                # Private video - no point trying other strategies without cookies
+                raise Exception("This video is private. Please upload YouTube cookies to access it.")
+            elif ('unavailable' in error_msg.lower() and 'video' in error_msg.lower()
+                  and 'try again later' not in error_msg.lower()):
+                # Video unavailable - no point trying other strategies
+                # ("This content isn't available, try again later" is rate limiting, not a dead video)
+                raise Exception("Video is unavailable. It may be deleted, blocked, or region-restricted.")
+            elif 'confirm your age' in error_msg.lower():
+                # Other clients can sometimes get past the age gate, so keep going
+                age_restricted = True
+            
+            continue
+        finally:
+            if attempts is not None:
+                attempts.append({
+                    'strategy': strategy['name'],
+                    'client': client,
+                    'egress': route.name,
+                    'egress_result': egress_result,
+                    'outcome': outcome,
+                    'signal': signal,
+                    'started': attempt_started,
+                    'seconds': time.time() - attempt_started,
+                    'delay': delay,
+                })
+    
+    # If all strategies fail, provide helpful error
+    if age_restricted:
+        raise Exception("This video is age-restricted. Please upload YouTube cookies from an account that can view it.")
+    raise Exception("All extraction strategies failed. This video may require cookies, be age-restricted, private, or unavailable in your region. Please try uploading YouTube cookies or try a different video.")
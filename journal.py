@@ -0,0 +1,138 @@
+"""
+On-disk journal of download jobs, so work survives restarts
+
+Every job gets a small JSON file in JOB_JOURNAL_DIR that is rewritten
+(atomically) whenever the job changes state. After a crash or redeploy the
+next process finds the jobs that were still queued or running and submits
+them again with the same download id and output directory. yt-dlp then
+resumes from the ``.part`` files already on disk (continuedl) instead of
+starting at byte zero. Finished jobs are reloaded too, so their files can
+still be fetched from /api/download/<id>.
+
+Uploaded cookies are never written to the journal; a resumed job runs
+without them.
+"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+
+JOB_JOURNAL_DIR = os.getenv('JOB_JOURNAL_DIR', os.path.join(tempfile.gettempdir(), 'vozila_jobs'))
+JOB_JOURNAL_ENABLED = os.getenv('JOB_JOURNAL_ENABLED', 'true').lower() == 'true'
+JOB_JOURNAL_MAX_AGE = float(os.getenv('JOB_JOURNAL_MAX_AGE', 3600))  # older entries aren't resumed
+
+UNFINISHED_STATUSES = ('queued', 'running')
+
+_entries = {}
+_lock = threading.Lock()
+
+
+def _path(download_id):
+    return os.path.join(JOB_JOURNAL_DIR, f'{download_id}.json')
+
+
+def _write(entry):
+    path = _path(entry['download_id'])
+    tmp = f'{path}.{os.getpid()}.tmp'
+    try:
+        os.makedirs(JOB_JOURNAL_DIR, exist_ok=True)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(entry, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"Failed to write job journal for {entry['download_id']}: {e}")
+
+
+def record(download_id, **fields):
+    """Create or update a job's entry and persist it"""
+    if not JOB_JOURNAL_ENABLED:
+        return
+    with _lock:
+        entry = _entries.setdefault(download_id, {'download_id': download_id, 'created': time.time()})
+        entry.update(fields, updated=time.time())
+        _write(entry)
+
+
+def remove(download_id):
+    with _lock:
+        _entries.pop(download_id, None)
+    for path in (_path(download_id), _path(download_id) + '.lock'):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def claim(download_id):
+    """Take ownership of a journaled job; False if another live process has it
+
+    Several workers (gunicorn) can start at once; the lock file makes sure only
+    one of them resumes each job.
+    """
+    if not JOB_JOURNAL_ENABLED:
+        return True
+    lock_path = _path(download_id) + '.lock'
+    for _ in range(2):
+        try:
+            os.makedirs(JOB_JOURNAL_DIR, exist_ok=True)
+            fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                with open(lock_path, encoding='utf-8') as f:
+                    owner = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                owner = 0
+            if owner == os.getpid():
+                return True
+            if owner and _pid_alive(owner):
+                return False
+            # Left behind by a dead process
+            try:
+                os.remove(lock_path)
+            except OSError:
+                pass
+            continue
+        except OSError as e:
+            # Without a usable journal nothing else can resume the job either
+            print(f"Failed to lock job journal for {download_id}: {e}")
+            return True
+        with os.fdopen(fd, 'w') as f:
+            f.write(str(os.getpid()))
+        return True
+    return False
+
+
+def load():
+    """Journal entries from disk that are recent enough to act on; stale ones are deleted"""
+    if not JOB_JOURNAL_ENABLED or not os.path.isdir(JOB_JOURNAL_DIR):
+        return []
+    now = time.time()
+    entries = []
+    for name in os.listdir(JOB_JOURNAL_DIR):
+        if not name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(JOB_JOURNAL_DIR, name), encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if now - entry.get('updated', 0) > JOB_JOURNAL_MAX_AGE:
+            remove(entry.get('download_id') or name[:-5])
+            continue
+        entries.append(entry)
+    with _lock:
+        for entry in entries:
+            _entries.setdefault(entry['download_id'], entry)
+    return sorted(entries, key=lambda entry: entry.get('created', 0))
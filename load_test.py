@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+"""
+Load test for the Vozila HTTP API
+
+Simulates users going through the real flow
+    POST /api/info -> POST /api/download -> GET /api/progress/<id> (polling)
+    -> GET /api/download/<id>
+with an asyncio client, and reports throughput plus p50/p95/p99 latency and a
+latency histogram per endpoint.
+
+By default the app is started in-process with stubbed extraction (the local
+fake YouTube from fake_youtube.py), so no network access is needed:
+    python load_test.py --users 50 --duration 60
+
+Use --target to load an already running server instead; it must be serving
+real videos, so pass one with --video-url.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from collections import defaultdict
+from urllib.parse import urlsplit
+
+from benchmark import AppServer, summarize
+
+# Histogram bucket upper bounds (seconds)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, float('inf'))
+
+
+class EndpointStats:
+    """Latencies and outcomes for one endpoint"""
+
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.bytes = 0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, latency, ok, size=0):
+        if not ok:
+            self.errors += 1
+            return
+        self.latencies.append(latency)
+        self.bytes += size
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if latency <= bound:
+                self.buckets[i] += 1
+                break
+
+    def report(self, wall):
+        return {
+            'requests': len(self.latencies) + self.errors,
+            'errors': self.errors,
+            'throughput_rps': round(len(self.latencies) / wall, 3) if wall else None,
+            'bytes': self.bytes,
+            'latency': summarize(self.latencies),
+            'histogram': {
+                ('+Inf' if bound == float('inf') else str(bound)): count
+                for bound, count in zip(LATENCY_BUCKETS, self.buckets)
+            },
+        }
+
+
+class HTTPError(Exception):
+    pass
+
+
+async def http_request(host, port, method, path, payload=None, timeout=300):
+    """Minimal HTTP/1.1 request over asyncio streams; returns (status, body)"""
+    body = json.dumps(payload).encode() if payload is not None else b''
+    headers = [
+        f'{method} {path} HTTP/1.1',
+        f'Host: {host}:{port}',
+        'Connection: close',
+        'Accept: */*',
+        f'Content-Length: {len(body)}',
+    ]
+    if payload is not None:
+        headers.append('Content-Type: application/json')
+    request = ('\r\n'.join(headers) + '\r\n\r\n').encode() + body
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    try:
+        writer.write(request)
+        await writer.drain()
+
+        status_line = await asyncio.wait_for(reader.readline(), timeout)
+        parts = status_line.decode('latin-1').split(' ', 2)
+        if len(parts) < 2:
+            raise HTTPError(f'Bad status line: {status_line!r}')
+        status = int(parts[1])
+
+        response_headers = {}
+        while True:
+            line = await asyncio.wait_for(reader.readline(), timeout)
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+
+        if response_headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size_line = await asyncio.wait_for(reader.readline(), timeout)
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    await reader.readline()
+                    break
+                chunks.append(await asyncio.wait_for(reader.readexactly(size), timeout))
+                await reader.readline()
+            data = b''.join(chunks)
+        elif 'content-length' in response_headers:
+            data = await asyncio.wait_for(reader.readexactly(int(response_headers['content-length'])), timeout)
+        else:
+            data = await asyncio.wait_for(reader.read(), timeout)
+        return status, data
+    finally:
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except (ConnectionError, OSError):
+            pass
+
+
+class LoadTest:
+    def __init__(self, host, port, args, video_url_factory):
+        self.host = host
+        self.port = port
+        self.args = args
+        self.video_url_factory = video_url_factory
+        self.stats = defaultdict(EndpointStats)
+        self.sessions_completed = 0
+        self.sessions_failed = 0
+        self.session_times = []
+        self.qualities = self._parse_mix(args.quality_mix)
+
+    @staticmethod
+    def _parse_mix(mix):
+        choices = []
+        for item in mix.split(','):
+            quality, _, weight = item.partition(':')
+            choices.append((quality.strip(), float(weight or 1)))
+        return choices
+
+    def pick_quality(self):
+        qualities, weights = zip(*self.qualities)
+        return random.choices(qualities, weights=weights)[0]
+
+    async def call(self, endpoint, method, path, payload=None):
+        started = time.perf_counter()
+        try:
+            status, data = await http_request(self.host, self.port, method, path, payload)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, HTTPError, ValueError):
+            self.stats[endpoint].record(time.perf_counter() - started, False)
+            return None, None
+        latency = time.perf_counter() - started
+        self.stats[endpoint].record(latency, status < 500, len(data))
+        return status, data
+
+    async def think(self):
+        if self.args.think_time:
+            await asyncio.sleep(random.uniform(0, 2 * self.args.think_time))
+
+    async def session(self):
+        """One user: look up a video, download it, poll, fetch the file"""
+        started = time.perf_counter()
+        url = self.video_url_factory()
+
+        status, _ = await self.call('POST /api/info', 'POST', '/api/info', {'url': url})
+        if status != 200:
+            return False
+        await self.think()
+
+        status, data = await self.call('POST /api/download', 'POST', '/api/download',
+                                       {'url': url, 'quality': self.pick_quality()})
+        if status != 200:
+            return False
+        download_id = json.loads(data)['download_id']
+
+        deadline = time.perf_counter() + self.args.job_timeout
+        state = None
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            status, data = await self.call('GET /api/progress/<id>', 'GET', f'/api/progress/{download_id}')
+            if status == 200:
+                state = json.loads(data)['status']
+                if state in ('completed', 'error'):
+                    break
+        if state != 'completed':
+            return False
+
+        # The merged file can be registered shortly after 'completed'
+        while time.perf_counter() < deadline:
+            status, _ = await self.call('GET /api/download/<id>', 'GET', f'/api/download/{download_id}')
+            if status == 200:
+                self.session_times.append(time.perf_counter() - started)
+                return True
+            await asyncio.sleep(self.args.poll_interval)
+        return False
+
+    async def user(self, index, stop_at):
+        # Spread user start times across the ramp-up period
+        if self.args.ramp_up:
+            await asyncio.sleep(self.args.ramp_up * index / max(self.args.users, 1))
+        while time.perf_counter() < stop_at:
+            if self.args.sessions and self.sessions_completed + self.sessions_failed >= self.args.sessions:
+                return
+            ok = await self.session()
+            if ok:
+                self.sessions_completed += 1
+            else:
+                self.sessions_failed += 1
+            await self.think()
+
+    async def run(self):
+        started = time.perf_counter()
+        stop_at = started + self.args.duration
+        await asyncio.gather(*(self.user(i, stop_at) for i in range(self.args.users)))
+        wall = time.perf_counter() - started
+        return {
+            'wall_seconds': round(wall, 3),
+            'sessions': {
+                'completed': self.sessions_completed,
+                'failed': self.sessions_failed,
+                'throughput_per_sec': round(self.sessions_completed / wall, 3) if wall else None,
+                'duration': summarize(self.session_times),
+            },
+            'endpoints': {endpoint: stats.report(wall) for endpoint, stats in sorted(self.stats.items())},
+        }
+
+
+def print_table(results):
+    print(f"\n{'endpoint':28s} {'reqs':>7s} {'err':>5s} {'rps':>8s} {'p50':>8s} {'p95':>8s} {'p99':>8s}")
+    for endpoint, data in results['endpoints'].items():
+        latency = data['latency']
+        print(f"{endpoint:28s} {data['requests']:>7d} {data['errors']:>5d} {data['throughput_rps'] or 0:>8.2f} "
+              f"{latency.get('p50') or 0:>8.3f} {latency.get('p95') or 0:>8.3f} {latency.get('p99') or 0:>8.3f}")
+    sessions = results['sessions']
+    print(f"\nsessions: {sessions['completed']} completed, {sessions['failed']} failed, "
+          f"{sessions['throughput_per_sec']} /s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=10, help='concurrent simulated users')
+    parser.add_argument('--duration', type=float, default=60, help='test length in seconds')
+    parser.add_argument('--sessions', type=int, default=0, help='stop after this many sessions (0 = run for --duration)')
+    parser.add_argument('--ramp-up', type=float, default=5, help='seconds over which users start')
+    parser.add_argument('--think-time', type=float, default=1.0, help='mean pause between user actions')
+    parser.add_argument('--poll-interval', type=float, default=1.0, help='progress polling interval (the web UI uses 1s)')
+    parser.add_argument('--job-timeout', type=float, default=600)
+    parser.add_argument('--quality-mix', default='audio:3,720p:4,best:3', help='quality:weight list')
+    parser.add_argument('--size-mb', type=float, default=10, help='synthetic video size (in-process mode)')
+    parser.add_argument('--bandwidth', type=float, default=0, help='media server cap per connection in MB/s (in-process mode)')
+    parser.add_argument('--extract-delay', type=float, default=0.2, help='stubbed extraction wait (in-process mode)')
+    parser.add_argument('--target', help='base URL of a running server instead of the in-process app')
+    parser.add_argument('--video-url', help='video to request when using --target')
+    parser.add_argument('--output', default='load_test_report.json')
+    args = parser.parse_args()
+
+    media_server = app_server = library = None
+    if args.target:
+        if not args.video_url:
+            parser.error('--target needs --video-url')
+        parsed = urlsplit(args.target)
+        host, port = parsed.hostname, parsed.port or 80
+        video_url_factory = lambda: args.video_url  # noqa: E731
+    else:
+        import fake_youtube
+        import source
+
+        print("Starting in-process app with stubbed extraction...", file=sys.stderr)
+        library = fake_youtube.MediaLibrary(args.size_mb, 30, source.get_ffmpeg_path()).build()
+        media_server = fake_youtube.MediaServer(library, bandwidth=int(args.bandwidth * 1024 * 1024)).start()
+        fake_youtube.install(media_server, extract_delay=args.extract_delay)
+        app_server = AppServer().start()
+        host, port = '127.0.0.1', app_server.server.server_port
+        video_url_factory = fake_youtube.video_url
+
+    try:
+        results = asyncio.run(LoadTest(host, port, args, video_url_factory).run())
+    finally:
+        if app_server:
+            app_server.stop()
+            media_server.stop()
+            library.cleanup()
+
+    report = {'config': vars(args), 'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_table(results)
+    print(f"\nReport written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""
+Minimal Prometheus-style metrics for /metrics
+
+Counters, gauges and histograms with labels, rendered in the Prometheus text
+exposition format. Written in-house so the app doesn't need prometheus_client.
+Values are per process: with several gunicorn workers each one reports its own.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+# Default histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    if value == -math.inf:
+        return '-Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+
+class _Metric:
+    type = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        if not self.labelnames and self.type in ('counter', 'gauge'):
+            self._values[()] = 0
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _labels(self, key, extra=()):
+        return tuple(zip(self.labelnames, key)) + tuple(extra)
+
+    def samples(self):
+        """(suffix, labels, value) tuples for the exposition format"""
+        with self._lock:
+            return [('', self._labels(key), value) for key, value in sorted(self._values.items())]
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for suffix, labels, value in self.samples():
+            lines.append(f'{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+        return lines
+
+
+class Counter(_Metric):
+    """Monotonically increasing value"""
+
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+
+    type = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets"""
+
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['buckets'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a with-block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self):
+        samples = []
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, state['buckets']):
+                    cumulative += count
+                    samples.append(('_bucket', self._labels(key, [('le', _format_value(float(bound)))]), cumulative))
+                samples.append(('_sum', self._labels(key), state['sum']))
+                samples.append(('_count', self._labels(key), state['count']))
+        return samples
+
+
+class Callback(_Metric):
+    """Metric whose samples are computed at scrape time
+
+    ``func`` returns an iterable of (labels dict, value) pairs.
+    """
+
+    def __init__(self, name, documentation, func, type='gauge'):
+        super().__init__(name, documentation)
+        self.type = type
+        self.func = func
+
+    def samples(self):
+        return [('', tuple(sorted(labels.items())), value) for labels, value in self.func()]
+
+
+class Registry:
+    """Collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def get(self, name):
+        return self._metrics.get(name)
+
+    def render(self):
+        """Prometheus text exposition format"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            try:
+                lines.extend(metric.render())
+            except Exception as e:
+                # One broken callback shouldn't take the whole scrape down
+                print(f"Failed to render metric {metric.name}: {e}")
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def counter(name, documentation, labelnames=()):
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name, documentation, labelnames=()):
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def callback(name, documentation, func, type='gauge'):
+    return REGISTRY.register(Callback(name, documentation, func, type))
+
+
+def render():
+    return REGISTRY.render()
+
+
+# Pipeline metrics shared across modules
+EXTRACTION_SECONDS = histogram(
+    'vozila_extraction_seconds',
+    'Total info extraction time, strategy fallbacks included',
+    ['backend', 'outcome'])
+EXTRACTION_ATTEMPT_SECONDS = histogram(
+    'vozila_extraction_attempt_seconds',
+    'Time spent in a single info extraction strategy attempt',
+    ['strategy', 'outcome'])
+QUEUE_WAIT_SECONDS = histogram(
+    'vozila_queue_wait_seconds',
+    'Time between submitting work and a worker starting it',
+    ['queue'])
+INFO_CACHE_REQUESTS = counter(
+    'vozila_info_cache_requests_total',
+    'Video info cache lookups',
+    ['result'])
+DOWNLOAD_JOBS = counter(
+    'vozila_download_jobs_total',
+    'Finished download attempts by code path and outcome',
+    ['path', 'outcome'])
+DOWNLOAD_JOB_SECONDS = histogram(
+    'vozila_download_job_seconds',
+    'Wall time of a download attempt, merge included',
+    ['path', 'outcome'])
+DOWNLOAD_ERRORS = counter(
+    'vozila_download_errors_total',
+    'Download failures by error class',
+    ['path', 'error_class'])
+DOWNLOAD_BYTES = counter(
+    'vozila_download_bytes_total',
+    'Bytes of completed media streams downloaded from upstream')
+DOWNLOAD_SPEED = histogram(
+    'vozila_download_speed_bytes_per_second',
+    'Average download speed of a completed media stream',
+    buckets=(64e3, 256e3, 512e3, 1e6, 2e6, 5e6, 10e6, 25e6, 50e6, 100e6, 250e6))
+POSTPROCESS_SECONDS = histogram(
+    'vozila_postprocess_seconds',
+    'yt-dlp post-processor run time (Merger is the FFmpeg stream merge)',
+    ['postprocessor'])
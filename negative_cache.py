@@ -0,0 +1,101 @@
+"""
+Negative cache for videos that can't be fetched
+
+Private, unavailable (deleted/terminated) and age-restricted videos fail the
+same way every time, yet each request for one used to go through the whole
+extraction fallback chain again. Failures are now classified and remembered
+under the canonical video ID (``neg_<id>`` in the app cache), so /api/info and
+/api/download answer straight away until the class's TTL runs out. Requests
+that bring their own cookies skip the negative cache, since cookies are what
+turns these errors into successes.
+"""
+
+import hashlib
+import os
+import re
+from urllib.parse import urlparse, parse_qs
+
+import metrics
+
+NEGATIVE_CACHE_TTLS = {
+    'private': int(os.getenv('NEGATIVE_CACHE_PRIVATE_TTL', 1800)),         # owners do make videos public again
+    'unavailable': int(os.getenv('NEGATIVE_CACHE_UNAVAILABLE_TTL', 3600)),
+    'age_restricted': int(os.getenv('NEGATIVE_CACHE_AGE_RESTRICTED_TTL', 86400)),
+}
+
+# Checked in order; fragments are matched against the lowercased error message
+ERROR_CLASSES = (
+    ('age_restricted', ('sign in to confirm your age', 'age-restricted', 'age restricted',
+                        'inappropriate for some users')),
+    ('private', ('private video', 'video is private')),
+    ('unavailable', ('video unavailable', 'video is unavailable', 'has been removed',
+                     'account associated with this video has been terminated', 'video is no longer available')),
+)
+
+MESSAGES = {
+    'private': "This video is private. Please upload YouTube cookies to access it.",
+    'unavailable': "Video is unavailable. It may be deleted, blocked, or region-restricted.",
+    'age_restricted': "This video is age-restricted. Please upload YouTube cookies from an account that can view it.",
+}
+
+NEGATIVE_CACHE_HITS = metrics.counter(
+    'vozila_negative_cache_hits_total',
+    'Requests answered from the negative cache by error class',
+    ['error_class'])
+NEGATIVE_CACHE_STORES = metrics.counter(
+    'vozila_negative_cache_stores_total',
+    'Failures remembered in the negative cache by error class',
+    ['error_class'])
+
+VIDEO_ID_RE = re.compile(r'(?:youtu\.be/|/(?:embed|v|shorts|live)/)([0-9A-Za-z_-]{11})')
+
+
+def classify(error_message):
+    """Negative-cacheable error class of an error message, or None"""
+    message = (error_message or '').lower()
+    if 'try again later' in message:
+        # "Video unavailable. This content isn't available, try again later" is rate limiting
+        return None
+    if 'all extraction strategies failed' in message:
+        # Catch-all that lists every possible cause; nothing is known for sure
+        return None
+    for error_class, fragments in ERROR_CLASSES:
+        if any(fragment in message for fragment in fragments):
+            return error_class
+    return None
+
+
+def video_key(url):
+    """Canonical ID for a URL, so watch/short/embed links to one video share an entry"""
+    parsed = urlparse(url if '://' in url else f'https://{url}')
+    query = parse_qs(parsed.query)
+    if query.get('v'):
+        return query['v'][0][:11]
+    match = VIDEO_ID_RE.search(parsed.netloc + parsed.path)
+    if match:
+        return match.group(1)
+    if query.get('list'):
+        return f"list_{query['list'][0]}"
+    return hashlib.md5(url.encode()).hexdigest()
+
+
+def cache_key(url):
+    return f'neg_{video_key(url)}'
+
+
+def lookup(cache, url):
+    """Cached failure for a URL as {'error_class', 'error'}, or None"""
+    entry = cache.get(cache_key(url))
+    if entry:
+        NEGATIVE_CACHE_HITS.inc(error_class=entry['error_class'])
+    return entry
+
+
+def remember(cache, url, error_message):
+    """Store a failure if it is one that will repeat; returns the error class or None"""
+    error_class = classify(error_message)
+    if error_class:
+        cache.set(cache_key(url), {'error_class': error_class, 'error': MESSAGES[error_class]},
+                  timeout=NEGATIVE_CACHE_TTLS[error_class])
+        NEGATIVE_CACHE_STORES.inc(error_class=error_class)
+    return error_class
@@ -0,0 +1,199 @@
+"""
+Speculative prefetch of the likely download right after /api/info
+
+Most users click download within seconds of seeing the video info. With
+PREFETCH_ENABLED, a successful info lookup starts fetching the formats the
+most requested quality resolves to: the first PREFETCH_BYTES of the first
+stream, or the whole stream for audio. It runs on its own thread with a small
+bandwidth weight, and only while no real download is waiting for a worker.
+
+If /api/download for the same URL and quality arrives, the prefetched files
+(``.part`` files, or a finished audio file) are moved into the job's output
+directory and yt-dlp continues from them. A different quality, or nobody
+asking within PREFETCH_TTL seconds, discards them.
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import metrics
+
+PREFETCH_ENABLED = os.getenv('PREFETCH_ENABLED', 'false').lower() == 'true'
+PREFETCH_BYTES = int(os.getenv('PREFETCH_BYTES', 8 * 1024 * 1024))    # per job; audio is fetched whole
+PREFETCH_TTL = float(os.getenv('PREFETCH_TTL', 60))                   # seconds before an unclaimed prefetch is dropped
+PREFETCH_MAX_ACTIVE = int(os.getenv('PREFETCH_MAX_ACTIVE', 2))
+PREFETCH_BANDWIDTH_WEIGHT = float(os.getenv('PREFETCH_BANDWIDTH_WEIGHT', 0.25))  # vs 1.0 for a real job
+PREFETCH_DEFAULT_QUALITY = os.getenv('PREFETCH_DEFAULT_QUALITY', 'best')  # until downloads say otherwise
+PREFETCH_DIR = os.getenv('PREFETCH_DIR', os.path.join(tempfile.gettempdir(), 'vozila_prefetch'))
+
+# How long a claiming download waits for a cancelled prefetch to let go of its files
+STOP_TIMEOUT = 5.0
+
+PREFETCHES = metrics.counter(
+    'vozila_prefetch_total',
+    'Speculative prefetches by outcome (promoted, mismatch, expired, failed)',
+    ['result'])
+PREFETCH_BYTES_TOTAL = metrics.counter(
+    'vozila_prefetch_bytes_total',
+    'Bytes fetched speculatively, by whether a download used them',
+    ['result'])
+
+
+class PrefetchStopped(Exception):
+    """Raised from the progress hook to end a prefetch"""
+
+
+class Prefetch:
+    """One speculative fetch into its own directory"""
+
+    def __init__(self, url, quality):
+        self.url = url
+        self.quality = quality
+        self.limit = None if quality == 'audio' else PREFETCH_BYTES
+        self.job_id = f'prefetch-{os.urandom(6).hex()}'
+        os.makedirs(PREFETCH_DIR, exist_ok=True)
+        self.directory = tempfile.mkdtemp(prefix='job_', dir=PREFETCH_DIR)
+        self.started = time.time()
+        self.bytes = 0
+        self.error = None
+        self.cancelled = threading.Event()
+        self.thread = None
+        self.timer = None
+        self._seen = {}
+
+    def hook(self, d):
+        """yt-dlp progress hook: counts bytes, stops at the limit or when cancelled"""
+        if d['status'] == 'downloading':
+            downloaded = d.get('downloaded_bytes') or 0
+            self.bytes += max(downloaded - self._seen.get(d.get('filename'), 0), 0)
+            self._seen[d.get('filename')] = downloaded
+        if self.cancelled.is_set():
+            raise PrefetchStopped("Prefetch cancelled")
+        if d['status'] == 'downloading' and self.limit is not None and self.bytes >= self.limit:
+            raise PrefetchStopped("Prefetch limit reached")
+
+    def files(self):
+        return [os.path.join(self.directory, name) for name in os.listdir(self.directory)]
+
+    def stop(self):
+        """Cancel and wait for the fetch thread; False if it didn't let go in time"""
+        self.cancelled.set()
+        if self.timer:
+            self.timer.cancel()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(STOP_TIMEOUT)
+            return not self.thread.is_alive()
+        return True
+
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class Prefetcher:
+    """Running and finished prefetches by URL"""
+
+    def __init__(self, max_active=PREFETCH_MAX_ACTIVE, ttl=PREFETCH_TTL):
+        self.max_active = max_active
+        self.ttl = ttl
+        self.prefetches = {}
+        self.choices = Counter()
+        self._lock = threading.Lock()
+
+    def record_choice(self, quality):
+        """Count a quality picked at /api/download"""
+        with self._lock:
+            self.choices[quality] += 1
+
+    def likely_quality(self):
+        with self._lock:
+            most_common = self.choices.most_common(1)
+        return most_common[0][0] if most_common else PREFETCH_DEFAULT_QUALITY
+
+    def start(self, url, quality, run):
+        """Run run(prefetch) on a background thread unless url is already prefetched or too many are running
+
+        ``run`` downloads into prefetch.directory with prefetch.hook as a
+        progress hook; PrefetchStopped out of it is the normal way to end.
+        """
+        with self._lock:
+            active = sum(1 for prefetch in self.prefetches.values() if prefetch.thread.is_alive())
+            if url in self.prefetches or active >= self.max_active:
+                return None
+            prefetch = Prefetch(url, quality)
+            prefetch.thread = threading.Thread(target=self._run, args=(prefetch, run), name='prefetch', daemon=True)
+            prefetch.timer = threading.Timer(self.ttl, self.discard, args=(url, 'expired'))
+            prefetch.timer.daemon = True
+            self.prefetches[url] = prefetch
+        prefetch.thread.start()
+        prefetch.timer.start()
+        return prefetch
+
+    def _run(self, prefetch, run):
+        try:
+            run(prefetch)
+        except PrefetchStopped:
+            pass
+        except Exception as e:
+            prefetch.error = str(e)
+            print(f"Prefetch of {prefetch.url} failed: {e}")
+            self.discard(prefetch.url, 'failed')
+
+    def promote(self, url, quality, output_path):
+        """Move a matching prefetch's files into output_path; True if anything was moved"""
+        with self._lock:
+            prefetch = self.prefetches.pop(url, None)
+        if prefetch is None:
+            return False
+        stopped = prefetch.stop()
+        if not stopped or prefetch.error or prefetch.quality != quality:
+            self._drop(prefetch, 'mismatch' if stopped and not prefetch.error else 'failed')
+            return False
+        moved = 0
+        for path in prefetch.files():
+            shutil.move(path, os.path.join(output_path, os.path.basename(path)))
+            moved += 1
+        prefetch.remove()
+        result = 'promoted' if moved else 'failed'
+        PREFETCHES.inc(result=result)
+        PREFETCH_BYTES_TOTAL.inc(prefetch.bytes, result='used' if moved else 'wasted')
+        print(f"Promoted prefetch of {url} ({prefetch.bytes // 1024} KB)" if moved else f"Prefetch of {url} had no files")
+        return bool(moved)
+
+    def discard(self, url, result):
+        with self._lock:
+            prefetch = self.prefetches.pop(url, None)
+        if prefetch is not None:
+            prefetch.stop()
+            self._drop(prefetch, result)
+
+    def _drop(self, prefetch, result):
+        prefetch.remove()
+        PREFETCHES.inc(result=result)
+        PREFETCH_BYTES_TOTAL.inc(prefetch.bytes, result='wasted')
+
+    def active_count(self):
+        with self._lock:
+            return sum(1 for prefetch in self.prefetches.values() if prefetch.thread.is_alive())
+
+    def status(self):
+        now = time.time()
+        with self._lock:
+            prefetches = list(self.prefetches.values())
+        return [{
+            'url': prefetch.url,
+            'quality': prefetch.quality,
+            'bytes': prefetch.bytes,
+            'running': prefetch.thread.is_alive(),
+            'age': round(now - prefetch.started, 1),
+        } for prefetch in prefetches]
+
+
+# Shared prefetcher for the process
+prefetcher = Prefetcher()
+
+metrics.callback('vozila_prefetch_active', 'Speculative prefetches currently fetching',
+                 lambda: [({}, prefetcher.active_count())])
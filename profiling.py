@@ -0,0 +1,200 @@
+"""
+Built-in profilers for diagnosing hot paths in production
+
+py-spy can't be attached on most PaaS hosts, so this module provides:
+  * SamplingProfiler - snapshots every other thread's Python stack via
+    sys._current_frames() at a fixed interval and aggregates the samples
+    into collapsed stacks (flamegraph.pl / speedscope input) or a
+    speedscope JSON document
+  * profile_call() - deterministic cProfile of a single call, used for
+    per-request profiling of /api/info
+
+Both are served from admin-only endpoints; set ADMIN_TOKEN to enable them and
+send it in the X-Admin-Token header.
+"""
+
+import cProfile
+import hmac
+import io
+import json
+import marshal
+import math
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+PROFILE_MAX_SECONDS = float(os.getenv('PROFILE_MAX_SECONDS', 60))
+PROFILE_DEFAULT_INTERVAL = float(os.getenv('PROFILE_DEFAULT_INTERVAL', 0.01))  # seconds between samples
+
+# Leaf frames where a thread is parked rather than running; dropped unless idle=True
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('threading.py', '_wait_for_tstate_lock'),
+    ('selectors.py', 'select'),
+    ('socket.py', 'accept'),
+    ('socket.py', 'readinto'),
+    ('socketserver.py', 'serve_forever'),
+    ('queue.py', 'get'),
+    ('connection.py', '_recv'),
+    ('connection.py', '_poll'),
+}
+
+_profile_lock = threading.Lock()
+# Only one cProfile can be active at a time (sys.monitoring on 3.12+)
+_cprofile_lock = threading.Lock()
+
+
+def check_admin_token(token):
+    """True when profiling is enabled and ``token`` matches ADMIN_TOKEN"""
+    if not ADMIN_TOKEN or not token:
+        return False
+    return hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of all other threads"""
+
+    def __init__(self, interval=PROFILE_DEFAULT_INTERVAL, idle=False):
+        if not math.isfinite(interval):
+            interval = PROFILE_DEFAULT_INTERVAL
+        self.interval = min(max(interval, 0.001), PROFILE_MAX_SECONDS)
+        self.idle = idle
+        self.stacks = Counter()   # (thread name, frame labels root->leaf) -> samples
+        self.frames = {}          # frame label -> (function, file, line)
+        self.samples = 0
+        self.duration = 0.0
+
+    def _sample(self, skip):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident in skip:
+                continue
+            code = frame.f_code
+            if not self.idle and (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            labels = []
+            while frame is not None:
+                code = frame.f_code
+                label = _frame_label(code)
+                if label not in self.frames:
+                    self.frames[label] = (code.co_name, code.co_filename, code.co_firstlineno)
+                labels.append(label)
+                frame = frame.f_back
+            labels.reverse()
+            self.stacks[(names.get(ident, f'thread-{ident}'), tuple(labels))] += 1
+        self.samples += 1
+
+    def run(self, seconds):
+        """Sample for ``seconds``; the calling thread is left out of the profile"""
+        # NaN would never reach the deadline and hold the profile lock for good
+        if not math.isfinite(seconds):
+            seconds = PROFILE_MAX_SECONDS
+        seconds = min(max(seconds, self.interval), PROFILE_MAX_SECONDS)
+        skip = {threading.get_ident()}
+        started = time.perf_counter()
+        deadline = started + seconds
+        next_sample = started
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                break
+            self._sample(skip)
+            # Fixed-rate schedule so slow samples don't stretch the interval
+            next_sample += self.interval
+            delay = next_sample - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_sample = time.perf_counter()
+        self.duration = time.perf_counter() - started
+        return self
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format: 'thread;frame;...;leaf count'"""
+        lines = []
+        for (thread, labels), count in self.stacks.most_common():
+            lines.append(';'.join((thread,) + labels) + f' {count}')
+        return '\n'.join(lines) + '\n'
+
+    def speedscope(self):
+        """speedscope.app 'sampled' profile, one per thread"""
+        frame_index = {label: i for i, label in enumerate(self.frames)}
+        per_thread = {}
+        for (thread, labels), count in self.stacks.items():
+            profile = per_thread.setdefault(thread, {'samples': [], 'weights': []})
+            profile['samples'].append([frame_index[label] for label in labels])
+            profile['weights'].append(count * self.interval)
+        profiles = []
+        for thread, data in sorted(per_thread.items()):
+            profiles.append({
+                'type': 'sampled',
+                'name': thread,
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': round(sum(data['weights']), 6),
+                'samples': data['samples'],
+                'weights': data['weights'],
+            })
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'shared': {'frames': [{'name': name, 'file': file, 'line': line}
+                                  for name, file, line in self.frames.values()]},
+            'profiles': profiles,
+            'name': f'Vozila sampling profile ({self.duration:.1f}s, {self.samples} samples)',
+            'activeProfileIndex': 0,
+            'exporter': 'vozila-profiling',
+        }
+
+
+def sample(seconds, interval=PROFILE_DEFAULT_INTERVAL, idle=False):
+    """Run one sampling session; returns None if another one is in progress"""
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    try:
+        return SamplingProfiler(interval, idle).run(seconds)
+    finally:
+        _profile_lock.release()
+
+
+def profile_call(func, *args, **kwargs):
+    """Run func under cProfile; returns (result, error, profile), or None if a profile is already running"""
+    if not _cprofile_lock.acquire(blocking=False):
+        return None
+    try:
+        profile = cProfile.Profile()
+        result = error = None
+        profile.enable()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            error = e
+        finally:
+            profile.disable()
+        return result, error, profile
+    finally:
+        _cprofile_lock.release()
+
+
+def profile_text(profile, sort='cumulative', limit=60):
+    """Top functions of a cProfile run as text"""
+    out = io.StringIO()
+    stats = pstats.Stats(profile, stream=out)
+    stats.sort_stats(sort).print_stats(limit)
+    return out.getvalue()
+
+
+def profile_dump(profile):
+    """Marshalled pstats data, loadable with pstats/snakeviz"""
+    return marshal.dumps(pstats.Stats(profile).stats)
+
+
+def speedscope_json(profiler):
+    return json.dumps(profiler.speedscope(), separators=(',', ':'))
@@ -0,0 +1,167 @@
+"""
+Cost-aware download scheduling: shortest job first, with aging
+
+Download jobs used to get a thread each the moment they were submitted, so a
+3MB audio job and a 4GB playlist competed on equal terms. Jobs now queue for
+MAX_CONCURRENT_DOWNLOADS worker threads and the cheapest job goes first.
+
+A job's cost is its estimated run time in seconds: bytes to download (from
+the selected format's filesize/tbr in the cached info dict, or a per-tier
+bitrate guess) over SCHEDULER_ASSUMED_BYTES_PER_SECOND, plus a fixed
+overhead per entry for extraction and merging. Waiting ages a job: its
+priority is ``cost - SCHEDULER_AGING_RATE * seconds_waited``, so a large job
+is only overtaken by jobs submitted within cost / AGING_RATE seconds after
+it and can't starve. Because every queued job ages at the same rate, that
+order never changes while jobs wait and the heap can be keyed once, on
+``cost + AGING_RATE * submitted``.
+"""
+
+import heapq
+import itertools
+import os
+import threading
+import time
+
+import metrics
+from format_index import FormatIndex
+
+MAX_CONCURRENT_DOWNLOADS = int(os.getenv('MAX_CONCURRENT_DOWNLOADS', 10))
+SCHEDULER_AGING_RATE = float(os.getenv('SCHEDULER_AGING_RATE', 1.0))   # cost seconds forgiven per second waited
+SCHEDULER_ASSUMED_BYTES_PER_SECOND = float(os.getenv('SCHEDULER_ASSUMED_BYTES_PER_SECOND', 5 * 1024 * 1024))
+SCHEDULER_JOB_OVERHEAD = float(os.getenv('SCHEDULER_JOB_OVERHEAD', 5.0))  # seconds per entry (extract, merge)
+SCHEDULER_DEFAULT_DURATION = float(os.getenv('SCHEDULER_DEFAULT_DURATION', 300))  # when nothing is cached
+
+# Rough combined bytes/sec per tier when formats don't report sizes
+TIER_BYTES_PER_SECOND = {
+    'audio': 16e3,
+    '144p': 24e3,
+    '360p': 70e3,
+    '480p': 130e3,
+    '720p': 300e3,
+    '1080p': 600e3,
+    'best': 1.5e6,
+}
+
+SCHEDULED_JOBS = metrics.counter(
+    'vozila_scheduler_jobs_total',
+    'Download jobs submitted to the scheduler by cost source',
+    ['estimate'])
+
+
+def estimate_sizes(info):
+    """Per-quality size estimates for an info dict, compact enough to cache"""
+    entries = [entry for entry in info.get('entries') or [] if entry] if 'entries' in info else [info]
+    indexes = [FormatIndex(entry) for entry in entries]
+    sizes = {}
+    for quality in TIER_BYTES_PER_SECOND:
+        total = 0
+        for index, entry in zip(indexes, entries):
+            size = index.size(quality)
+            if size is None:
+                size = (entry.get('duration') or SCHEDULER_DEFAULT_DURATION) * TIER_BYTES_PER_SECOND[quality]
+            total += size
+        sizes[quality] = int(total)
+    duration = sum(entry.get('duration') or 0 for entry in entries)
+    return {'entries': max(len(entries), 1), 'bytes': sizes, 'duration': duration or None}
+
+
+def estimate_cost(sizes, quality, seconds=None):
+    """Estimated run time in seconds of a job, from estimate_sizes() output or None
+
+    ``seconds`` is the clip length for time-range jobs, which only fetch that share of the streams.
+    """
+    rate = TIER_BYTES_PER_SECOND.get(quality, TIER_BYTES_PER_SECOND['best'])
+    if sizes:
+        size = sizes['bytes'].get(quality, sizes['bytes']['best'])
+        entries = sizes['entries']
+        if seconds is not None:
+            duration = sizes.get('duration')
+            size = size * min(seconds / duration, 1.0) if duration else seconds * rate
+    else:
+        size = (SCHEDULER_DEFAULT_DURATION if seconds is None else seconds) * rate
+        entries = 1
+    return entries * SCHEDULER_JOB_OVERHEAD + size / SCHEDULER_ASSUMED_BYTES_PER_SECOND
+
+
+class DownloadScheduler:
+    """Priority queue of download jobs drained by a fixed set of worker threads"""
+
+    def __init__(self, workers=MAX_CONCURRENT_DOWNLOADS, aging_rate=SCHEDULER_AGING_RATE):
+        self.workers = max(workers, 1)
+        self.aging_rate = aging_rate
+        self._queue = []          # (key, seq, job_id, cost, submitted, func)
+        self._seq = itertools.count()
+        self._running = {}        # job_id -> (cost, started)
+        self._condition = threading.Condition()
+        self._threads_pid = None
+
+    def _ensure_workers(self):
+        # Threads don't survive a fork (gunicorn --preload), so start them per process
+        if self._threads_pid == os.getpid():
+            return
+        self._threads_pid = os.getpid()
+        for i in range(self.workers):
+            threading.Thread(target=self._work, name=f'download-worker-{i + 1}', daemon=True).start()
+
+    def submit(self, job_id, func, cost):
+        """Queue func() to run on a worker thread"""
+        submitted = time.time()
+        key = cost + self.aging_rate * submitted
+        with self._condition:
+            self._ensure_workers()
+            heapq.heappush(self._queue, (key, next(self._seq), job_id, cost, submitted, func))
+            self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                _, _, job_id, cost, submitted, func = heapq.heappop(self._queue)
+                self._running[job_id] = (cost, time.time())
+            try:
+                func()
+            except Exception as e:
+                print(f"Download job {job_id} crashed: {e}")
+            finally:
+                with self._condition:
+                    self._running.pop(job_id, None)
+
+    def position(self, job_id):
+        """1-based place of a queued job in line, or None once it is running"""
+        with self._condition:
+            order = sorted(self._queue)
+        for i, entry in enumerate(order, 1):
+            if entry[2] == job_id:
+                return i
+        return None
+
+    def status(self):
+        now = time.time()
+        with self._condition:
+            queued = sorted(self._queue)
+            running = dict(self._running)
+        return {
+            'workers': self.workers,
+            'running': [{'job_id': job_id, 'cost': round(cost, 1), 'running_for': round(now - started, 1)}
+                        for job_id, (cost, started) in running.items()],
+            'queued': [{'job_id': job_id, 'cost': round(cost, 1), 'waited': round(now - submitted, 1)}
+                       for _, _, job_id, cost, submitted, _ in queued],
+        }
+
+    def queued_count(self):
+        with self._condition:
+            return len(self._queue)
+
+    def running_count(self):
+        with self._condition:
+            return len(self._running)
+
+
+# Shared scheduler for the process
+download_queue = DownloadScheduler()
+
+metrics.callback('vozila_scheduler_queued_jobs', 'Download jobs waiting for a worker',
+                 lambda: [({}, download_queue.queued_count())])
+metrics.callback('vozila_scheduler_running_jobs', 'Download jobs running on a worker',
+                 lambda: [({}, download_queue.running_count())])
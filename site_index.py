@@ -0,0 +1,243 @@
+"""
+Index of the sites yt-dlp can extract from
+
+/api/supported-sites used to build a YoutubeDL and call its private
+_get_extractors(), which instantiates every extractor (about 1800), and then
+cut the result to 50. The index is built once instead, at warm-up, from the
+extractor classes themselves: name, description, whether it works and its
+_VALID_URL patterns. Nothing gets instantiated and no URL regex is compiled
+at build time. The index serves paged, searchable listings and answers
+"which extractor handles this URL" for /api/info.
+
+Finding the extractor for a URL the way yt-dlp does means calling
+suitable() on each class in order, which compiles and runs up to ~1800
+regexes. So the index parses each pattern (without compiling it) and finds
+the literal text any match must contain, e.g. "vimeo.com/". Each pattern is
+filed under the rarest LITERAL_GRAM-character slice of that text. For an
+alternation such as "(?:dailymotion|dai)\.", it is filed under one slice from
+each branch. A URL then only runs the patterns filed under one of its own
+slices, plus the extractors whose suitable() does more than match _VALID_URL
+or whose patterns have no usable literal. Candidates are tried in yt-dlp's order, so
+the answer is the same as a full scan. The catch-all generic extractor is
+left out, so a URL nothing specific handles matches nothing.
+"""
+
+import os
+import threading
+import time
+from collections import Counter
+
+try:
+    from re import _parser as sre_parse
+    from re._constants import LITERAL, SUBPATTERN, MAX_REPEAT, MIN_REPEAT, AT, BRANCH
+except ImportError:  # Python < 3.11
+    import sre_parse
+    from sre_constants import LITERAL, SUBPATTERN, MAX_REPEAT, MIN_REPEAT, AT, BRANCH
+
+SITE_INDEX_PAGE_SIZE = int(os.getenv('SITE_INDEX_PAGE_SIZE', 50))
+SITE_INDEX_MAX_PAGE_SIZE = 500
+
+# Length of the literal slices patterns are filed under
+LITERAL_GRAM = 4
+GENERIC_KEY = 'Generic'
+
+
+def required_literals(pattern):
+    """What every match of a regex must contain, as a list of parts; [] if it can't be parsed
+
+    A part is a casefolded literal run, or a tuple of alternatives (each a
+    list of parts) for an alternation, at least one of which must match.
+    """
+    try:
+        parsed = sre_parse.parse(pattern)
+    except Exception:
+        return []
+    return _parts(parsed)
+
+
+def _parts(items):
+    parts = []
+
+    def flush(run):
+        if len(run) >= LITERAL_GRAM:
+            parts.append(''.join(run).casefold())
+        return []
+
+    def walk(items, run):
+        for op, av in items:
+            if op is LITERAL:
+                run.append(chr(av))
+            elif op is AT:
+                # Anchors match no characters; the text on both sides is adjacent
+                continue
+            elif op is SUBPATTERN:
+                # A plain group is part of the sequence, so the run carries on into it
+                run = walk(av[-1], run)
+            else:
+                run = flush(run)
+                if op in (MAX_REPEAT, MIN_REPEAT) and av[0] >= 1:
+                    # Repeated at least once: the body's own parts are required
+                    flush(walk(av[2], []))
+                elif op is BRANCH:
+                    parts.append(tuple(_parts(alternative) for alternative in av[1]))
+        return run
+
+    flush(walk(items, []))
+    return parts
+
+
+def _runs(parts):
+    """Every literal run in parts, alternatives included"""
+    for part in parts:
+        if isinstance(part, str):
+            yield part
+        else:
+            for alternative in part:
+                yield from _runs(alternative)
+
+
+def _grams(text):
+    return {text[i:i + LITERAL_GRAM] for i in range(len(text) - LITERAL_GRAM + 1)}
+
+
+def _cover(parts, counts):
+    """(cost, slices) with at least one slice in every match, the least shared such set; None if there is none"""
+    best = None
+    for part in parts:
+        if isinstance(part, str):
+            gram = min(_grams(part), key=lambda gram: (counts[gram], gram))
+            cover = (counts[gram], {gram})
+        else:
+            covers = [_cover(alternative, counts) for alternative in part]
+            if not covers or None in covers:
+                continue
+            cover = (sum(cost for cost, _ in covers), set().union(*(grams for _, grams in covers)))
+        if best is None or cover[0] < best[0]:
+            best = cover
+    return best
+
+
+def _plain_suitable():
+    """suitable() implementations that only match _VALID_URL"""
+    from yt_dlp.extractor.common import InfoExtractor
+    plain = {InfoExtractor.suitable.__func__}
+    try:
+        from yt_dlp.extractor.lazy_extractors import LazyLoadExtractor
+        plain.add(LazyLoadExtractor.suitable.__func__)
+    except ImportError:
+        pass
+    return plain
+
+
+class SiteIndex:
+    """Extractor metadata and a literal-slice index over their URL patterns"""
+
+    def __init__(self):
+        self.sites = []          # listed sites, in yt-dlp's order
+        self.classes = []        # every extractor class but the generic one, in yt-dlp's order
+        self.by_gram = {}        # literal slice -> positions in classes
+        self.always = []         # positions checked for every URL
+        self.built_seconds = None
+        self._meta = []          # position in classes -> site dict
+        self._search = []        # (casefolded search text, site) per listed site
+        self._lock = threading.Lock()
+
+    @property
+    def built(self):
+        return self.built_seconds is not None
+
+    def build(self):
+        """Read the extractor classes; safe to call again, only the first call does the work"""
+        with self._lock:
+            if self.built:
+                return
+            started = time.perf_counter()
+            from yt_dlp.extractor import gen_extractor_classes
+            from yt_dlp.utils import variadic
+
+            plain = _plain_suitable()
+            pattern_parts = []  # (position, required parts) per pattern
+            for ie in gen_extractor_classes():
+                key = ie.ie_key()
+                if key == GENERIC_KEY:
+                    continue
+                position = len(self.classes)
+                self.classes.append(ie)
+                patterns = [pattern for pattern in variadic(ie._VALID_URL or ()) if isinstance(pattern, str)]
+                parts = [required_literals(pattern) for pattern in patterns]
+                site = {
+                    'key': key,
+                    'name': ie.IE_NAME,
+                    'description': ie.IE_DESC or None,
+                    'working': ie.working(),
+                    'url_patterns': patterns,
+                }
+                self._meta.append(site)
+                if ie.IE_DESC is not False:  # False marks extractors yt-dlp hides from its own lists
+                    self.sites.append(site)
+                    text = '\n'.join([key, ie.IE_NAME, ie.IE_DESC or ''] + [run for part in parts for run in _runs(part)])
+                    self._search.append((text.casefold(), site))
+                if getattr(ie.suitable, '__func__', None) in plain and patterns:
+                    pattern_parts.extend((position, part) for part in parts)
+                else:
+                    self.always.append(position)
+
+            # File each pattern under its least shared slices, so a URL pulls in few candidates
+            counts = Counter(gram for _, parts in pattern_parts for run in set(_runs(parts)) for gram in _grams(run))
+            covers = {}
+            for position, parts in pattern_parts:
+                cover = _cover(parts, counts)
+                if cover is None:
+                    covers[position] = None
+                elif covers.get(position, ()) is not None:
+                    covers.setdefault(position, set()).update(cover[1])
+            for position, grams in covers.items():
+                if grams is None:
+                    self.always.append(position)
+                    continue
+                for gram in grams:
+                    self.by_gram.setdefault(gram, set()).add(position)
+            self.always.sort()
+            self.built_seconds = time.perf_counter() - started
+            print(f"Indexed {len(self.classes)} extractors ({len(self.always)} always checked) "
+                  f"in {self.built_seconds:.2f}s")
+
+    def candidates(self, url):
+        """Positions of the extractors that might handle url, in yt-dlp's order"""
+        positions = set(self.always)
+        for gram in _grams(url.casefold()):
+            positions.update(self.by_gram.get(gram, ()))
+        return sorted(positions)
+
+    def match(self, url):
+        """Site dict of the extractor yt-dlp would pick for url, or None (only the generic one fits)"""
+        if not self.built:
+            self.build()
+        for position in self.candidates(url):
+            if self.classes[position].suitable(url):
+                return self._meta[position]
+        return None
+
+    def page(self, query='', page=1, per_page=SITE_INDEX_PAGE_SIZE):
+        """One page of the listed sites, filtered by a case-insensitive search"""
+        if not self.built:
+            self.build()
+        per_page = min(max(per_page, 1), SITE_INDEX_MAX_PAGE_SIZE)
+        page = max(page, 1)
+        if query:
+            needle = query.casefold()
+            sites = [site for text, site in self._search if needle in text]
+        else:
+            sites = self.sites
+        start = (page - 1) * per_page
+        return {
+            'sites': sites[start:start + per_page],
+            'total': len(sites),
+            'page': page,
+            'per_page': per_page,
+            'pages': -(-len(sites) // per_page),
+        }
+
+
+# Shared index for the process
+index = SiteIndex()
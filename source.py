@@ -1,22 +1,46 @@
-from flask import Flask, render_template, request, jsonify, send_file, abort
+import time
+_IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Blueprint, Response, render_template, request, jsonify, send_file, abort
 from flask_caching import Cache
-import yt_dlp
 import os
 import re
+import io
 import json
+import math
 import tempfile
 import threading
-import time
 from urllib.parse import urlparse, parse_qs
-import zipfile
 from datetime import datetime, timedelta
 import hashlib
 import uuid
 from dotenv import load_dotenv
-import subprocess
 import sys
 import shutil
-from format_selector import get_format_selector
+import format_index
+from info_extraction import extract_video_info
+import extraction_pool
+import compact_info
+import ydl_pool
+import extraction_cache
+import metrics
+import tracing
+import profiling
+import throttle
+import egress
+import bandwidth
+import scheduler
+import journal
+import negative_cache
+import prefetch
+import webhooks
+import clips
+import cookie_jar
+import transfer
+import site_index
+from warmup import WarmUp
+# yt_dlp, subprocess and zipfile are imported where they are used so that
+# importing this module stays fast on cold starts
 
 # Load environment variables
 load_dotenv()
@@ -24,6 +48,8 @@ load_dotenv()
 # FFmpeg handling functions
 def find_ffmpeg():
     """Find FFmpeg executable in common locations"""
+    import subprocess
+    
     # Check if running on Linux/Unix (Render uses Ubuntu)
     if os.name == 'posix':
         # Linux/Unix paths (Render uses Ubuntu)
@@ -64,8 +90,26 @@ def check_ffmpeg():
     """Check if FFmpeg is available"""
     return find_ffmpeg() is not None
 
+# FFmpeg registry - probed once (during warm-up) instead of on every download
+_ffmpeg_path = None
+_ffmpeg_probed = False
+_ffmpeg_lock = threading.Lock()
+
+def get_ffmpeg_path():
+    """Get the FFmpeg path, probing the common locations only the first time"""
+    global _ffmpeg_path, _ffmpeg_probed
+    with _ffmpeg_lock:
+        if not _ffmpeg_probed:
+            _ffmpeg_path = find_ffmpeg()
+            # yt-dlp's ffmpeg_location must be a real path, not a bare command name
+            if _ffmpeg_path and not os.path.isabs(_ffmpeg_path):
+                _ffmpeg_path = shutil.which(_ffmpeg_path) or _ffmpeg_path
+            _ffmpeg_probed = True
+        return _ffmpeg_path
+
 def install_ffmpeg_windows():
     """Install FFmpeg on Windows using winget or chocolatey"""
+    import subprocess
     try:
         # Try winget first
         result = subprocess.run(['winget', 'install', 'ffmpeg', '--accept-source-agreements'], 
@@ -78,69 +122,42 @@ def install_ffmpeg_windows():
     except:
         return False
 
-app = Flask(__name__)
-app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
+# Info extraction backend: 'thread' runs yt-dlp in the request thread,
+# 'process' hands it to a pool of warm worker processes (see extraction_pool.py)
+EXTRACTION_BACKEND = os.getenv('EXTRACTION_BACKEND', 'thread').lower()
+
+# Routes live on a blueprint; create_app() builds the actual Flask app
+bp = Blueprint('main', __name__)
 
 # Caching only (rate limiting removed for open access)
-cache = Cache(app, config={'CACHE_TYPE': 'simple'})
+cache = Cache()
+
+# Background start-up work, reported by /api/ready
+warm_up = WarmUp()
 
 # Global variables for download tracking
 download_progress = {}
 download_files = {}
 
-# Cookie storage for manual uploads
+# download_id -> cookie_jar key of the cookies uploaded for it; each holds a jar reference
 uploaded_cookies = {}
+# download_id -> upload time, for /api/upload-cookies ids that haven't started a job
+cookie_uploads = {}
+# Times a journaled job is resumed after a restart before it is given up on
+JOB_MAX_RESUMES = int(os.getenv('JOB_MAX_RESUMES', 3))
+# Most items (or ids) accepted by one /api/batch/* call
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', 50))
 
-def save_cookies_to_file(cookies_content, download_id):
-    """Save uploaded cookies to a temporary file"""
-    try:
-        # Create cookies directory if it doesn't exist
-        cookies_dir = os.path.join(tempfile.gettempdir(), 'youtube_downloader_cookies')
-        os.makedirs(cookies_dir, exist_ok=True)
-        
-        # Save cookies to a file
-        cookie_file = os.path.join(cookies_dir, f'cookies_{download_id}.txt')
-        
-        # Handle different cookie formats
-        if cookies_content.strip().startswith('{'):
-            # JSON format - convert to Netscape format
-            try:
-                import json
-                cookie_data = json.loads(cookies_content)
-                netscape_content = "# Netscape HTTP Cookie File\n"
-                for cookie in cookie_data:
-                    domain = cookie.get('domain', '.youtube.com')
-                    flag = 'TRUE' if domain.startswith('.') else 'FALSE'
-                    path = cookie.get('path', '/')
-                    secure = 'TRUE' if cookie.get('secure', False) else 'FALSE'
-                    expiration = cookie.get('expirationDate', 0)
-                    name = cookie.get('name', '')
-                    value = cookie.get('value', '')
-                    netscape_content += f"{domain}\t{flag}\t{path}\t{secure}\t{int(expiration)}\t{name}\t{value}\n"
-                
-                with open(cookie_file, 'w', encoding='utf-8') as f:
-                    f.write(netscape_content)
-            except json.JSONDecodeError:
-                # If JSON parsing fails, treat as plain text
-                with open(cookie_file, 'w', encoding='utf-8') as f:
-                    f.write(cookies_content)
-        else:
-            # Assume Netscape format
-            with open(cookie_file, 'w', encoding='utf-8') as f:
-                f.write(cookies_content)
-        
-        return cookie_file
-    except Exception as e:
-        print(f"Error saving cookies: {e}")
-        return None
+def job_cookiejar(download_id):
+    """In-memory cookie jar of a job's uploaded cookies, or None"""
+    return cookie_jar.jars.get(uploaded_cookies.get(download_id))
 
-def cleanup_cookie_file(cookie_file):
-    """Clean up temporary cookie file"""
-    try:
-        if cookie_file and os.path.exists(cookie_file):
-            os.remove(cookie_file)
-    except Exception as e:
-        print(f"Error cleaning up cookie file: {e}")
+def release_cookies(download_id):
+    """Let go of a job's cookies; the shared jar expires once no job uses it"""
+    key = uploaded_cookies.pop(download_id, None)
+    cookie_uploads.pop(download_id, None)
+    if key:
+        cookie_jar.jars.release(key)
 
 class DownloadProgress:
     def __init__(self, download_id):
@@ -151,20 +168,34 @@ class DownloadProgress:
         self.error = None
         self.is_merging = False
         self.merge_progress = 0
+        self.needs_merging = False
+        self.transfer = transfer.TransferStats()
         self.start_time = time.time()
+        self.trace = tracing.current()[0]  # set when the job runs under a trace
+    
+    @property
+    def status(self):
+        return self._status
+    
+    @status.setter
+    def status(self, status):
+        previous = getattr(self, '_status', None)
+        self._status = status
+        # started / merging callbacks; completed / error are sent once the job has finished
+        if status != previous and status in webhooks.PROGRESS_EVENTS and webhooks.dispatcher.callback_for(self.download_id):
+            webhooks.dispatcher.notify(self.download_id, webhooks.PROGRESS_EVENTS[status], progress_payload(self))
         
     def hook(self, d):
+        # Called for every chunk; the job's numbers are only recomputed every PROGRESS_UPDATE_INTERVAL
+        if not self.transfer.record(d):
+            return
+        # When merging, only show 80% during download phase
+        max_progress = 80 if self.needs_merging else 100
         if d['status'] == 'downloading':
-            if 'total_bytes' in d:
-                # When merging, only show 80% during download phase
-                max_progress = 80 if self.will_need_merging() else 100
-                self.progress = int((d['downloaded_bytes'] / d['total_bytes']) * max_progress / 100)
-            elif 'total_bytes_estimate' in d:
-                max_progress = 80 if self.will_need_merging() else 100
-                self.progress = int((d['downloaded_bytes'] / d['total_bytes_estimate']) * max_progress / 100)
+            self.progress = int(self.transfer.fraction * max_progress)
             self.status = 'downloading'
-        elif d['status'] == 'finished':
-            if self.will_need_merging():
+        elif self.transfer.finished:
+            if self.needs_merging:
                 self.progress = 80
                 self.status = 'merging'
                 self.is_merging = True
@@ -172,15 +203,18 @@ class DownloadProgress:
                 self.progress = 100
                 self.status = 'completed'
             self.title = d.get('info_dict', {}).get('title', 'Downloaded')
+        else:
+            # One stream of a merged download is done, the next hasn't started
+            self.progress = int(self.transfer.fraction * max_progress)
     
     def will_need_merging(self):
         """Check if this download will need FFmpeg merging"""
-        # This will be set by the download function
-        return getattr(self, '_needs_merging', False)
+        return self.needs_merging
     
-    def set_merging_needed(self, needs_merging):
-        """Set whether this download needs merging"""
-        self._needs_merging = needs_merging
+    def set_merging_needed(self, needs_merging, total_bytes=None):
+        """Set whether this download needs merging (two streams), and their estimated size if known"""
+        self.needs_merging = bool(needs_merging)
+        self.transfer.expect(2 if self.needs_merging else 1, total_bytes)
     
     def update_merge_progress(self, progress):
         """Update merging progress (0-100)"""
@@ -201,216 +235,137 @@ def is_valid_youtube_url(url):
         r'(https?://)?(www\.)?youtube\.com/playlist\?list=([a-zA-Z0-9_-]+)')
     return youtube_regex.match(url) or playlist_regex.match(url)
 
-def get_video_info(url):
-    """Get video information with advanced bot protection bypass"""
-    
-    # Most effective strategies based on latest yt-dlp research
-    strategies = [
-        {
-            'name': 'tv_embedded_optimized',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'tv_embedded',
-                        'player_skip': 'webpage',
-                        'skip': ['dash', 'hls'],
-                        'comment_sort': ['top'],
-                        'max_comments': ['0']
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (SMART-TV; LINUX; Tizen 6.0) AppleWebKit/537.36 (KHTML, like Gecko) SamsungBrowser/4.0 Chrome/76.0.3809.146 TV Safari/537.36',
-                    'Accept': '*/*',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Connection': 'keep-alive',
-                    'Cache-Control': 'no-cache'
-                },
-                'sleep_interval': 1,
-                'retries': 1,
-                'socket_timeout': 30
-            }
-        },
-        {
-            'name': 'android_testsuite',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'android_testsuite',
-                        'player_skip': 'webpage',
-                        'skip': ['dash', 'hls'],
-                        'include_live_dash': False
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'com.google.android.youtube/17.36.4 (Linux; U; Android 12; SM-G998B) gzip',
-                    'Accept': '*/*',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'X-YouTube-Client-Name': '30',
-                    'X-YouTube-Client-Version': '17.36.4'
-                },
-                'sleep_interval': 2,
-                'retries': 1
-            }
-        },
-        {
-            'name': 'web_embedded_fresh',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'web_embedded',
-                        'player_skip': 'webpage',
-                        'skip': ['dash', 'hls']
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://www.youtube.com/embed/',
-                    'Origin': 'https://www.youtube.com',
-                    'Sec-Fetch-Dest': 'iframe',
-                    'Sec-Fetch-Mode': 'navigate'
-                },
-                'sleep_interval': 3,
-                'retries': 1
-            }
-        },
-        {
-            'name': 'ios_music',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'ios_music',
-                        'player_skip': 'webpage'
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'com.google.ios.youtubemusic/4.57.1 (iPhone14,3; U; CPU iOS 15_6 like Mac OS X)',
-                    'Accept': '*/*',
-                    'Accept-Language': 'en-US,en;q=0.9'
-                },
-                'sleep_interval': 2,
-                'retries': 1
-            }
-        },
-        {
-            'name': 'mweb_tier1',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'mweb',
-                        'player_skip': 'webpage',
-                        'skip': ['dash', 'hls']
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (iPhone; CPU iPhone OS 16_6 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/16.6 Mobile/15E148 Safari/604.1',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://m.youtube.com/'
-                },
-                'sleep_interval': 3,
-                'retries': 1
-            }
-        },
-        {
-            'name': 'web_safari_fallback',
-            'config': {
-                'quiet': True,
-                'no_warnings': True,
-                'extract_flat': False,
-                'force_json': True,
-                'extractor_args': {
-                    'youtube': {
-                        'player_client': 'web_safari',
-                        'player_skip': 'configs',
-                        'skip': ['dash']
-                    }
-                },
-                'http_headers': {
-                    'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/17.0 Safari/605.1.15',
-                    'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8',
-                    'Accept-Language': 'en-US,en;q=0.9',
-                    'Referer': 'https://www.youtube.com/'
-                },
-                'sleep_interval': 4,
-                'retries': 1
-            }
-        }
-    ]
-    
-    import time
-    import random
-    
-    for i, strategy in enumerate(strategies):
+# yt-dlp extractors for the single videos and playlists this app downloads
+SERVED_YOUTUBE_EXTRACTORS = frozenset({
+    'Youtube', 'YoutubeYtBe', 'YoutubeClip', 'YoutubeShortsAudioPivot', 'YoutubePlaylist', 'YoutubeTab',
+})
+YOUTUBE_PLAYLIST_PATH = re.compile(r'/playlist\?(?:[^#]*&)?list=[a-zA-Z0-9_-]+')
+
+def url_error(url):
+    """Why a URL can't be fetched, as a user-facing message; None if it can
+
+    Once the site index is built, a URL one of the video or playlist
+    extractors in SERVED_YOUTUBE_EXTRACTORS takes is accepted even when the
+    regex above misses it (m./music. links), and a link to another supported
+    site says which site it is. Other YouTube extractors (search results,
+    feeds, channel tabs) yield unbounded playlists, so their URLs are not
+    widened; they and anything else go through is_valid_youtube_url as before.
+    """
+    if site_index.index.built:
+        site = site_index.index.match(url if '://' in url else f'https://{url}')
+        if site and site['key'] in SERVED_YOUTUBE_EXTRACTORS:
+            # YoutubeTab also serves channel tabs; only its playlist pages are bounded
+            if site['key'] != 'YoutubeTab' or YOUTUBE_PLAYLIST_PATH.search(url):
+                return None
+        if site and not site['key'].startswith('Youtube') and not is_valid_youtube_url(url):
+            return f"Only YouTube links are supported, this is a {site['name']} link"
+    if not is_valid_youtube_url(url):
+        return 'Invalid YouTube URL'
+    return None
+
+def get_video_info(url, attempts=None):
+    """Get video information using the configured extraction backend"""
+    attempts = [] if attempts is None else attempts
+    started = time.perf_counter()
+    outcome = 'failure'
+    with tracing.traced('extract', backend=EXTRACTION_BACKEND) as span:
         try:
-            print(f"Trying strategy {strategy['name']}")
-            
-            # Progressive delay between attempts
-            if i > 0:
-                delay = random.uniform(2, 5 + i)
-                time.sleep(delay)
-            
-            with yt_dlp.YoutubeDL(strategy['config']) as ydl:
-                info = ydl.extract_info(url, download=False)
-                if info and 'title' in info:
-                    print(f"Strategy {strategy['name']} succeeded!")
-                    return info
-                    
-        except Exception as e:
-            error_msg = str(e)
-            print(f"Strategy {strategy['name']} failed: {error_msg[:100]}...")
-            
-            # Check if we should continue or abort
-            if 'private' in error_msg.lower() and 'video' in error_msg.lower():
-                # Private video - no point trying other strategies without cookies
-                raise Exception("This video is private. Please upload YouTube cookies to access it.")
-            elif 'unavailable' in error_msg.lower() and 'video' in error_msg.lower():
-                # Video unavailable - no point trying other strategies
-                raise Exception("Video is unavailable. It may be deleted, blocked, or region-restricted.")
-            
-            continue
+            if EXTRACTION_BACKEND == 'process':
+                # Run yt-dlp in a warm worker process so slow extractions don't hold the GIL
+                info = extraction_pool.extract(url, attempts)
+            else:
+                info = extract_video_info(url, attempts)
+            outcome = 'success'
+            return info
+        finally:
+            record_extraction_metrics(attempts, outcome, time.perf_counter() - started)
+            trace_extraction_attempts(span, attempts)
+
+def record_extraction_metrics(attempts, outcome, seconds):
+    """Record overall and per-strategy extraction timings"""
+    metrics.EXTRACTION_SECONDS.observe(seconds, backend=EXTRACTION_BACKEND, outcome=outcome)
+    for attempt in attempts:
+        metrics.EXTRACTION_ATTEMPT_SECONDS.observe(attempt['seconds'], strategy=attempt['strategy'], outcome=attempt['outcome'])
+
+def trace_extraction_attempts(span, attempts):
+    """Add strategy attempts (and the delays before them) as child spans"""
+    for attempt in attempts:
+        if attempt['delay']:
+            span.trace.add_span('throttle_wait', attempt['started'] - attempt['delay'], attempt['started'], parent=span,
+                                client=attempt['client'])
+        span.trace.add_span('strategy_attempt', attempt['started'], attempt['started'] + attempt['seconds'], parent=span,
+                            error=None if attempt['outcome'] == 'success' else attempt['outcome'],
+                            strategy=attempt['strategy'], outcome=attempt['outcome'])
+
+def throttle_wait(client, span):
+    """Wait out the client's current backoff before a download, recording it on the trace"""
+    waited = throttle.wait(client)
+    if waited:
+        now = time.time()
+        span.trace.add_span('throttle_wait', now - waited, now, parent=span, client=client)
+    return waited
+
+def record_stream_metrics(d):
+    """Progress hook: count bytes and average speed of each finished media stream"""
+    # Files that were already on disk report 'finished' without an elapsed time
+    if d['status'] != 'finished' or not d.get('elapsed'):
+        return
+    size = d.get('total_bytes') or d.get('downloaded_bytes')
+    if size:
+        metrics.DOWNLOAD_BYTES.inc(size)
+        metrics.DOWNLOAD_SPEED.observe(size / d['elapsed'])
+
+def postprocessor_timer():
+    """Postprocessor hook recording how long each yt-dlp post-processor (e.g. the merge) runs"""
+    started = {}
     
-    # If all strategies fail, provide helpful error
-    raise Exception("All extraction strategies failed. This video may require cookies, be age-restricted, private, or unavailable in your region. Please try uploading YouTube cookies or try a different video.")
+    def hook(d):
+        name = d.get('postprocessor')
+        if d['status'] == 'started':
+            started[name] = time.perf_counter()
+        elif d['status'] == 'finished' and name in started:
+            metrics.POSTPROCESS_SECONDS.observe(time.perf_counter() - started.pop(name), postprocessor=name)
+    return hook
 
-def download_video(url, quality, download_id, output_path):
+def record_download_result(path, outcome, started, error_class=None):
+    """Record a finished download attempt and, for failures, its error class"""
+    metrics.DOWNLOAD_JOBS.inc(path=path, outcome=outcome)
+    metrics.DOWNLOAD_JOB_SECONDS.observe(time.time() - started, path=path, outcome=outcome)
+    if error_class:
+        metrics.DOWNLOAD_ERRORS.inc(path=path, error_class=error_class)
+
+# FFmpeg arguments used when merging separate video and audio streams
+MERGE_POSTPROCESSOR_ARGS = [
+    '-c:v', 'copy',  # Copy video stream (no re-encoding)
+    '-c:a', 'aac',   # Convert audio to AAC
+    '-b:a', '192k',  # Audio bitrate 192k
+    '-movflags', '+faststart'  # Optimize for streaming
+]
+
+def download_video(url, quality, download_id, output_path, clip=None):
     """Download video in background thread"""
+    client = route = None
+    info_reused = False
     try:
         progress_tracker = DownloadProgress(download_id)
         download_progress[download_id] = progress_tracker        # Find FFmpeg path  
-        ffmpeg_path = find_ffmpeg()
+        ffmpeg_path = get_ffmpeg_path()
         
-        # Get format selector using the helper function
-        format_selector = get_format_selector(quality, bool(ffmpeg_path))
+        # Exact format IDs resolved by /api/info when cached, the generic tier selector otherwise
+        resolved = cached_quality(url, quality)
+        format_selector = format_index.selector(quality, bool(ffmpeg_path), resolved and resolved['format_id'])
               # Detect if this format selection will need merging
-        needs_merging = ffmpeg_path and ('+' in format_selector)
-        progress_tracker.set_merging_needed(needs_merging)
+        if resolved:
+            needs_merging = bool(ffmpeg_path) and resolved['needs_merging']
+        else:
+            needs_merging = ffmpeg_path and ('+' in format_selector)
+        # Byte totals for the progress endpoint until the streams report their own (clips fetch only a part)
+        progress_tracker.set_merging_needed(needs_merging, resolved and not clip and resolved['filesize'])
         
         # Enhanced progress hook for FFmpeg merging
         def enhanced_progress_hook(d):
             progress_tracker.hook(d)
-            if d['status'] == 'finished' and needs_merging:
+            if d['status'] == 'finished' and progress_tracker.is_merging:
                 # Start simulating merge progress
                 def simulate_merge_progress():
                     import time
@@ -430,10 +385,9 @@ def download_video(url, quality, download_id, output_path):
             'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
             'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
         ]        # Use best strategy for downloads (simplified for reliability)
+        # Per-job settings (format, output path, hooks, cookies) are applied
+        # when the pooled YoutubeDL is leased below
         ydl_opts = {
-            'format': format_selector,
-            'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-            'progress_hooks': [enhanced_progress_hook],
             'extractaudio': quality == 'audio',
             'audioformat': 'mp3' if quality == 'audio' else None,
             # Ensure we get the best quality possible
@@ -458,13 +412,9 @@ def download_video(url, quality, download_id, output_path):
                 'Accept-Language': 'en-US,en;q=0.9',
                 'Connection': 'keep-alive'
             },
-            # Cookie handling - Use manual cookies if available
-            'cookiefile': uploaded_cookies.get(download_id),
             # Enhanced retry and delay settings
             'retries': 5,
             'fragment_retries': 5,
-            'sleep_interval': 3,
-            'max_sleep_interval': 8,
             # Additional bypass options
             'no_warnings': True,
             'ignoreerrors': False,
@@ -478,76 +428,101 @@ def download_video(url, quality, download_id, output_path):
             'postprocessors': [] if not ffmpeg_path else [],
             # Ensure proper audio codec selection during merging
             'postprocessor_args': {
-                'ffmpeg': [
-                    '-c:v', 'copy',  # Copy video stream (no re-encoding)
-                    '-c:a', 'aac',   # Convert audio to AAC
-                    '-b:a', '192k',  # Audio bitrate 192k
-                    '-movflags', '+faststart'  # Optimize for streaming
-                ] if ffmpeg_path else []
+                'ffmpeg': MERGE_POSTPROCESSOR_ARGS if ffmpeg_path else []
             },
         }
         
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            info = ydl.extract_info(url, download=True)
+        # Sticky per job, so every request of a download leaves through the same egress
+        route = egress.pool.assign(download_id)
+        ydl_opts.update(route.params)
+        client = egress.throttle_key(throttle.client_type(ydl_opts), route)
+        with tracing.traced('attempt', strategy='download_tv_embedded', path='primary', egress=route.name) as attempt_span:
+            progress_tracker.trace = attempt_span.trace
+            stages = tracing.DownloadStages(attempt_span)
+            throttle_wait(client, attempt_span)
+            with ydl_pool.lease('download_tv_embedded', ydl_opts,
+                                format=format_selector,
+                                outtmpl=os.path.join(output_path, clips.output_template(clip)),
+                                progress_hooks=[enhanced_progress_hook, record_stream_metrics, stages.progress_hook,
+                                                bandwidth.manager.hook(download_id)],
+                                postprocessor_hooks=[postprocessor_timer(), stages.postprocessor_hook],
+                                **clips.download_options(clip),
+                                # Cookie handling - Use manual cookies if available
+                                cookiejar=job_cookiejar(download_id)) as ydl:
+                # Extract and download as separate steps so each gets its own span
+                with attempt_span.trace.span('extract') as extract_span:
+                    # Reuse the info /api/info just extracted, unless the job brings its own cookies
+                    info = None if uploaded_cookies.get(download_id) else cached_info(url, route.name)
+                    info_reused = info is not None
+                    extract_span.set(cache='hit' if info_reused else 'miss')
+                    if info is None:
+                        info = ydl.extract_info(url, download=False, process=False)
+                stages.extracted()
+                info = ydl.process_ie_result(info, download=True)
             
-            # Store file information
-            if 'entries' in info:  # Playlist
-                files = []
-                for entry in info['entries']:
-                    if entry:
-                        filename = ydl.prepare_filename(entry)
-                        if os.path.exists(filename):
-                            files.append(filename)
-                download_files[download_id] = files
-            else:  # Single video
-                filename = ydl.prepare_filename(info)
-                if os.path.exists(filename):
-                    download_files[download_id] = [filename]
+                # Store file information
+                if 'entries' in info:  # Playlist
+                    files = []
+                    for entry in info['entries']:
+                        if entry:
+                            filename = ydl.prepare_filename(entry)
+                            if os.path.exists(filename):
+                                files.append(filename)
+                    download_files[download_id] = files
+                else:  # Single video
+                    filename = ydl.prepare_filename(info)
+                    if os.path.exists(filename):
+                        download_files[download_id] = [filename]
+        
+        throttle.record_success(client)
+        egress.pool.record(route, 'success')
+        record_download_result('primary', 'success', progress_tracker.start_time)
                     
     except Exception as e:
         error_message = str(e)
         print(f"Download error: {e}")
-        download_progress[download_id].status = 'error'
+        if client:
+            throttle.record_error(client, error_message)
+            egress.pool.record_error(route, error_message)
+        if info_reused:
+            # Stream URLs may have expired; the fallback and later jobs extract afresh
+            cache.delete(f'infoc_{hashlib.md5(url.encode()).hexdigest()}')
         
         # Provide helpful error messages
         if 'not available' in error_message.lower() and 'format' in error_message.lower():
             download_progress[download_id].error = "Requested quality not available. Try selecting 'Best Available Quality' or a lower quality."
+            error_class = 'format_unavailable'
         elif '403' in error_message or 'forbidden' in error_message.lower():
             download_progress[download_id].error = "Video access restricted. Try uploading YouTube cookies for age-restricted content."
+            error_class = 'forbidden'
         elif 'private' in error_message.lower():
             download_progress[download_id].error = "This video is private. You may need to upload YouTube cookies to access it."
+            error_class = 'private'
         elif 'not available' in error_message.lower():
             download_progress[download_id].error = "Video not available. This may be due to geographic restrictions."
+            error_class = 'unavailable'
         else:
             download_progress[download_id].error = f"Download failed: {error_message}"
-        
-        # Clean up cookie file if it exists
-        if download_id in uploaded_cookies:
-            cleanup_cookie_file(uploaded_cookies[download_id])
-            del uploaded_cookies[download_id]
+            error_class = 'other'
+        record_download_result('primary', 'error', download_progress[download_id].start_time, error_class)
+        # Let download_with_fallback run the alternative strategies
+        raise
 
 # Alternative download function for problematic videos
-def download_video_alternative(url, quality, download_id, output_path):
+def download_video_alternative(url, quality, download_id, output_path, clip=None):
     """Alternative download method with different extractor strategies"""
     try:
-        progress_tracker = DownloadProgress(download_id)
-        download_progress[download_id] = progress_tracker        # Quality mapping - OPTIMIZED for highest quality downloads
-        # Using best format selection with proper fallbacks
-        if quality == 'audio':
-            format_selector = 'bestaudio[ext=m4a]/bestaudio/best[vcodec=none]'
-        elif quality == '144p':
-            format_selector = 'bestvideo[height<=144]+bestaudio/best[height<=144]'
-        elif quality == '360p':
-            format_selector = 'bestvideo[height<=360]+bestaudio/best[height<=360]'
-        elif quality == '480p':
-            format_selector = 'bestvideo[height<=480]+bestaudio/best[height<=480]'
-        elif quality == '720p':
-            format_selector = 'bestvideo[height<=720]+bestaudio/best[height<=720]'
-        elif quality == '1080p':
-            format_selector = 'bestvideo[height<=1080]+bestaudio/best[height<=1080]'
-        else:  # 'best' or any other value
-            # This will get the best available quality, including 4K/2160p
-            format_selector = 'bestvideo+bestaudio/best'
+        # Keep the primary attempt's tracker so progress doesn't jump back to zero
+        progress_tracker = download_progress.get(download_id)
+        if progress_tracker is None:
+            progress_tracker = DownloadProgress(download_id)
+            download_progress[download_id] = progress_tracker
+        # The primary attempt's error message no longer applies once a fallback runs
+        progress_tracker.error = None
+        # Same tier selection as the primary path ('best' includes 4K/2160p)
+        resolved = cached_quality(url, quality)
+        ffmpeg_available = bool(get_ffmpeg_path())
+        format_selector = format_index.selector(quality, ffmpeg_available, resolved and resolved['format_id'])
           # Enhanced fallback strategies - specifically designed to bypass 403 errors
         strategies = [
             # Strategy 1: Use web client with 403-resistant settings
@@ -580,7 +555,8 @@ def download_video_alternative(url, quality, download_id, output_path):
             },
             # Strategy 3: Use TV client for maximum compatibility
             {
-                'format': format_selector.replace('bestvideo+bestaudio', 'best'),  # TV client prefers single files
+                # TV client prefers single files (and may not list the same format IDs)
+                'format': format_index.selector(quality, ffmpeg_available).replace('bestvideo+bestaudio', 'best'),
                 'extractor_args': {
                     'youtube': {
                         'player_client': ['tv'],
@@ -605,38 +581,63 @@ def download_video_alternative(url, quality, download_id, output_path):
         ]
         
         for i, strategy in enumerate(strategies):
+            # Re-checked per strategy: moves the job off an egress that has been ejected meanwhile
+            route = egress.pool.assign(download_id)
+            client = egress.throttle_key(throttle.client_type(strategy), route)
             try:
+                strategy = dict(strategy)
+                strategy_format = strategy.pop('format')
                 ydl_opts = {
                     **strategy,
-                    'outtmpl': os.path.join(output_path, '%(title)s.%(ext)s'),
-                    'progress_hooks': [progress_tracker.hook],
                     'extractaudio': quality == 'audio',
                     'audioformat': 'mp3' if quality == 'audio' else None,
                     'retries': 2,
                     'ignoreerrors': False,
                     'no_warnings': True,
                     'geo_bypass': True,
+                    **route.params,
                 }
                 
-                with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                    info = ydl.extract_info(url, download=True)
-                      # Store file information
-                    if 'entries' in info:
-                        files = []
-                        for entry in info['entries']:
-                            if entry:
-                                filename = ydl.prepare_filename(entry)
-                                if os.path.exists(filename):
-                                    files.append(filename)
-                        download_files[download_id] = files
-                    else:
-                        filename = ydl.prepare_filename(info)
-                        if os.path.exists(filename):
-                            download_files[download_id] = [filename]
-                    return  # Success!
+                with tracing.traced('attempt', strategy=f'alternative_{i + 1}', path='alternative',
+                                    egress=route.name) as attempt_span:
+                    progress_tracker.trace = attempt_span.trace
+                    stages = tracing.DownloadStages(attempt_span)
+                    throttle_wait(client, attempt_span)
+                    with ydl_pool.lease(f'alternative_{i + 1}', ydl_opts,
+                                        format=strategy_format,
+                                        outtmpl=os.path.join(output_path, clips.output_template(clip)),
+                                        progress_hooks=[progress_tracker.hook, record_stream_metrics, stages.progress_hook,
+                                                        bandwidth.manager.hook(download_id)],
+                                        postprocessor_hooks=[postprocessor_timer(), stages.postprocessor_hook],
+                                        **clips.download_options(clip),
+                                        cookiejar=job_cookiejar(download_id)) as ydl:
+                        with attempt_span.trace.span('extract'):
+                            info = ydl.extract_info(url, download=False, process=False)
+                        stages.extracted()
+                        info = ydl.process_ie_result(info, download=True)
+                          # Store file information
+                        if 'entries' in info:
+                            files = []
+                            for entry in info['entries']:
+                                if entry:
+                                    filename = ydl.prepare_filename(entry)
+                                    if os.path.exists(filename):
+                                        files.append(filename)
+                            download_files[download_id] = files
+                        else:
+                            filename = ydl.prepare_filename(info)
+                            if os.path.exists(filename):
+                                download_files[download_id] = [filename]
+                        throttle.record_success(client)
+                        egress.pool.record(route, 'success')
+                        record_download_result('alternative', 'success', progress_tracker.start_time)
+                        progress_tracker.error = None  # Drop earlier strategies' retry notes
+                        return  # Success!
                 
             except Exception as e:
                 error_message = str(e).lower()
+                throttle.record_error(client, error_message)
+                egress.pool.record_error(route, error_message)
                 
                 # Provide specific feedback for 403 errors
                 if '403' in error_message or 'forbidden' in error_message:
@@ -660,19 +661,27 @@ def download_video_alternative(url, quality, download_id, output_path):
         error_message = str(e)
         print(f"All download strategies failed: {e}")
         download_progress[download_id].status = 'error'
+        if download_id not in uploaded_cookies:
+            negative_cache.remember(cache, url, error_message)
         
         # Provide helpful error messages to users
         if '403' in error_message.lower() or 'forbidden' in error_message.lower():
             download_progress[download_id].error = "Video access restricted. This video may be geographically blocked, age-restricted, or have enhanced copyright protection."
+            error_class = 'forbidden'
         elif 'private' in error_message.lower():
             download_progress[download_id].error = "This video is private and cannot be downloaded."
+            error_class = 'private'
         elif 'not available' in error_message.lower():
             download_progress[download_id].error = "This video is not available for download."
+            error_class = 'unavailable'
         else:
             download_progress[download_id].error = f"Download failed: {error_message}"
+            error_class = 'other'
+        record_download_result('alternative', 'error', download_progress[download_id].start_time, error_class)
 
 def debug_available_formats(url):
     """Debug function to show available formats for a video"""
+    import yt_dlp
     try:
         ydl_opts = {
             'listformats': True,
@@ -692,11 +701,168 @@ def debug_available_formats(url):
         print(f"Debug error: {e}")
         return []
 
-@app.route('/')
+def summarize_info(info):
+    """Build the /api/info response from a yt-dlp info dict"""
+    # Exact formats and sizes per quality tier (single videos; playlist entries vary)
+    qualities = [] if 'entries' in info else format_index.FormatIndex(info).available(bool(get_ffmpeg_path()))
+    return {
+        'title': info.get('title', 'Unknown'),
+        'duration': info.get('duration', 0),
+        'view_count': info.get('view_count', 0),
+        'uploader': info.get('uploader', 'Unknown'),
+        'thumbnail': info.get('thumbnail', ''),
+        'is_playlist': 'entries' in info,
+        'entry_count': len(info.get('entries', [])) if 'entries' in info else 1,
+        'qualities': qualities
+    }
+
+def cached_quality(url, quality):
+    """Resolved formats for a quality from the cached /api/info summary, or None"""
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    return format_index.cached_quality(cache.get(f'info_{url_hash}'), quality)
+
+def lookup_info(url):
+    """Get the /api/info summary for a URL, checking the cache first"""
+    with tracing.traced('info_lookup', url=url) as span:
+        url_hash = hashlib.md5(url.encode()).hexdigest()
+        cached_info = cache.get(f'info_{url_hash}')
+        if cached_info:
+            metrics.INFO_CACHE_REQUESTS.inc(result='hit')
+            span.set(cache='hit')
+            start_prefetch(url)
+            return cached_info
+        metrics.INFO_CACHE_REQUESTS.inc(result='miss')
+        span.set(cache='miss')
+        
+        attempts = []
+        try:
+            info = get_video_info(url, attempts)
+        except Exception as e:
+            # Private/unavailable/age-restricted videos fail the same way next time
+            negative_cache.remember(cache, url, str(e))
+            raise
+        if not info:
+            return None
+        
+        result = summarize_info(info)
+        
+        # Cache for 1 hour
+        cache.set(f'info_{url_hash}', result, timeout=3600)
+        # Per-quality size estimates let the download scheduler cost a job before it runs
+        cache.set(f'sizes_{url_hash}', scheduler.estimate_sizes(info), timeout=3600)
+        # Compact copy of the info dict, so a download right after doesn't extract again
+        egress_name = next((attempt['egress'] for attempt in reversed(attempts) if attempt['outcome'] == 'success'), None)
+        cache.set(f'infoc_{url_hash}', {'egress': egress_name, 'info': compact_info.pack(info)}, timeout=3600)
+        start_prefetch(url)
+        
+        return result
+
+def cached_info(url, egress_name):
+    """Info dict from the compact info cache if a download can reuse it, or None
+
+    Stream URLs can be tied to the IP that extracted them, so only a download
+    leaving through the same egress gets them.
+    """
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    entry = cache.get(f'infoc_{url_hash}')
+    if not entry or entry['egress'] != egress_name:
+        return None
+    compact = compact_info.CompactInfo.loads(entry['info'])
+    if compact.is_playlist or not compact.complete:
+        return None
+    return compact.to_info()
+
+def start_prefetch(url):
+    """Start fetching the likely download of a just-looked-up video (see prefetch.py)"""
+    # Speculative work never competes with jobs waiting for a worker
+    if not prefetch.PREFETCH_ENABLED or scheduler.download_queue.queued_count():
+        return
+    url_hash = hashlib.md5(url.encode()).hexdigest()
+    entry = cache.get(f'infoc_{url_hash}')
+    quality = prefetch.prefetcher.likely_quality()
+    resolved = cached_quality(url, quality)
+    route = egress.pool.get(entry['egress']) if entry else None
+    info = cached_info(url, route.name) if route and route.available() else None
+    if not info or not resolved:
+        return
+    prefetch.prefetcher.start(url, quality, lambda job: run_prefetch(job, info, resolved, route))
+
+def run_prefetch(job, info, resolved, route):
+    """Download the resolved formats into the prefetch directory until the hook stops it"""
+    ffmpeg_path = get_ffmpeg_path()
+    ydl_opts = {
+        'quiet': True,
+        'no_warnings': True,
+        'noprogress': True,
+        'retries': 1,
+        'ffmpeg_location': ffmpeg_path if ffmpeg_path else None,
+        'merge_output_format': 'mp4',
+        'postprocessor_args': {'ffmpeg': MERGE_POSTPROCESSOR_ARGS if ffmpeg_path else []},
+        **route.params,
+    }
+    bandwidth.manager.register(job.job_id, weight=prefetch.PREFETCH_BANDWIDTH_WEIGHT)
+    try:
+        # Same selector and output template as download_video, so the .part names line up
+        with ydl_pool.lease('prefetch', ydl_opts,
+                            format=format_index.selector(job.quality, bool(ffmpeg_path), resolved['format_id']),
+                            outtmpl=os.path.join(job.directory, '%(title)s.%(ext)s'),
+                            progress_hooks=[bandwidth.manager.hook(job.job_id), job.hook]) as ydl:
+            ydl.process_ie_result(info, download=True)
+    finally:
+        bandwidth.manager.unregister(job.job_id)
+
+def progress_payload(progress):
+    """Serialize a DownloadProgress for the progress endpoints"""
+    # Enhanced status messages
+    status_messages = {
+        'queued': 'Waiting in queue...',
+        'starting': 'Preparing download...',
+        'downloading': 'Downloading video...' if not progress.is_merging else 'Downloaded, preparing to merge...',
+        'merging': 'Merging video and audio streams...',
+        'completed': 'Download completed!',
+        'error': 'Download failed'
+    }
+    
+    return {
+        'progress': progress.progress,
+        'status': progress.status,
+        'status_message': status_messages.get(progress.status, progress.status),
+        'title': progress.title,
+        'error': progress.error,
+        'is_merging': progress.is_merging,
+        # Bytes across all streams of the job, smoothed speed (bytes/sec) and ETA (seconds)
+        **progress.transfer.status(),
+        # Current share of the download bandwidth (null when shaping is off)
+        'bandwidth': bandwidth.manager.allocation(progress.download_id),
+        'queue_position': scheduler.download_queue.position(progress.download_id) if progress.status == 'queued' else None
+    }
+
+def prepare_download_file(download_id):
+    """Resolve the file to serve for a finished download as (path, download_name)"""
+    files = download_files.get(download_id)
+    if not files:
+        return None
+    
+    if len(files) == 1:
+        # Single file download
+        if os.path.exists(files[0]):
+            return files[0], os.path.basename(files[0])
+        return None
+    
+    # Multiple files - create zip
+    import zipfile
+    zip_path = tempfile.mktemp(suffix='.zip')
+    with zipfile.ZipFile(zip_path, 'w') as zipf:
+        for file_path in files:
+            if os.path.exists(file_path):
+                zipf.write(file_path, os.path.basename(file_path))
+    return zip_path, 'playlist.zip'
+
+@bp.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/api/info', methods=['POST'])
+@bp.route('/api/info', methods=['POST'])
 def get_info():
     """Get video/playlist information"""
     data = request.get_json()
@@ -705,146 +871,366 @@ def get_info():
     if not url:
         return jsonify({'error': 'URL is required'}), 400
     
-    if not is_valid_youtube_url(url):
-        return jsonify({'error': 'Invalid YouTube URL'}), 400
+    error = url_error(url)
+    if error:
+        return jsonify({'error': error}), 400
     
-    # Check cache first
-    url_hash = hashlib.md5(url.encode()).hexdigest()
-    cached_info = cache.get(f'info_{url_hash}')
-    if cached_info:
-        return jsonify(cached_info)
+    if request.args.get('profile'):
+        return profile_info_request(url, request.args['profile'])
     
-    info = get_video_info(url)
-    if not info:
+    failure = negative_cache.lookup(cache, url)
+    if failure:
+        return jsonify(failure), 400
+    
+    try:
+        result = lookup_info(url)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    if not result:
         return jsonify({'error': 'Failed to get video information'}), 400
     
-    result = {
-        'title': info.get('title', 'Unknown'),
-        'duration': info.get('duration', 0),
-        'view_count': info.get('view_count', 0),
-        'uploader': info.get('uploader', 'Unknown'),
-        'thumbnail': info.get('thumbnail', ''),
-        'is_playlist': 'entries' in info,
-        'entry_count': len(info.get('entries', [])) if 'entries' in info else 1
-    }
+    return jsonify(result)
+
+def require_admin():
+    """404 when ADMIN_TOKEN isn't configured, 403 without the right X-Admin-Token"""
+    if not profiling.ADMIN_TOKEN:
+        abort(404)
+    if not profiling.check_admin_token(request.headers.get('X-Admin-Token', '')):
+        abort(403)
+
+def profile_info_request(url, mode):
+    """Run an uncached info extraction under cProfile and return the profile"""
+    require_admin()
+    # Profile in this thread, whatever EXTRACTION_BACKEND is, so yt-dlp shows up
+    profiled = profiling.profile_call(extract_video_info, url)
+    if profiled is None:
+        return jsonify({'error': 'Another profile is already running'}), 409
+    result, error, profile = profiled
     
-    # Cache for 1 hour
-    cache.set(f'info_{url_hash}', result, timeout=3600)
+    if mode == 'pstats':
+        return send_file(io.BytesIO(profiling.profile_dump(profile)), mimetype='application/octet-stream',
+                         as_attachment=True, download_name='info.pstats')
     
-    return jsonify(result)
+    outcome = f"Error: {error}" if error else f"Title: {result.get('title', 'Unknown')}"
+    sort = request.args.get('sort', 'cumulative')
+    if sort not in ('cumulative', 'tottime', 'ncalls'):
+        sort = 'cumulative'
+    text = f"Profile of /api/info for {url}\n{outcome}\n\n" + profiling.profile_text(profile, sort=sort)
+    return Response(text, mimetype='text/plain')
 
-@app.route('/api/download', methods=['POST'])
+@bp.route('/api/admin/profile')
+def sampling_profile():
+    """Sample all threads for N seconds and return a speedscope or collapsed-stack file"""
+    require_admin()
+    try:
+        seconds = float(request.args.get('seconds', 10))
+        interval = float(request.args.get('interval', profiling.PROFILE_DEFAULT_INTERVAL))
+    except ValueError:
+        return jsonify({'error': 'seconds and interval must be numbers'}), 400
+    if not (math.isfinite(seconds) and math.isfinite(interval)):
+        return jsonify({'error': 'seconds and interval must be finite'}), 400
+    output = request.args.get('format', 'speedscope')
+    if output not in ('speedscope', 'collapsed'):
+        return jsonify({'error': 'format must be speedscope or collapsed'}), 400
+    
+    profiler = profiling.sample(seconds, interval, idle=request.args.get('idle') == '1')
+    if profiler is None:
+        return jsonify({'error': 'Another profile is already running'}), 409
+    
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    if output == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain',
+                        headers={'Content-Disposition': f'attachment; filename=vozila-{stamp}.collapsed.txt'})
+    return Response(profiling.speedscope_json(profiler), mimetype='application/json',
+                    headers={'Content-Disposition': f'attachment; filename=vozila-{stamp}.speedscope.json'})
+
+@bp.route('/api/download', methods=['POST'])
 def start_download():
     """Start download process"""
     data = request.get_json()
-    url = data.get('url', '').strip()
-    quality = data.get('quality', 'best')
-    cookies_content = data.get('cookies', '').strip()
-    
+    payload, status = queue_download(data.get('url', '').strip(), data.get('quality', 'best'),
+                                     data.get('cookies', '').strip(), data.get('callback_url'),
+                                     data.get('start'), data.get('end'))
+    return jsonify(payload), status
+
+def resolve_clip(url, start, end):
+    """(clip, error) for the start/end of a download request; clip is None for the whole video"""
+    summary = cache.get(f'info_{hashlib.md5(url.encode()).hexdigest()}') or {}
+    try:
+        clip = clips.parse_clip(start, end, summary.get('duration'))
+    except ValueError as e:
+        return None, str(e)
+    if clip and (summary.get('is_playlist') or '/playlist' in urlparse(url).path):
+        return None, "Clips can only be cut from single videos"
+    if clip and not get_ffmpeg_path():
+        return None, "Clip downloads need FFmpeg, which isn't available on this server"
+    return clip, None
+
+QUALITY_ERROR = f"quality must be one of: {', '.join(format_index.QUALITIES)}"
+
+def queue_download(url, quality, cookies_content='', callback_url=None, start=None, end=None):
+    """Validate and queue one download; returns (response payload, HTTP status)"""
     if not url:
-        return jsonify({'error': 'URL is required'}), 400
+        return {'error': 'URL is required'}, 400
     
-    if not is_valid_youtube_url(url):
-        return jsonify({'error': 'Invalid YouTube URL'}), 400
+    error = url_error(url)
+    if error:
+        return {'error': error}, 400
+    
+    if quality not in format_index.QUALITIES:
+        return {'error': QUALITY_ERROR}, 400
+    
+    # Optional time range: only that part of the streams is fetched
+    clip, clip_error = resolve_clip(url, start, end)
+    if clip_error:
+        return {'error': clip_error}, 400
+    
+    if callback_url:
+        callback_error = webhooks.validate_callback_url(str(callback_url))
+        if callback_error:
+            return {'error': callback_error}, 400
+    
+    # Known-dead videos fail fast, unless cookies might get past the error
+    if not cookies_content:
+        failure = negative_cache.lookup(cache, url)
+        if failure:
+            return failure, 400
+    
+    prefetch.prefetcher.record_choice(quality)
     
     # Generate unique download ID
     download_id = str(uuid.uuid4())
     
-    # Handle cookies if provided
+    # Handle cookies if provided: parsed once, shared with other jobs that upload the same ones
     if cookies_content:
-        cookie_file = save_cookies_to_file(cookies_content, download_id)
-        if cookie_file:
-            uploaded_cookies[download_id] = cookie_file
+        try:
+            uploaded_cookies[download_id] = cookie_jar.jars.add(cookies_content)
+        except ValueError as e:
+            return {'error': str(e)}, 400
+    
+    # State changes are POSTed to the callback instead of having to be polled
+    webhooks.dispatcher.register(download_id, callback_url and str(callback_url))
     
     # Create temporary directory for this download
     temp_dir = tempfile.mkdtemp(prefix=f'yt_download_{download_id}_')
-      # Start download in background thread with fallback
-    def download_with_fallback():
-        try:
-            download_video(url, quality, download_id, temp_dir)
-        except Exception as e:
-            print(f"Primary download failed, trying alternative method: {e}")
-            download_video_alternative(url, quality, download_id, temp_dir)
+    submit_download(url, quality, download_id, temp_dir, clip=clip)
     
-    thread = threading.Thread(target=download_with_fallback)
-    thread.daemon = True
-    thread.start()
+    return {'download_id': download_id}, 200
+
+@bp.route('/api/batch/download', methods=['POST'])
+def start_batch_download():
+    """Queue many downloads at once: {"items": [{"url", "quality"}], "cookies": ...}
+
+    Items for the same video, playlist and quality share one job. Each item
+    gets a download_id or its own error; the batch only fails as a whole when
+    the body is malformed. A job reports to one callback, so a shared item whose
+    callback_url differs from the first item's gets a warning instead.
+    """
+    data = request.get_json(silent=True) or {}
+    items = data.get('items')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'items must be a non-empty list'}), 400
+    if len(items) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} items per batch'}), 400
+    cookies_content = data.get('cookies') or ''
+    if not isinstance(cookies_content, str):
+        return jsonify({'error': 'cookies must be a string'}), 400
+    cookies_content = cookies_content.strip()
     
-    return jsonify({'download_id': download_id})
+    results = []
+    queued = {}  # (video, playlist, quality, clip range) -> download_id
+    callbacks = {}  # download_id -> callback_url it was queued with
+    for item in items:
+        if isinstance(item, str):
+            item = {'url': item}
+        if not isinstance(item, dict):
+            results.append({'error': 'Each item must be a URL or an object with a url'})
+            continue
+        url = str(item.get('url') or '').strip()
+        quality = item.get('quality') or data.get('quality') or 'best'
+        # Checked before the dedupe key is built from them
+        error = url_error(url) if url else 'URL is required'
+        if not error and quality not in format_index.QUALITIES:
+            error = QUALITY_ERROR
+        if error:
+            results.append({'url': url, 'error': error})
+            continue
+        result = {'url': url, 'quality': quality}
+        clip, _ = resolve_clip(url, item.get('start'), item.get('end'))
+        # A watch link with list= downloads the whole playlist, so it isn't the same job as the bare video
+        playlist = parse_qs(urlparse(url if '://' in url else f'https://{url}').query).get('list', [None])[0]
+        key = (negative_cache.video_key(url), playlist, quality, clips.label(clip))
+        callback_url = item.get('callback_url') or data.get('callback_url')
+        if key in queued:
+            result.update(download_id=queued[key], duplicate=True)
+            if callback_url and callback_url != callbacks[queued[key]]:
+                result['warning'] = "Shares a job with an earlier item; that item's callback_url is used instead of this one"
+        else:
+            # Every job of the batch shares one parsed cookie jar
+            payload, status = queue_download(url, quality, cookies_content, callback_url,
+                                             item.get('start'), item.get('end'))
+            result.update(payload)
+            if status == 200:
+                queued[key] = payload['download_id']
+                callbacks[payload['download_id']] = callback_url
+        results.append(result)
+    
+    return jsonify({'items': results, 'download_ids': list(queued.values())})
+
+@bp.route('/api/batch/progress', methods=['POST'])
+def get_batch_progress():
+    """Progress of many downloads: {"download_ids": [...]} -> {"progress": {id: ...}}"""
+    data = request.get_json(silent=True) or {}
+    download_ids = data.get('download_ids')
+    if not isinstance(download_ids, list):
+        return jsonify({'error': 'download_ids must be a list'}), 400
+    if len(download_ids) > BATCH_MAX_ITEMS:
+        return jsonify({'error': f'At most {BATCH_MAX_ITEMS} ids per call'}), 400
+    
+    progress = {}
+    for download_id in dict.fromkeys(map(str, download_ids)):
+        tracker = download_progress.get(download_id)
+        progress[download_id] = progress_payload(tracker) if tracker else {'error': 'Download not found'}
+    return jsonify({'progress': progress})
 
-@app.route('/api/progress/<download_id>')
+def submit_download(url, quality, download_id, temp_dir, resumes=0, clip=None):
+    """Journal a download job and queue it for a worker"""
+    # Jobs are queued cheapest-first; the cost comes from sizes cached by /api/info when available
+    sizes = cache.get(f'sizes_{hashlib.md5(url.encode()).hexdigest()}')
+    cost = scheduler.estimate_cost(sizes, quality, clip[1] - clip[0] if clip else None)
+    scheduler.SCHEDULED_JOBS.inc(estimate='cached_info' if sizes else 'default')
+    
+    # Start download in background thread with fallback
+    submitted = time.time()
+    trace = tracing.Trace('download_job', job_id=download_id, start=submitted, quality=quality, url=url,
+                          estimated_cost=round(cost, 1), resumes=resumes, clip=clips.label(clip) or None)
+    queue_span = trace.start_span('queue', start=submitted)
+    
+    def download_with_fallback():
+        queue_span.finish()
+        metrics.QUEUE_WAIT_SECONDS.observe(time.time() - submitted, queue='download')
+        journal.record(download_id, status='running')
+        # Audio jobs are small: give them a bigger share so they finish quickly
+        bandwidth.manager.register(download_id, priority=quality == 'audio')
+        with tracing.activate(trace):
+            try:
+                # Continue from what was fetched speculatively after /api/info, if it matches
+                # (prefetches hold the start of the full streams, never a clip)
+                if not clip:
+                    prefetch.prefetcher.promote(url, quality, temp_dir)
+                download_video(url, quality, download_id, temp_dir, clip)
+            except Exception as e:
+                # Partial files stay in temp_dir, so the alternative strategies resume them
+                print(f"Primary download failed, trying alternative method: {e}")
+                download_video_alternative(url, quality, download_id, temp_dir, clip)
+            finally:
+                egress.pool.release(download_id)
+                bandwidth.manager.unregister(download_id)
+                release_cookies(download_id)
+                progress = download_progress.get(download_id)
+                files = download_files.get(download_id) or []
+                journal.record(download_id, status='completed' if files else 'error', files=files,
+                               title=progress.title if progress else '')
+                if webhooks.dispatcher.callback_for(download_id):
+                    event = 'completed' if files else 'error'
+                    payload = progress_payload(progress) if progress else {}
+                    payload.update(status=event, files=len(files), download_url=f'/api/download/{download_id}' if files else None)
+                    webhooks.dispatcher.notify(download_id, event, payload)
+                trace.finish(error=progress.error if progress and progress.status == 'error' else None)
+    
+    # Placeholder so progress polling works while the job waits for a worker
+    queued = DownloadProgress(download_id)
+    queued.status = 'queued'
+    download_progress[download_id] = queued
+    journal.record(download_id, url=url, quality=quality, output_path=temp_dir, status='queued', resumes=resumes,
+                   callback_url=webhooks.dispatcher.callback_for(download_id), clip=clip and list(clip))
+    journal.claim(download_id)
+    scheduler.download_queue.submit(download_id, download_with_fallback, cost)
+
+def resume_journaled_jobs():
+    """Pick up jobs a previous process journaled: re-queue unfinished ones, re-serve finished ones"""
+    resumed = 0
+    for entry in journal.load():
+        download_id = entry['download_id']
+        if download_id in download_progress or not journal.claim(download_id):
+            continue
+        if entry.get('status') == 'completed':
+            files = [f for f in entry.get('files') or [] if os.path.exists(f)]
+            if files:
+                progress = DownloadProgress(download_id)
+                progress.status = 'completed'
+                progress.progress = 100
+                progress.title = entry.get('title', '')
+                download_progress[download_id] = progress
+                download_files[download_id] = files
+            continue
+        output_path = entry.get('output_path')
+        if entry.get('status') not in journal.UNFINISHED_STATUSES or not output_path or not os.path.isdir(output_path):
+            continue
+        if entry.get('resumes', 0) >= JOB_MAX_RESUMES:
+            # Don't let a job that keeps taking the process down loop forever
+            journal.record(download_id, status='error')
+            continue
+        print(f"Resuming download {download_id} from {output_path}")
+        webhooks.dispatcher.register(download_id, entry.get('callback_url'))
+        submit_download(entry['url'], entry['quality'], download_id, output_path, resumes=entry.get('resumes', 0) + 1,
+                        clip=tuple(entry['clip']) if entry.get('clip') else None)
+        resumed += 1
+    return resumed
+
+@bp.route('/api/progress/<download_id>')
 def get_progress(download_id):
     """Get download progress"""
     if download_id not in download_progress:
         return jsonify({'error': 'Download not found'}), 404
     
-    progress = download_progress[download_id]
-    
-    # Enhanced status messages
-    status_messages = {
-        'starting': 'Preparing download...',
-        'downloading': 'Downloading video...' if not progress.is_merging else 'Downloaded, preparing to merge...',
-        'merging': 'Merging video and audio streams...',
-        'completed': 'Download completed!',
-        'error': 'Download failed'
-    }
-    
-    return jsonify({
-        'progress': progress.progress,
-        'status': progress.status,
-        'status_message': status_messages.get(progress.status, progress.status),
-        'title': progress.title,
-        'error': progress.error,
-        'is_merging': progress.is_merging
-    })
+    return jsonify(progress_payload(download_progress[download_id]))
 
-@app.route('/api/download/<download_id>')
+@bp.route('/api/download/<download_id>')
 def download_file(download_id):
     """Download completed files"""
     if download_id not in download_files:
         return jsonify({'error': 'Download not found or not completed'}), 404
     
-    files = download_files[download_id]
-    
-    if len(files) == 1:
-        # Single file download
-        if os.path.exists(files[0]):
-            return send_file(files[0], as_attachment=True)
-    else:
-        # Multiple files - create zip
-        zip_path = tempfile.mktemp(suffix='.zip')
-        with zipfile.ZipFile(zip_path, 'w') as zipf:
-            for file_path in files:
-                if os.path.exists(file_path):
-                    zipf.write(file_path, os.path.basename(file_path))
-        return send_file(zip_path, as_attachment=True, download_name='playlist.zip')
+    trace = tracing.get(download_id)
+    started = time.time()
+    prepared = prepare_download_file(download_id)
+    if prepared:
+        file_path, download_name = prepared
+        response = send_file(file_path, as_attachment=True, download_name=download_name)
+        if trace:
+            # Covers preparing the file (zipping playlists); the body is streamed by the server afterwards
+            trace.add_span('serve', started, time.time(), file=download_name, bytes=response.content_length)
+            tracing.export(trace)
+        return response
     
     return jsonify({'error': 'Files not found'}), 404
 
-@app.route('/api/supported-sites')
-@cache.cached(timeout=86400)  # Cache for 24 hours
+@bp.route('/api/supported-sites')
 def supported_sites():
-    """Get list of supported sites"""
+    """Page through the sites yt-dlp supports (?q=search&page=1&per_page=50)"""
     try:
-        with yt_dlp.YoutubeDL() as ydl:
-            extractors = ydl._get_extractors()
-            sites = []
-            for extractor in extractors:
-                if hasattr(extractor, 'IE_NAME') and hasattr(extractor, 'IE_DESC'):
-                    sites.append({
-                        'name': extractor.IE_NAME,
-                        'description': extractor.IE_DESC
-                    })
-            return jsonify(sites[:50])  # Return first 50 for performance
-    except:
-        return jsonify([])
+        page = int(request.args.get('page', 1))
+        per_page = int(request.args.get('per_page', site_index.SITE_INDEX_PAGE_SIZE))
+    except ValueError:
+        return jsonify({'error': 'page and per_page must be integers'}), 400
+    return jsonify(site_index.index.page(request.args.get('q', '').strip(), page, per_page))
 
-@app.route('/robots.txt')
+@bp.route('/api/supported-sites/match')
+def supported_site_match():
+    """Which extractor yt-dlp would use for ?url=, and whether this app accepts the URL"""
+    url = request.args.get('url', '').strip()
+    if not url:
+        return jsonify({'error': 'URL is required'}), 400
+    site = site_index.index.match(url if '://' in url else f'https://{url}')
+    return jsonify({'url': url, 'site': site, 'error': url_error(url)})
+
+@bp.route('/robots.txt')
 def robots_txt():
     """Serve robots.txt for SEO"""
     return send_file('static/robots.txt', mimetype='text/plain')
 
-@app.route('/sitemap.xml')
+@bp.route('/sitemap.xml')
 def sitemap_xml():
     """Serve sitemap.xml for SEO"""
     return send_file('static/sitemap.xml', mimetype='application/xml')
@@ -855,15 +1241,20 @@ def cleanup_old_downloads():
     current_time = time.time()
     to_remove = []
     
-    for download_id, progress in download_progress.items():
+    for download_id, progress in list(download_progress.items()):
         # Remove downloads older than 1 hour
-        if progress.get('start_time') and current_time - progress.get('start_time', 0) > 3600:
+        if current_time - progress.start_time > 3600:
             to_remove.append(download_id)
     
+    # Uploads no download picked up within the jar TTL
+    to_remove.extend(download_id for download_id, uploaded in list(cookie_uploads.items())
+                     if download_id not in download_progress and current_time - uploaded > cookie_jar.COOKIE_JAR_TTL)
+    
     for download_id in to_remove:
         download_progress.pop(download_id, None)
         download_files.pop(download_id, None)
-        uploaded_cookies.pop(download_id, None)
+        release_cookies(download_id)
+        journal.remove(download_id)
         print(f"Cleaned up old download: {download_id}")
 
 # Start cleanup thread
@@ -873,11 +1264,130 @@ def run_periodic_cleanup():
         time.sleep(1800)  # 30 minutes
         cleanup_old_downloads()
 
-cleanup_thread = threading.Thread(target=run_periodic_cleanup)
-cleanup_thread.daemon = True
-cleanup_thread.start()
+_services_pid = None
+
+def start_background_services():
+    """Start the cleanup thread and warm-up once per process"""
+    global _services_pid
+    # Forked workers (gunicorn --preload) don't inherit the parent's threads
+    if _services_pid == os.getpid():
+        return
+    _services_pid = os.getpid()
+    
+    cleanup_thread = threading.Thread(target=run_periodic_cleanup)
+    cleanup_thread.daemon = True
+    cleanup_thread.start()
+    
+    warm_up.start()
+
+def _load_yt_dlp():
+    """Import yt-dlp and load its extractor classes"""
+    import yt_dlp  # noqa: F401
+    from yt_dlp.extractor import gen_extractor_classes
+    gen_extractor_classes()
+
+warm_up.add_step('yt_dlp', _load_yt_dlp)
+warm_up.add_step('site_index', site_index.index.build)
+warm_up.add_step('ffmpeg', get_ffmpeg_path)
+warm_up.add_step('resume_jobs', resume_journaled_jobs)
+# Shared yt-dlp player cache: seed from the snapshot, then optionally warm it
+warm_up.add_step('extraction_cache', extraction_cache.prepare)
+warm_up.add_step('extraction_cache_warm_url', extraction_cache.warm_up)
+if EXTRACTION_BACKEND == 'process':
+    warm_up.add_step('extraction_pool', extraction_pool.warm_up)
+
+@bp.route('/api/ready')
+def readiness():
+    """Readiness probe: 200 once background warm-up has finished"""
+    status = warm_up.status()
+    status['import_seconds'] = IMPORT_TIME
+    return jsonify(status), 200 if status['ready'] else 503
+
+@bp.route('/api/throttle')
+def throttle_status():
+    """Current backoff level and delay per YouTube client type"""
+    return jsonify(throttle.status())
+
+@bp.route('/api/queue')
+def queue_status():
+    """Running and queued download jobs with their estimated cost (admin only: lists job ids)"""
+    require_admin()
+    return jsonify(scheduler.download_queue.status())
+
+@bp.route('/api/egress')
+def egress_status():
+    """Health, load and ejection state per egress (admin only: exposes proxy hosts)"""
+    require_admin()
+    return jsonify(egress.pool.status())
+
+@bp.route('/api/debug/traces')
+def list_traces():
+    """Recent job and info-lookup traces (DEBUG_TRACES=true only)"""
+    if not tracing.DEBUG_TRACES:
+        abort(404)
+    return jsonify(tracing.recent(int(request.args.get('limit', 50))))
+
+@bp.route('/api/debug/traces/<trace_id>')
+def get_trace(trace_id):
+    """Stage timings for one trace, looked up by trace id or download id"""
+    if not tracing.DEBUG_TRACES:
+        abort(404)
+    trace = tracing.get(trace_id)
+    if not trace:
+        return jsonify({'error': 'Trace not found'}), 404
+    return jsonify(trace.to_dict())
+
+# Metrics computed at scrape time
+ACTIVE_STATUSES = ('starting', 'downloading', 'merging')
 
-@app.route('/api/upload-cookies', methods=['POST'])
+def _active_jobs():
+    counts = dict.fromkeys(ACTIVE_STATUSES, 0)
+    for progress in list(download_progress.values()):
+        if progress.status in counts:
+            counts[progress.status] += 1
+    return [({'status': status}, count) for status, count in counts.items()]
+
+def _download_disk_usage():
+    """Bytes held in per-download temp directories, partial files included"""
+    total = 0
+    temp_root = tempfile.gettempdir()
+    for entry in os.scandir(temp_root):
+        if not (entry.name.startswith('yt_download_') and entry.is_dir()):
+            continue
+        for root, _dirs, files in os.walk(entry.path):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass
+    return [({}, total)]
+
+def _temp_disk_free():
+    return [({}, shutil.disk_usage(tempfile.gettempdir()).free)]
+
+def _ytdlp_cache_operations():
+    return [({'section': section, 'operation': operation}, count)
+            for section, counts in extraction_cache.stats().items()
+            for operation, count in counts.items()]
+
+def _ydl_pool_leases():
+    stats = ydl_pool.pool.stats()
+    return [({'result': 'created'}, stats['created']), ({'result': 'reused'}, stats['reused'])]
+
+metrics.callback('vozila_active_jobs', 'Download jobs in progress by status', _active_jobs)
+metrics.callback('vozila_download_disk_bytes', 'Disk space used by download temp directories', _download_disk_usage)
+metrics.callback('vozila_temp_disk_free_bytes', 'Free space on the temp filesystem', _temp_disk_free)
+metrics.callback('vozila_ytdlp_cache_operations_total', 'yt-dlp player cache hits, misses and stores',
+                 _ytdlp_cache_operations, type='counter')
+metrics.callback('vozila_ydl_pool_leases_total', 'YoutubeDL pool leases by whether an instance was built or reused',
+                 _ydl_pool_leases, type='counter')
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Prometheus metrics for this process"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@bp.route('/api/upload-cookies', methods=['POST'])
 def upload_cookies():
     """Upload cookies for restricted video access"""
     try:
@@ -888,22 +1398,46 @@ def upload_cookies():
         if not cookies_content:
             return jsonify({'error': 'Cookies content is required'}), 400
         
-        # Save cookies to temporary file
-        cookie_file = save_cookies_to_file(cookies_content, download_id)
-        if cookie_file:
-            uploaded_cookies[download_id] = cookie_file
-            return jsonify({
-                'success': True,
-                'download_id': download_id,
-                'message': 'Cookies uploaded successfully'
-            })
-        else:
-            return jsonify({'error': 'Failed to save cookies'}), 500
+        # Parse into an in-memory jar; it expires COOKIE_JAR_TTL after its last use
+        try:
+            key = cookie_jar.jars.add(cookies_content)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        release_cookies(download_id)
+        # The reference is kept until a job or the cleanup releases it
+        uploaded_cookies[download_id] = key
+        cookie_uploads[download_id] = time.time()
+        return jsonify({
+            'success': True,
+            'download_id': download_id,
+            'message': 'Cookies uploaded successfully'
+        })
             
     except Exception as e:
         return jsonify({'error': f'Cookie upload failed: {str(e)}'}), 500
 
+def create_app():
+    """Application factory: build the Flask app and start background services"""
+    app = Flask(__name__)
+    app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'fallback-secret-key')
+    
+    cache.init_app(app, config={'CACHE_TYPE': 'simple'})
+    app.register_blueprint(bp)
+    
+    @app.before_request
+    def ensure_background_services():
+        start_background_services()
+    
+    start_background_services()
+    return app
+
+# Import-time budget - heavy modules are deferred to warm-up, keep it that way
+IMPORT_TIME = round(time.perf_counter() - _IMPORT_STARTED, 3)
+IMPORT_TIME_BUDGET = float(os.getenv('IMPORT_TIME_BUDGET', 1.0))
+if IMPORT_TIME > IMPORT_TIME_BUDGET:
+    print(f"Warning: importing source.py took {IMPORT_TIME:.2f}s (budget {IMPORT_TIME_BUDGET:.2f}s)")
+
 if __name__ == "__main__":
     port = int(os.getenv('PORT', 3000))
     debug = os.getenv('FLASK_ENV') != 'production'
-    app.run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
+    create_app().run(host='0.0.0.0', port=port, debug=debug)
\ No newline at end of file
@@ -0,0 +1,203 @@
+"""
+Adaptive backoff for requests to YouTube, per player client type
+
+Instead of fixed sleep_interval values on every strategy and download, each
+client type (tv_embedded, android, web, ...) has a shared controller that
+starts with no delay at all. Throttling signals (HTTP 429, 403, bot checks)
+raise its level and the delay doubles per level; the level steps back down
+after every quiet THROTTLE_COOLDOWN seconds.
+
+Extraction worker processes (EXTRACTION_BACKEND=process) get the parent's
+levels with every call via snapshot()/restore(), and the parent records the
+signals they report, so the state stays shared across backends.
+"""
+
+import os
+import random
+import threading
+import time
+
+import metrics
+
+THROTTLE_BASE_DELAY = float(os.getenv('THROTTLE_BASE_DELAY', 1.0))   # delay at level 1 (seconds)
+THROTTLE_MULTIPLIER = float(os.getenv('THROTTLE_MULTIPLIER', 2.0))
+THROTTLE_MAX_DELAY = float(os.getenv('THROTTLE_MAX_DELAY', 60.0))
+THROTTLE_COOLDOWN = float(os.getenv('THROTTLE_COOLDOWN', 30.0))      # quiet seconds per level of recovery
+THROTTLE_JITTER = float(os.getenv('THROTTLE_JITTER', 0.25))          # +/- fraction of the delay
+
+# Error message fragments that mean YouTube is pushing back, by signal name
+THROTTLE_SIGNALS = (
+    ('429', ('429', 'too many requests')),
+    ('bot_check', ("confirm you're not a bot", 'confirm you are not a bot')),
+    ('403', ('403', 'forbidden')),
+)
+
+THROTTLE_SIGNALS_TOTAL = metrics.counter(
+    'vozila_throttle_signals_total',
+    'Throttling signals received from YouTube',
+    ['client', 'signal'])
+THROTTLE_WAIT_SECONDS = metrics.counter(
+    'vozila_throttle_wait_seconds_total',
+    'Time spent backing off before requests',
+    ['client'])
+
+
+def classify(error_message):
+    """Name of the throttling signal in an error message, or None"""
+    message = (error_message or '').lower()
+    for signal, fragments in THROTTLE_SIGNALS:
+        if any(fragment in message for fragment in fragments):
+            return signal
+    return None
+
+
+def client_type(params):
+    """Player client a yt-dlp params dict uses, e.g. 'tv_embedded'"""
+    youtube_args = (params.get('extractor_args') or {}).get('youtube') or {}
+    client = youtube_args.get('player_client') or 'default'
+    if isinstance(client, (list, tuple)):
+        client = client[0] if client else 'default'
+    return client
+
+
+class ThrottleController:
+    """Backoff level shared by every request made with one client type"""
+
+    def __init__(self, client):
+        self.client = client
+        self.level = 0
+        self.last_change = time.time()
+        self.last_signal = None
+        self.signals = 0
+        self.successes = 0
+        self._lock = threading.Lock()
+
+    def _decay(self, now):
+        # One level of recovery per quiet cooldown period
+        if self.level and THROTTLE_COOLDOWN > 0:
+            steps = int((now - self.last_change) / THROTTLE_COOLDOWN)
+            if steps:
+                self.level = max(self.level - steps, 0)
+                self.last_change += steps * THROTTLE_COOLDOWN
+
+    def _base_delay(self):
+        if not self.level:
+            return 0.0
+        return min(THROTTLE_BASE_DELAY * THROTTLE_MULTIPLIER ** (self.level - 1), THROTTLE_MAX_DELAY)
+
+    def delay(self):
+        """Seconds to wait before the next request (0 unless throttled)"""
+        with self._lock:
+            self._decay(time.time())
+            base = self._base_delay()
+        if not base:
+            return 0.0
+        return base * random.uniform(1 - THROTTLE_JITTER, 1 + THROTTLE_JITTER)
+
+    def record_signal(self, signal):
+        now = time.time()
+        with self._lock:
+            self._decay(now)
+            if self._base_delay() < THROTTLE_MAX_DELAY:
+                self.level += 1
+            self.last_change = now
+            self.last_signal = signal
+            self.signals += 1
+        THROTTLE_SIGNALS_TOTAL.inc(client=self.client, signal=signal)
+        print(f"Throttled on {self.client} ({signal}), backing off to level {self.level}")
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+
+    def restore(self, level, age):
+        with self._lock:
+            self.level = level
+            self.last_change = time.time() - age
+
+    def status(self):
+        with self._lock:
+            self._decay(time.time())
+            return {
+                'level': self.level,
+                'delay': round(self._base_delay(), 3),
+                'signals': self.signals,
+                'successes': self.successes,
+                'last_signal': self.last_signal,
+            }
+
+
+_controllers = {}
+_controllers_lock = threading.Lock()
+
+
+def get(client):
+    with _controllers_lock:
+        controller = _controllers.get(client)
+        if controller is None:
+            controller = _controllers[client] = ThrottleController(client)
+        return controller
+
+
+def wait(client):
+    """Sleep for the client's current backoff delay; returns the seconds slept"""
+    delay = get(client).delay()
+    if delay:
+        time.sleep(delay)
+        THROTTLE_WAIT_SECONDS.inc(delay, client=client)
+    return delay
+
+
+def record_error(client, error_message):
+    """Back off if the error is a throttling signal; returns the signal or None"""
+    signal = classify(error_message)
+    if signal:
+        get(client).record_signal(signal)
+    return signal
+
+
+def record_success(client):
+    get(client).record_success()
+
+
+def status():
+    """Current backoff state per client type"""
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    return {controller.client: controller.status() for controller in controllers}
+
+
+def snapshot():
+    """Levels to hand to an extraction worker process"""
+    now = time.time()
+    with _controllers_lock:
+        controllers = list(_controllers.values())
+    state = {}
+    for controller in controllers:
+        with controller._lock:
+            controller._decay(now)
+            if controller.level:
+                state[controller.client] = (controller.level, now - controller.last_change)
+    return state
+
+
+def restore(state):
+    """Adopt the parent's levels in a worker process"""
+    for client, (level, age) in state.items():
+        get(client).restore(level, age)
+    with _controllers_lock:
+        for client, controller in _controllers.items():
+            if client not in state:
+                controller.restore(0, 0)
+
+
+def _level_samples():
+    return [({'client': client}, data['level']) for client, data in status().items()]
+
+
+def _delay_samples():
+    return [({'client': client}, data['delay']) for client, data in status().items()]
+
+
+metrics.callback('vozila_throttle_level', 'Current backoff level per client type', _level_samples)
+metrics.callback('vozila_throttle_delay_seconds', 'Current backoff delay per client type (before jitter)', _delay_samples)
@@ -0,0 +1,327 @@
+"""
+Lightweight per-job tracing of pipeline stages
+
+Each download job (and each /api/info lookup) gets a Trace made of timestamped
+spans: queue, extract, strategy attempts and the delays between them,
+per-stream downloads, merge/post-processing and serving the file. The current
+trace lives in a context variable, so code deep in the pipeline can add spans
+without the trace being passed around.
+
+Recent traces are kept in memory for the debug endpoint (DEBUG_TRACES=true)
+and, with TRACE_EXPORT_FILE set, finished spans are appended to that file as
+OTLP/JSON (one ExportTraceServiceRequest per line) for any OpenTelemetry
+collector or viewer to pick up.
+"""
+
+import contextvars
+import json
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+TRACE_EXPORT_FILE = os.getenv('TRACE_EXPORT_FILE', '')
+TRACE_HISTORY = int(os.getenv('TRACE_HISTORY', 200))  # traces kept in memory
+DEBUG_TRACES = os.getenv('DEBUG_TRACES', 'false').lower() == 'true'
+TRACE_SERVICE_NAME = os.getenv('TRACE_SERVICE_NAME', 'vozila')
+
+# (trace, span) the running code belongs to
+_current = contextvars.ContextVar('vozila_trace', default=(None, None))
+
+_traces = OrderedDict()  # trace_id -> Trace
+_jobs = {}               # job_id -> trace_id
+_registry_lock = threading.Lock()
+_export_lock = threading.Lock()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+
+def _otlp_attributes(attributes):
+    return [{'key': key, 'value': _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+class Span:
+    """One timed stage of a trace"""
+
+    def __init__(self, trace, name, parent_id=None, start=None, attributes=None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = start if start is not None else time.time()
+        self.end = None
+        self.attributes = dict(attributes or {})
+        self.error = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, end=None, error=None):
+        if self.end is None:
+            self.end = end if end is not None else time.time()
+        if error:
+            self.error = str(error)
+
+    @property
+    def duration(self):
+        return (self.end if self.end is not None else time.time()) - self.start
+
+    def to_dict(self, origin):
+        return {
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'name': self.name,
+            'offset': round(self.start - origin, 4),
+            'duration': round(self.duration, 4),
+            'finished': self.end is not None,
+            'attributes': self.attributes,
+            'error': self.error,
+        }
+
+    def to_otlp(self):
+        span = {
+            'traceId': self.trace.trace_id,
+            'spanId': self.span_id,
+            'name': self.name,
+            'kind': 1,  # SPAN_KIND_INTERNAL
+            'startTimeUnixNano': str(int(self.start * 1e9)),
+            'endTimeUnixNano': str(int(self.end * 1e9)),
+            'attributes': _otlp_attributes(self.attributes),
+            'status': {'code': 2, 'message': self.error} if self.error else {'code': 1},
+        }
+        if self.parent_id:
+            span['parentSpanId'] = self.parent_id
+        return span
+
+
+class Trace:
+    """Spans recorded for one job or request"""
+
+    def __init__(self, name, job_id=None, start=None, **attributes):
+        self.trace_id = secrets.token_hex(16)
+        self.job_id = job_id
+        self.spans = []
+        self._exported = set()
+        self._lock = threading.Lock()
+        self.root = self.start_span(name, parent=False, start=start, **attributes)
+        _register(self)
+
+    def start_span(self, name, parent=None, start=None, **attributes):
+        """Open a span; the parent defaults to the root span"""
+        if parent is False:
+            parent_id = None
+        else:
+            parent_id = (parent or self.root).span_id
+        span = Span(self, name, parent_id, start, attributes)
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def add_span(self, name, start, end, parent=None, error=None, **attributes):
+        """Record a span that has already happened"""
+        span = self.start_span(name, parent=parent, start=start, **attributes)
+        span.finish(end=end, error=error)
+        return span
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """Time a with-block as a span, recording any exception on it"""
+        if parent is None:
+            running_trace, running_span = current()
+            parent = running_span if running_trace is self else None
+        span = self.start_span(name, parent=parent, **attributes)
+        token = _current.set((self, span))
+        try:
+            yield span
+        except BaseException as e:
+            span.finish(error=e)
+            raise
+        finally:
+            _current.reset(token)
+            span.finish()
+
+    def finish(self, error=None):
+        self.root.finish(error=error)
+        export(self)
+
+    @property
+    def error(self):
+        return self.root.error
+
+    def to_dict(self):
+        origin = self.root.start
+        with self._lock:
+            spans = sorted(self.spans, key=lambda span: span.start)
+        return {
+            'trace_id': self.trace_id,
+            'job_id': self.job_id,
+            'name': self.root.name,
+            'started': self.root.start,
+            'duration': round(self.root.duration, 4),
+            'finished': self.root.end is not None,
+            'error': self.root.error,
+            'spans': [span.to_dict(origin) for span in spans],
+        }
+
+    def pending_export(self):
+        """Finished spans that haven't been exported yet (marked as exported)"""
+        with self._lock:
+            spans = [span for span in self.spans if span.end is not None and span.span_id not in self._exported]
+            self._exported.update(span.span_id for span in spans)
+        return spans
+
+
+def _register(trace):
+    with _registry_lock:
+        _traces[trace.trace_id] = trace
+        if trace.job_id:
+            _jobs[trace.job_id] = trace.trace_id
+        while len(_traces) > TRACE_HISTORY:
+            _, old = _traces.popitem(last=False)
+            if old.job_id and _jobs.get(old.job_id) == old.trace_id:
+                del _jobs[old.job_id]
+
+
+def get(trace_or_job_id):
+    """Look up a trace by trace id or job (download) id"""
+    with _registry_lock:
+        trace_id = _jobs.get(trace_or_job_id, trace_or_job_id)
+        return _traces.get(trace_id)
+
+
+def recent(limit=50):
+    with _registry_lock:
+        traces = list(_traces.values())[-limit:]
+    return [{
+        'trace_id': trace.trace_id,
+        'job_id': trace.job_id,
+        'name': trace.root.name,
+        'started': trace.root.start,
+        'duration': round(trace.root.duration, 4),
+        'finished': trace.root.end is not None,
+        'error': trace.root.error,
+    } for trace in reversed(traces)]
+
+
+def current():
+    """The (trace, span) of the running code, or (None, None)"""
+    return _current.get()
+
+
+def current_span():
+    return _current.get()[1]
+
+
+@contextmanager
+def activate(trace, span=None):
+    """Make ``trace`` current for a with-block (e.g. in a job's worker thread)"""
+    token = _current.set((trace, span or trace.root))
+    try:
+        yield trace
+    finally:
+        _current.reset(token)
+
+
+@contextmanager
+def traced(name, **attributes):
+    """Span under the current trace, or the root of a new trace if there is none"""
+    trace, parent = current()
+    if trace is None:
+        trace = Trace(name, **attributes)
+        span = trace.root
+    else:
+        span = trace.start_span(name, parent=parent, **attributes)
+    token = _current.set((trace, span))
+    try:
+        yield span
+    except BaseException as e:
+        span.finish(error=e)
+        raise
+    finally:
+        _current.reset(token)
+        span.finish()
+        if span is trace.root:
+            export(trace)
+
+
+def export(trace):
+    """Append the trace's newly finished spans to TRACE_EXPORT_FILE as OTLP/JSON"""
+    if not TRACE_EXPORT_FILE:
+        return
+    spans = trace.pending_export()
+    if not spans:
+        return
+    request = {
+        'resourceSpans': [{
+            'resource': {'attributes': _otlp_attributes({'service.name': TRACE_SERVICE_NAME})},
+            'scopeSpans': [{
+                'scope': {'name': 'vozila.tracing'},
+                'spans': [span.to_otlp() for span in spans],
+            }],
+        }]
+    }
+    line = json.dumps(request, separators=(',', ':'))
+    try:
+        with _export_lock:
+            with open(TRACE_EXPORT_FILE, 'a', encoding='utf-8') as f:
+                f.write(line + '\n')
+    except OSError as e:
+        print(f"Failed to export trace {trace.trace_id}: {e}")
+
+
+class DownloadStages:
+    """yt-dlp progress and postprocessor hooks that record download/merge spans
+
+    Spans go under ``parent`` (a strategy attempt span). Call extracted() once
+    extraction is done so the wait before each stream starts (format
+    selection plus any sleep_interval) gets its own span.
+    """
+
+    def __init__(self, parent):
+        self.trace = parent.trace
+        self.parent = parent
+        self.streams = {}
+        self.postprocessors = {}
+        self.idle_since = None
+
+    def extracted(self):
+        self.idle_since = time.time()
+
+    def progress_hook(self, d):
+        filename = d.get('filename')
+        span = self.streams.get(filename)
+        if d['status'] == 'downloading':
+            if span is None:
+                now = time.time()
+                if self.idle_since is not None:
+                    self.trace.add_span('download_wait', self.idle_since, now, parent=self.parent)
+                    self.idle_since = None
+                info = d.get('info_dict') or {}
+                self.streams[filename] = self.trace.start_span(
+                    'download', parent=self.parent, start=now,
+                    format_id=info.get('format_id'), filename=os.path.basename(filename or ''))
+        elif span is not None and span.end is None:
+            if d['status'] == 'finished':
+                span.set(bytes=d.get('total_bytes') or d.get('downloaded_bytes'))
+                span.finish()
+                self.idle_since = span.end
+            elif d['status'] == 'error':
+                span.finish(error='Download failed')
+
+    def postprocessor_hook(self, d):
+        name = d.get('postprocessor')
+        if d['status'] == 'started':
+            span_name = 'merge' if name == 'Merger' else 'postprocess'
+            self.postprocessors[name] = self.trace.start_span(span_name, parent=self.parent, postprocessor=name)
+        elif d['status'] == 'finished' and name in self.postprocessors:
+            self.postprocessors.pop(name).finish()
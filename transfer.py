@@ -0,0 +1,129 @@
+"""
+Byte counts, speed and ETA of a download job across its streams
+
+yt-dlp calls progress hooks on every chunk it reads, and a merged download
+is two (or, for playlists, more) streams, each reporting its own
+``downloaded_bytes`` / ``total_bytes``. Those are running totals, so
+TransferStats only looks at a call when PROGRESS_UPDATE_INTERVAL seconds
+have passed, a new stream starts or a stream finishes. Calls in between
+return after one clock read and compare.
+
+Progress is bytes done over the job's total, so a large video stream weighs
+more than its audio stream. The total is the sum of the streams' own sizes.
+For streams that haven't started yet, it falls back to the size /api/info
+estimated for the quality. Without that estimate, unstarted streams count
+as much as the average stream.
+
+Speed is an exponentially weighted moving average. Its time constant is
+PROGRESS_SPEED_WINDOW seconds, so one stalled read doesn't swing the ETA.
+Bytes a stream resumed from (a ``.part`` file or a prefetch) count as done
+but not toward the speed.
+"""
+
+import math
+import os
+import time
+
+PROGRESS_UPDATE_INTERVAL = float(os.getenv('PROGRESS_UPDATE_INTERVAL', 0.5))  # seconds between recomputations
+PROGRESS_SPEED_WINDOW = float(os.getenv('PROGRESS_SPEED_WINDOW', 5.0))        # EWMA time constant, seconds
+
+
+class TransferStats:
+    """Per-stream byte counts of one job, summarized at a bounded rate"""
+
+    def __init__(self, interval=PROGRESS_UPDATE_INTERVAL, window=PROGRESS_SPEED_WINDOW):
+        self.interval = interval
+        self.window = window
+        self.expected_streams = 1
+        self.expected_bytes = None  # estimate for all streams, from /api/info
+        self.streams = {}           # filename -> [downloaded, total or None, finished]
+        self.downloaded_bytes = 0
+        self.total_bytes = None
+        self.fraction = 0.0
+        self.speed = None           # bytes/sec, EWMA
+        self.eta = None             # seconds
+        self._due = 0.0
+        self._sampled_at = None
+        self._sampled_bytes = 0     # bytes fetched (not resumed) at the last sample
+        self._fetched = 0
+        self._current = None        # stream of the last recorded call
+
+    def expect(self, streams=1, total_bytes=None):
+        """Set how many streams the job downloads and, if known, their combined size"""
+        self.expected_streams = max(streams, 1)
+        self.expected_bytes = total_bytes or None
+
+    def record(self, d):
+        """Take one yt-dlp progress hook call; True when the summary was recomputed"""
+        now = time.monotonic()
+        status = d['status']
+        if now < self._due and status == 'downloading' and d.get('filename') == self._current:
+            return False
+        if status not in ('downloading', 'finished'):
+            return False
+        filename = self._current = d.get('filename')
+        downloaded = d.get('downloaded_bytes') or 0
+        stream = self.streams.get(filename)
+        if stream is None:
+            # Whatever a stream starts with was resumed, not fetched now
+            stream = self.streams[filename] = [downloaded, None, False]
+        total = d.get('total_bytes') or d.get('total_bytes_estimate')
+        if status == 'finished':
+            total = total or downloaded or stream[0]
+            downloaded = total
+            stream[2] = True
+        self._fetched += max(downloaded - stream[0], 0)
+        stream[0] = downloaded
+        if total:
+            stream[1] = total
+        self._due = now + self.interval
+        self._summarize(now)
+        return True
+
+    def _summarize(self, now):
+        done = sum(stream[0] for stream in self.streams.values())
+        known = [stream[1] for stream in self.streams.values() if stream[1]]
+        total = None
+        if len(known) == len(self.streams) and known:
+            total = sum(known)
+            missing = self.expected_streams - len(self.streams)
+            if missing > 0:
+                if self.expected_bytes and self.expected_bytes > total:
+                    total = self.expected_bytes
+                else:
+                    total += missing * total / len(known)
+        elif self.expected_bytes:
+            total = self.expected_bytes
+        self.downloaded_bytes = done
+        self.total_bytes = int(total) if total else None
+        if total:
+            self.fraction = min(done / total, 1.0)
+        else:
+            # No sizes at all: count finished streams
+            finished = sum(1 for stream in self.streams.values() if stream[2])
+            self.fraction = min(finished / self.expected_streams, 1.0)
+
+        if self._sampled_at is not None and now > self._sampled_at:
+            elapsed = now - self._sampled_at
+            rate = (self._fetched - self._sampled_bytes) / elapsed
+            weight = 1 - math.exp(-elapsed / self.window)
+            self.speed = rate if self.speed is None else self.speed + weight * (rate - self.speed)
+        self._sampled_at = now
+        self._sampled_bytes = self._fetched
+        if self.speed and self.total_bytes:
+            self.eta = max(self.total_bytes - done, 0) / self.speed
+        else:
+            self.eta = None
+
+    @property
+    def finished(self):
+        """All expected streams have finished"""
+        return sum(1 for stream in self.streams.values() if stream[2]) >= self.expected_streams
+
+    def status(self):
+        return {
+            'downloaded_bytes': self.downloaded_bytes,
+            'total_bytes': self.total_bytes,
+            'speed': round(self.speed) if self.speed else None,
+            'eta': round(self.eta) if self.eta is not None else None,
+        }
@@ -0,0 +1,68 @@
+"""
+Background warm-up and readiness tracking
+
+Expensive start-up work (importing yt-dlp, probing FFmpeg, preparing cache
+directories, starting extraction workers) runs in a background thread after
+the app is created, so the server can answer health checks right away.
+/api/ready reports when every step has finished.
+"""
+
+import os
+import threading
+import time
+
+
+class WarmUp:
+    """Runs named start-up steps in order on a daemon thread"""
+
+    def __init__(self):
+        self.steps = []
+        self.results = {}
+        self.errors = {}
+        self.started_at = None
+        self.completed_at = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def add_step(self, name, func):
+        self.steps.append((name, func))
+
+    def start(self):
+        """Start the warm-up thread once per process"""
+        with self._lock:
+            # A forked worker (gunicorn --preload) inherits our state but not our threads
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self.results = {}
+            self.errors = {}
+            self.started_at = time.time()
+            self.completed_at = None
+            self._thread = threading.Thread(target=self._run, name='warm-up', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        for name, func in self.steps:
+            step_started = time.perf_counter()
+            try:
+                func()
+            except Exception as e:
+                self.errors[name] = str(e)
+                print(f"Warm-up step {name} failed: {e}")
+            self.results[name] = round(time.perf_counter() - step_started, 3)
+        self.completed_at = time.time()
+        print(f"Warm-up completed in {self.completed_at - self.started_at:.2f}s")
+
+    @property
+    def ready(self):
+        return self.completed_at is not None
+
+    def status(self):
+        return {
+            'ready': self.ready,
+            'warmup_seconds': round(self.completed_at - self.started_at, 3) if self.ready else None,
+            'steps': dict(self.results),
+            'pending': [name for name, _ in self.steps if name not in self.results],
+            'errors': dict(self.errors),
+        }
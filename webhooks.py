@@ -0,0 +1,274 @@
+"""
+Signed webhook callbacks for download jobs
+
+/api/download (and /api/batch/download) accept a ``callback_url``. The job
+then POSTs a JSON event to it on each state transition: ``started`` (first
+bytes), ``merging``, and finally ``completed`` or ``error`` once the job has
+finished and its files are registered. Each event is sent at most once per
+job, even when the download falls back to another strategy.
+
+Requests carry ``X-Vozila-Event``, ``X-Vozila-Delivery`` (the same on every
+retry, so receivers can dedupe), ``X-Vozila-Timestamp`` and
+``X-Vozila-Signature: sha256=<hex>``, an HMAC-SHA256 with WEBHOOK_SECRET of
+``"<timestamp>.<body>"``.
+
+Deliveries go through one background thread. Failures (connection errors,
+timeouts, 408/429/5xx) are retried with exponential backoff up to
+WEBHOOK_MAX_ATTEMPTS; a job's events stay in order, so a later event waits
+while an earlier one is being retried. Callback hosts that resolve to
+private, loopback or link-local addresses are refused unless
+WEBHOOK_ALLOW_PRIVATE is set. The host is checked when the job is queued and
+resolved again on every attempt, and the POST goes to the address that was
+just vetted (with the original Host header and TLS server name), so a host
+that re-points its DNS at an internal address after validation gets nowhere.
+"""
+
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import itertools
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from collections import deque
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+import metrics
+
+WEBHOOK_SECRET = os.getenv('WEBHOOK_SECRET', '')
+WEBHOOK_TIMEOUT = float(os.getenv('WEBHOOK_TIMEOUT', 5))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv('WEBHOOK_MAX_ATTEMPTS', 6))
+WEBHOOK_RETRY_BASE = float(os.getenv('WEBHOOK_RETRY_BASE', 2.0))  # seconds; doubles per attempt
+WEBHOOK_ALLOW_PRIVATE = os.getenv('WEBHOOK_ALLOW_PRIVATE', 'false').lower() == 'true'
+
+# DownloadProgress status -> event; terminal events are sent by the job itself
+PROGRESS_EVENTS = {'downloading': 'started', 'merging': 'merging'}
+TERMINAL_EVENTS = ('completed', 'error')
+
+# Statuses worth retrying; any other 4xx means the receiver rejected the event
+RETRY_STATUSES = (408, 429)
+
+WEBHOOK_DELIVERIES = metrics.counter(
+    'vozila_webhook_deliveries_total',
+    'Webhook delivery attempts by event and result (delivered, retried, failed)',
+    ['event', 'result'])
+
+
+class CallbackRefused(requests.RequestException):
+    """The callback host resolved to an address deliveries may not go to"""
+
+
+def resolve_public(hostname, port):
+    """(address, None) for a host whose every address is public, else (None, error message)"""
+    try:
+        addresses = [info[4][0] for info in socket.getaddrinfo(hostname, port)]
+    except (socket.gaierror, UnicodeError):
+        return None, "Callback host could not be resolved"
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%')[0])
+        if not ip.is_global:
+            return None, "Callback URL must point to a public address"
+    return addresses[0], None
+
+
+def validate_callback_url(url):
+    """Error message for an unusable callback URL, or None"""
+    try:
+        parsed = urlparse(url)
+        port = parsed.port  # ValueError when out of range or not a number
+    except ValueError:
+        return "Callback URL must be an http(s) URL"
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return "Callback URL must be an http(s) URL"
+    if WEBHOOK_ALLOW_PRIVATE:
+        return None
+    return resolve_public(parsed.hostname, port or 80)[1]
+
+
+class PinnedAdapter(HTTPAdapter):
+    """Connects to an already resolved address but verifies TLS against the URL's host name"""
+
+    def __init__(self, hostname, **kwargs):
+        self.hostname = hostname
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **pool_kwargs):
+        pool_kwargs.update(server_hostname=self.hostname, assert_hostname=self.hostname)
+        super().init_poolmanager(*args, **pool_kwargs)
+
+
+def pinned_request(url, address):
+    """(url to connect to, Host header, adapter to send it with) for url sent to address"""
+    parsed = urlparse(url)
+    port = parsed.port or (443 if parsed.scheme == 'https' else 80)
+    host = f'[{address}]' if ':' in address else address
+    pinned_url = parsed._replace(netloc=f'{host}:{port}').geturl()
+    host_header = parsed.hostname if parsed.port is None else f'{parsed.hostname}:{parsed.port}'
+    # Plain-HTTP pools take no TLS arguments
+    adapter = PinnedAdapter(parsed.hostname) if parsed.scheme == 'https' else HTTPAdapter()
+    return pinned_url, host_header, adapter
+
+
+def sign(body, timestamp, secret=None):
+    """Signature header value for a request body"""
+    secret = WEBHOOK_SECRET if secret is None else secret
+    digest = hmac.new(secret.encode(), f'{timestamp}.'.encode() + body, hashlib.sha256).hexdigest()
+    return f'sha256={digest}'
+
+
+class Delivery:
+    """One event for one job, retried until delivered or out of attempts"""
+
+    def __init__(self, download_id, callback_url, event, payload):
+        self.download_id = download_id
+        self.callback_url = callback_url
+        self.event = event
+        self.delivery_id = str(uuid.uuid4())
+        self.body = json.dumps({'event': event, 'download_id': download_id, 'timestamp': time.time(), **payload}).encode()
+        self.attempts = 0
+        self.last_error = None
+
+
+class WebhookDispatcher:
+    """Callback URLs per job and the queue that delivers their events"""
+
+    def __init__(self, max_attempts=WEBHOOK_MAX_ATTEMPTS, retry_base=WEBHOOK_RETRY_BASE, timeout=WEBHOOK_TIMEOUT):
+        self.max_attempts = max_attempts
+        self.retry_base = retry_base
+        self.timeout = timeout
+        self.callbacks = {}    # download_id -> callback URL
+        self._sent = {}        # download_id -> events already queued
+        self._pending = {}     # download_id -> deque of Delivery, head in flight
+        self._due = []         # (due, seq, download_id)
+        self._seq = itertools.count()
+        self._condition = threading.Condition()
+        self._thread_pid = None
+        self._session = requests.Session()
+
+    def register(self, download_id, callback_url):
+        if not callback_url:
+            return
+        if not WEBHOOK_SECRET and not self.callbacks:
+            print("Warning: WEBHOOK_SECRET is not set; webhook callbacks are sent unsigned")
+        with self._condition:
+            self.callbacks[download_id] = callback_url
+
+    def callback_for(self, download_id):
+        return self.callbacks.get(download_id)
+
+    def notify(self, download_id, event, payload):
+        """Queue an event for a job's callback; no-op without one or if already sent"""
+        with self._condition:
+            callback_url = self.callbacks.get(download_id)
+            sent = self._sent.setdefault(download_id, set()) if callback_url else None
+            if not callback_url or event in sent:
+                return False
+            sent.add(event)
+            if event in TERMINAL_EVENTS:
+                # Nothing follows a terminal event
+                self.callbacks.pop(download_id, None)
+                self._sent.pop(download_id, None)
+            queue = self._pending.setdefault(download_id, deque())
+            queue.append(Delivery(download_id, callback_url, event, payload))
+            if len(queue) == 1:
+                self._schedule(download_id, time.time())
+            self._ensure_thread()
+        return True
+
+    def _schedule(self, download_id, due):
+        heapq.heappush(self._due, (due, next(self._seq), download_id))
+        self._condition.notify()
+
+    def _ensure_thread(self):
+        # Threads don't survive a fork (gunicorn --preload), so start one per process
+        if self._thread_pid != os.getpid():
+            self._thread_pid = os.getpid()
+            threading.Thread(target=self._work, name='webhook-delivery', daemon=True).start()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                while not self._due or self._due[0][0] > time.time():
+                    self._condition.wait(self._due[0][0] - time.time() if self._due else None)
+                _, _, download_id = heapq.heappop(self._due)
+                delivery = self._pending[download_id][0]
+            done = self._attempt(delivery)
+            with self._condition:
+                queue = self._pending[download_id]
+                if done:
+                    queue.popleft()
+                    if queue:
+                        self._schedule(download_id, time.time())
+                    else:
+                        del self._pending[download_id]
+                else:
+                    self._schedule(download_id, time.time() + self.retry_base * 2 ** (delivery.attempts - 1))
+
+    def _attempt(self, delivery):
+        """Send once; True when the delivery is finished (delivered or given up)"""
+        delivery.attempts += 1
+        timestamp = str(int(time.time()))
+        headers = {
+            'Content-Type': 'application/json',
+            'User-Agent': 'Vozila-Webhook/1.0',
+            'X-Vozila-Event': delivery.event,
+            'X-Vozila-Delivery': delivery.delivery_id,
+            'X-Vozila-Timestamp': timestamp,
+        }
+        if WEBHOOK_SECRET:
+            headers['X-Vozila-Signature'] = sign(delivery.body, timestamp)
+        retry = True
+        try:
+            response = self._post(delivery.callback_url, delivery.body, headers)
+            if 200 <= response.status_code < 300:
+                WEBHOOK_DELIVERIES.inc(event=delivery.event, result='delivered')
+                return True
+            delivery.last_error = f'HTTP {response.status_code}'
+            retry = response.status_code >= 500 or response.status_code in RETRY_STATUSES
+        except requests.RequestException as e:
+            delivery.last_error = str(e)
+            retry = not isinstance(e, CallbackRefused)
+        if retry and delivery.attempts < self.max_attempts:
+            WEBHOOK_DELIVERIES.inc(event=delivery.event, result='retried')
+            return False
+        WEBHOOK_DELIVERIES.inc(event=delivery.event, result='failed')
+        print(f"Webhook {delivery.event} for {delivery.download_id} failed after {delivery.attempts} attempts: "
+              f"{delivery.last_error}")
+        return True
+
+    def _post(self, url, body, headers):
+        if WEBHOOK_ALLOW_PRIVATE:
+            return self._session.post(url, data=body, headers=headers, timeout=self.timeout, allow_redirects=False)
+        # Resolve again and send to the vetted address; the name may point elsewhere by now
+        try:
+            parsed = urlparse(url)
+            port = parsed.port
+        except ValueError:
+            raise CallbackRefused("Callback URL must be an http(s) URL")
+        address, error = resolve_public(parsed.hostname, port or 80)
+        if address is None and error.endswith('public address'):
+            raise CallbackRefused(error)
+        if error:
+            raise requests.ConnectionError(error)
+        pinned_url, headers['Host'], adapter = pinned_request(url, address)
+        with requests.Session() as session:
+            session.mount(pinned_url, adapter)
+            return session.post(pinned_url, data=body, headers=headers, timeout=self.timeout, allow_redirects=False)
+
+    def pending_count(self):
+        with self._condition:
+            return sum(len(queue) for queue in self._pending.values())
+
+
+# Shared dispatcher for the process
+dispatcher = WebhookDispatcher()
+
+metrics.callback('vozila_webhook_pending', 'Webhook events waiting to be delivered',
+                 lambda: [({}, dispatcher.pending_count())])
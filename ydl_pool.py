@@ -0,0 +1,167 @@
+"""
+Pool of pre-built yt-dlp YoutubeDL instances
+
+Building a YoutubeDL re-initializes the extractor registry, HTTP handlers and
+cookie jar, and throws away keep-alive connections and the YouTube extractor's
+cached player JS / signature functions. Instead of one instance per strategy
+attempt, instances are kept per strategy config and leased to one thread at a
+time, with the per-job state (format, output template, hooks) applied on lease
+and reset on return.
+"""
+
+import copy
+import json
+import os
+import threading
+from collections import defaultdict
+from contextlib import contextmanager
+
+import extraction_cache
+
+YDL_POOL_ENABLED = os.getenv('YDL_POOL_ENABLED', 'true').lower() != 'false'
+YDL_POOL_MAX_IDLE = int(os.getenv('YDL_POOL_MAX_IDLE', 2))  # idle instances kept per config
+YDL_POOL_MAX_USES = int(os.getenv('YDL_POOL_MAX_USES', 50))  # jobs before an instance is rebuilt
+
+
+def _fingerprint(params):
+    """Stable key for a params dict so different configs never share instances"""
+    return json.dumps(params, sort_keys=True, default=repr)
+
+
+class PooledYoutubeDL:
+    """A YoutubeDL plus the state needed to reset it between jobs"""
+
+    def __init__(self, params, cookiejar=None):
+        import yt_dlp
+
+        # Every instance shares the managed player-JS / signature cache
+        params = extraction_cache.configure(copy.deepcopy(params))
+        self.ydl = extraction_cache.instrument(yt_dlp.YoutubeDL(params))
+        if cookiejar is not None:
+            # An already parsed in-memory jar (cookie_jar.py) instead of loading a cookiefile;
+            # YoutubeDL.cookiejar is a cached property, read when the first request is sent
+            self.ydl.__dict__['cookiejar'] = cookiejar
+        self.base_params = dict(self.ydl.params)
+        self.base_format_selector = self.ydl.format_selector
+        self.uses = 0
+
+    def prepare(self, format=None, outtmpl=None, progress_hooks=None, postprocessor_hooks=None,
+                download_ranges=None, force_keyframes_at_cuts=False):
+        """Apply per-job settings"""
+        ydl = self.ydl
+        if download_ranges is not None:
+            # Clip jobs (see clips.py); a callable, so kept out of the pool key
+            ydl.params['download_ranges'] = download_ranges
+            ydl.params['force_keyframes_at_cuts'] = force_keyframes_at_cuts
+        if format is not None:
+            ydl.params['format'] = format
+            ydl.format_selector = ydl.build_format_selector(format)
+        if outtmpl is not None:
+            ydl.params['outtmpl'] = {'default': outtmpl}
+            ydl._parse_outtmpl()
+        ydl._progress_hooks = list(progress_hooks or [])
+        ydl._postprocessor_hooks = list(postprocessor_hooks or [])
+        self.uses += 1
+        return ydl
+
+    def reset(self):
+        """Drop everything the last job put on the instance"""
+        ydl = self.ydl
+        ydl.params.clear()
+        ydl.params.update(self.base_params)
+        ydl.format_selector = self.base_format_selector
+        ydl._progress_hooks = []
+        ydl._postprocessor_hooks = []
+        ydl._post_hooks = []
+        ydl._download_retcode = 0
+        ydl._num_downloads = 0
+        ydl._num_videos = 0
+        ydl._playlist_level = 0
+        ydl._playlist_urls.clear()
+        ydl._printed_messages.clear()
+
+    def close(self):
+        try:
+            self.ydl.close()
+        except Exception as e:
+            print(f"Error closing pooled YoutubeDL: {e}")
+
+
+class YoutubeDLPool:
+    """Idle YoutubeDL instances keyed by strategy config"""
+
+    def __init__(self, max_idle=YDL_POOL_MAX_IDLE, max_uses=YDL_POOL_MAX_USES):
+        self.max_idle = max_idle
+        self.max_uses = max_uses
+        self._idle = defaultdict(list)
+        self._lock = threading.Lock()
+        self.created = 0
+        self.reused = 0
+
+    @contextmanager
+    def lease(self, name, params, cookiejar=None, **job):
+        """Borrow a YoutubeDL for one job
+
+        ``params`` is the static strategy config; ``job`` holds the per-job
+        settings (format, outtmpl, progress_hooks, postprocessor_hooks,
+        download_ranges, force_keyframes_at_cuts).
+        Jobs with user cookies (``cookiejar``) get a private instance so
+        their cookies never end up in a pooled one.
+        """
+        if cookiejar is not None or not YDL_POOL_ENABLED:
+            entry = PooledYoutubeDL(params, cookiejar)
+            try:
+                yield entry.prepare(**job)
+            finally:
+                entry.close()
+            return
+
+        key = (name, _fingerprint(params))
+        with self._lock:
+            idle = self._idle[key]
+            entry = idle.pop() if idle else None
+            if entry is None:
+                self.created += 1
+            else:
+                self.reused += 1
+        if entry is None:
+            entry = PooledYoutubeDL(params)
+
+        try:
+            yield entry.prepare(**job)
+        finally:
+            entry.reset()
+            self._release(key, entry)
+
+    def _release(self, key, entry):
+        with self._lock:
+            idle = self._idle[key]
+            if entry.uses < self.max_uses and len(idle) < self.max_idle:
+                idle.append(entry)
+                return
+        entry.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'idle': sum(len(idle) for idle in self._idle.values()),
+                'configs': len(self._idle),
+                'created': self.created,
+                'reused': self.reused,
+            }
+
+    def clear(self):
+        with self._lock:
+            entries = [entry for idle in self._idle.values() for entry in idle]
+            self._idle.clear()
+        for entry in entries:
+            entry.close()
+
+
+# Shared pool for the process
+pool = YoutubeDLPool()
+
+
+def lease(name, params, **job):
+    """Borrow a YoutubeDL from the shared pool"""
+    return pool.lease(name, params, **job)